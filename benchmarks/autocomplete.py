@@ -0,0 +1,76 @@
+"""
+Autocomplete memory and latency benchmark
+=========================================
+
+Builds an :class:`inventory.autocomplete.AutocompleteIndex` over synthetic
+goods names (no database needed), reports its memory footprint, scaled to one
+million names, and measures prefix lookup latency.
+
+Usage::
+
+    python benchmarks/autocomplete.py --names 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.loadtest import percentile
+from benchmarks.search import ADJECTIVES, NOUNS
+from inventory.autocomplete import AutocompleteIndex
+
+
+def synthetic_rows(count, seed_value=0):
+    """Yields ``(goods_id, name, count_in_stock)`` tuples with realistic-looking names."""
+    rng = random.Random(seed_value)
+    for goods_id in range(1, count + 1):
+        name = f"{rng.choice(ADJECTIVES).title()} {rng.choice(NOUNS)} {rng.randint(1, 9999)}"
+        yield goods_id, name, rng.randint(0, 500)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--names", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    rows = list(synthetic_rows(args.names))
+    index = AutocompleteIndex()
+    tracemalloc.start()
+    started = time.perf_counter()
+    index.build(rows)
+    build_seconds = time.perf_counter() - started
+    traced, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # The source rows are freed once built; only the index keeps its strings
+    del rows
+    estimated = index.memory_bytes()
+
+    rng = random.Random(1)
+    latencies = {}
+    for length in (1, 2, 3, 5, 8):
+        samples = []
+        for _ in range(args.queries // 5):
+            word = rng.choice(ADJECTIVES)
+            started = time.perf_counter()
+            index.complete(word[:length], 10)
+            samples.append((time.perf_counter() - started) * 1000.0)
+        latencies[length] = sorted(samples)
+
+    scale = 1000000 / args.names
+    print(f"names: {len(index)}  build: {build_seconds:.2f}s")
+    print(f"memory (tracemalloc during build): {traced / 1e6:.1f} MB, "
+          f"{traced * scale / 1e6:.1f} MB per million names")
+    print(f"memory (index structures): {estimated / 1e6:.1f} MB, "
+          f"{estimated / len(index):.0f} bytes/name, {estimated * scale / 1e6:.1f} MB per million names")
+    for length, samples in latencies.items():
+        print(f"prefix length {length}: p50 {percentile(samples, 50):.3f}ms  "
+              f"p95 {percentile(samples, 95):.3f}ms  p99 {percentile(samples, 99):.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
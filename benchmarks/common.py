@@ -0,0 +1,39 @@
+import os
+import tempfile
+
+from database.db_config import db
+from main import create_app
+
+
+def sqlite_file_uri(name="bench"):
+    """
+    Returns a URI for a fresh file-backed SQLite database in a temp directory.
+
+    A file is used instead of ``:memory:`` so that every worker thread gets its
+    own connection to the same database, as it would against MySQL.
+    """
+    path = os.path.join(tempfile.mkdtemp(prefix=f"{name}_"), f"{name}.db")
+    return f"sqlite:///{path}"
+
+
+def create_bench_app(database_uri=None, name="bench"):
+    """
+    Creates the combined app against a benchmark database and creates all tables.
+
+    Args:
+        database_uri (str, optional): Database to run against. Defaults to a
+            fresh file-backed SQLite database.
+        name (str): Prefix used for the temporary SQLite file.
+
+    Returns:
+        Flask: The app, ready to be used inside ``app.app_context()``.
+    """
+    uri = database_uri or sqlite_file_uri(name)
+    config = {}
+    if uri.startswith("sqlite"):
+        # Writers queue on the database lock instead of failing immediately
+        config["SQLALCHEMY_ENGINE_OPTIONS"] = {"connect_args": {"timeout": 30}}
+    app = create_app(uri, config)
+    with app.app_context():
+        db.create_all()
+    return app
@@ -0,0 +1,153 @@
+"""
+Concurrent purchase stress benchmark
+====================================
+
+Hammers a single hot good with ``SalesService.process_sale`` from many threads
+until its stock runs out, then checks that nothing was oversold and reports
+purchases/sec.
+
+Usage::
+
+    python benchmarks/concurrent_purchase.py --threads 16 --stock 2000
+    python benchmarks/concurrent_purchase.py --database-uri mysql+pymysql://...
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+from benchmarks.common import create_bench_app
+from database.db_config import db
+from customers.models import Customer
+from inventory.models import Goods
+from inventory.services import InventoryService
+from sales.models import Sale
+from sales.services import SalesService
+
+
+def seed(app, threads, stock, price):
+    """Creates one hot good and one well-funded customer per worker thread."""
+    with app.app_context():
+        good = Goods(
+            name=f"hot_good_{time.time_ns()}",
+            category="electronics",
+            price_per_item=price,
+            description="Benchmark good.",
+            count_in_stock=stock
+        )
+        db.session.add(good)
+        customers = []
+        for i in range(threads):
+            customer = Customer(
+                full_name="Bench Customer",
+                username=f"bench_{time.time_ns()}_{i}",
+                password="password",
+                age=30,
+                wallet_balance=price * stock * 2,
+            )
+            db.session.add(customer)
+            customers.append(customer)
+        db.session.commit()
+        return good.id, [c.id for c in customers]
+
+
+def run(app, threads, stock, quantity, price, shards=0):
+    """
+    Runs the stress test and returns a result dict.
+
+    Every worker keeps buying until the guarded stock UPDATE rejects it. With
+    ``shards`` set, the good is put into flash-sale mode first and its shards
+    are folded back before the stock is checked.
+    """
+    good_id, customer_ids = seed(app, threads, stock, price)
+    if shards:
+        with app.app_context():
+            InventoryService.start_flash_sale(good_id, shards)
+    counters = {"purchases": 0, "rejected": 0, "busy": 0}
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(threads)
+
+    def worker(customer_id):
+        with app.app_context():
+            start_barrier.wait()
+            while True:
+                try:
+                    SalesService.process_sale(customer_id, good_id, quantity)
+                except ValueError:
+                    with lock:
+                        counters["rejected"] += 1
+                    break
+                except OperationalError:
+                    # Lock timeout on SQLite; the transaction was rolled back
+                    with lock:
+                        counters["busy"] += 1
+                    continue
+                with lock:
+                    counters["purchases"] += 1
+            db.session.remove()
+
+    workers = [threading.Thread(target=worker, args=(cid,)) for cid in customer_ids]
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        if shards:
+            InventoryService.end_flash_sale(good_id)
+        final_stock = db.session.get(Goods, good_id).count_in_stock
+        sold = db.session.query(func.coalesce(func.sum(Sale.quantity), 0)).filter(
+            Sale.good_id == good_id
+        ).scalar()
+
+    return {
+        "threads": threads,
+        "shards": shards,
+        "initial_stock": stock,
+        "purchases": counters["purchases"],
+        "rejected": counters["rejected"],
+        "lock_retries": counters["busy"],
+        "units_sold": sold,
+        "final_stock": final_stock,
+        "oversold": max(0, sold - stock) + max(0, -final_stock),
+        "consistent": final_stock == stock - sold and final_stock >= 0,
+        "seconds": elapsed,
+        "purchases_per_sec": counters["purchases"] / elapsed if elapsed else 0.0,
+    }
+
+
+def print_result(result):
+    """Prints a result dict as aligned ``key: value`` lines."""
+    for key, value in result.items():
+        print(f"{key:>18}: {value:.2f}" if isinstance(value, float) else f"{key:>18}: {value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--database-uri", help="Defaults to a temporary file-backed SQLite database")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--stock", type=int, default=2000)
+    parser.add_argument("--quantity", type=int, default=1)
+    parser.add_argument("--price", type=float, default=1.0)
+    parser.add_argument("--shards", type=int, default=0, help="Run the good in flash-sale mode with this many shards")
+    args = parser.parse_args()
+
+    app = create_bench_app(args.database_uri, name="concurrent_purchase")
+    result = run(app, args.threads, args.stock, args.quantity, args.price, args.shards)
+
+    print_result(result)
+    if result["oversold"] or not result["consistent"]:
+        print("FAIL: stock was oversold or is inconsistent with recorded sales")
+        sys.exit(1)
+    print("OK: zero oversell")
+
+
+if __name__ == "__main__":
+    main()
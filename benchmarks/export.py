@@ -0,0 +1,79 @@
+"""
+Catalog export memory benchmark
+===============================
+
+Grows a file-backed SQLite catalog step by step and, at each size, measures
+the peak Python memory (tracemalloc) of downloading the catalog through the
+streamed ``GET /inventory/export`` in both formats, and of building the same
+data with ``InventoryService.get_all_goods`` plus one JSON string.
+
+Usage::
+
+    python benchmarks/export.py --sizes 10000 50000 200000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.common import create_bench_app
+from benchmarks.loadtest import quiet
+from benchmarks.search import seed
+from database.db_config import db
+from inventory.services import InventoryService
+
+
+def measure(func):
+    """Runs ``func`` under tracemalloc and returns ``(result, peak MB, seconds)``."""
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak / 1e6, elapsed
+
+
+def stream_export(app, export_format):
+    """Downloads the export chunk by chunk, as a client would, and returns its size in bytes."""
+    response = app.test_client().get(f"/inventory/export?format={export_format}")
+    size = 0
+    for chunk in response.response:
+        size += len(chunk)
+    response.close()
+    return size
+
+
+def list_everything(app):
+    """The pre-export approach: every good as a dict, then one JSON document."""
+    with app.app_context():
+        body = json.dumps(InventoryService.get_all_goods())
+        db.session.remove()
+    return len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000, 200000])
+    args = parser.parse_args()
+
+    app = create_bench_app(name="export")
+    seeded = 0
+    print(f"{'rows':>9} {'ndjson MB':>10} {'csv MB':>8} {'get_all MB':>11}  seconds (ndjson/csv/get_all)")
+    for size in sorted(args.sizes):
+        with quiet():
+            seed(app, size - seeded, seed_value=size)
+        seeded = size
+        results = [measure(lambda: stream_export(app, "ndjson")),
+                   measure(lambda: stream_export(app, "csv")),
+                   measure(lambda: list_everything(app))]
+        print(f"{size:>9} {results[0][1]:>10.1f} {results[1][1]:>8.1f} {results[2][1]:>11.1f}  "
+              + "/".join(f"{seconds:.2f}" for _, _, seconds in results))
+
+
+if __name__ == "__main__":
+    main()
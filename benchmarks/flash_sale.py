@@ -0,0 +1,51 @@
+"""
+Flash-sale contention benchmark
+===============================
+
+Runs the concurrent purchase stress test twice on the same database: once with
+the hot good's stock in the single ``goods.count_in_stock`` row and once with
+it split across stock shards, and compares purchases/sec.
+
+SQLite serialises all writers on one database lock, so the two paths perform
+about the same there; run against MySQL (``--database-uri``) to measure the
+effect of spreading row-lock contention.
+
+Usage::
+
+    python benchmarks/flash_sale.py --threads 32 --stock 5000 --shards 16
+"""
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.common import create_bench_app
+from benchmarks.concurrent_purchase import print_result, run
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--database-uri", help="Defaults to a temporary file-backed SQLite database")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--stock", type=int, default=2000)
+    parser.add_argument("--shards", type=int, default=8)
+    args = parser.parse_args()
+
+    app = create_bench_app(args.database_uri, name="flash_sale")
+    single = run(app, args.threads, args.stock, 1, 1.0)
+    sharded = run(app, args.threads, args.stock, 1, 1.0, shards=args.shards)
+
+    print("== single row ==")
+    print_result(single)
+    print("== sharded ==")
+    print_result(sharded)
+    if single["purchases_per_sec"]:
+        print(f"speedup: {sharded['purchases_per_sec'] / single['purchases_per_sec']:.2f}x")
+    if not (single["consistent"] and sharded["consistent"]) or single["oversold"] or sharded["oversold"]:
+        print("FAIL: stock was oversold or is inconsistent with recorded sales")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+Replay load test
+================
+
+Records requests made to the combined app (:func:`main.create_app`) as JSONL
+and replays them with concurrent workers against an in-process app backed by a
+file SQLite database, then reports latency percentiles and throughput per
+route.
+
+Requests go through Flask's test client, so neither MySQL nor the network is
+needed. Tokens are not stored in the recording: each entry keeps the username
+of the caller and replay mints a fresh token for the same username in the
+replay database. Record and replay seed the same dataset (:func:`seed`), so
+goods IDs and usernames in the recording resolve on replay.
+
+To record real traffic instead of the scripted sessions, call
+:func:`enable_recording` on any app built by :func:`main.create_app`.
+
+Usage::
+
+    python benchmarks/loadtest.py record --output loadtest.jsonl --sessions 200
+    python benchmarks/loadtest.py replay loadtest.jsonl --workers 16 --repeat 3
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import jwt
+from flask import request
+from werkzeug.exceptions import HTTPException
+from benchmarks.common import create_bench_app
+from database.db_config import db
+from customers.models import Customer
+from inventory.models import Goods
+from utils import SECRET_KEY, create_token
+
+
+def seed(app, customers=50, goods=20, stock=1000000, wallet=1000000.0):
+    """
+    Creates a deterministic dataset: ``customers`` shoppers, one admin and ``goods`` goods.
+
+    Run against an empty database so the goods get IDs 1..``goods``.
+    """
+    with app.app_context():
+        db.session.add(Customer(full_name="Load Admin", username="load_admin", password="password",
+                                age=40, wallet_balance=0.0, role="admin"))
+        for i in range(customers):
+            db.session.add(Customer(full_name=f"Load Customer {i}", username=f"load_{i}", password="password",
+                                    age=30, wallet_balance=wallet))
+        for i in range(goods):
+            db.session.add(Goods(name=f"load_good_{i}", category="electronics", price_per_item=1.0 + i % 10,
+                                 description="Load test good.", count_in_stock=stock))
+        db.session.commit()
+
+
+def enable_recording(app, path):
+    """
+    Appends every request the app answers to ``path`` as one JSON line.
+
+    Each entry stores the method, path, query string, JSON body, the caller's
+    username (from a valid token, else None) and the response status.
+    """
+    lock = threading.Lock()
+
+    @app.after_request
+    def record(response):
+        entry = {
+            "method": request.method,
+            "path": request.path,
+            "query": request.query_string.decode("utf-8"),
+            "json": request.get_json(silent=True),
+            "user": _caller_username(),
+            "status": response.status_code,
+        }
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        with lock:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line)
+        return response
+
+    return app
+
+
+def _caller_username():
+    header = request.headers.get("Authorization", "")
+    if not header.startswith("Bearer "):
+        return None
+    try:
+        user_id = jwt.decode(header.split(" ", 1)[1], SECRET_KEY, algorithms=["HS256"]).get("sub")
+    except jwt.InvalidTokenError:
+        return None
+    customer = db.session.get(Customer, int(user_id)) if user_id else None
+    return customer.username if customer else None
+
+
+def record_sessions(app, sessions, customers, goods, seed_value=0):
+    """
+    Drives scripted shopping sessions through the app's test client.
+
+    Each session browses the catalog, logs in, buys, sometimes checks out a
+    cart or reviews a good, and reads its purchase history.
+    """
+    rng = random.Random(seed_value)
+    client = app.test_client()
+    with app.app_context():
+        tokens = {c.username: create_token(c.id) for c in Customer.query.filter(Customer.username.like("load_%"))}
+
+    for _ in range(sessions):
+        username = f"load_{rng.randrange(customers)}"
+        auth = {"Authorization": f"Bearer {tokens[username]}"}
+        good_id = rng.randint(1, goods)
+
+        client.get("/sales/goods")
+        client.get(f"/sales/goods/{good_id}")
+        client.get(f"/inventory/{good_id}")
+        client.get(f"/reviews/product/{good_id}")
+        client.post("/login", json={"username": username, "password": "password"})
+        client.post("/sales/purchase", json={"good_id": good_id, "quantity": rng.randint(1, 3)}, headers=auth)
+        if rng.random() < 0.3:
+            items = [{"good_id": g, "quantity": 1} for g in rng.sample(range(1, goods + 1), min(3, goods))]
+            client.post("/sales/checkout", json={"items": items}, headers=auth)
+        if rng.random() < 0.2:
+            client.post("/reviews/", json={"product_id": good_id, "rating": rng.randint(1, 5),
+                                           "comment": "Load test review."}, headers=auth)
+        client.get(f"/sales/history/{username}?limit=20", headers=auth)
+        client.get(f"/customer/{username}", headers=auth)
+
+
+def load_entries(path):
+    """Reads a recording made by :func:`enable_recording`."""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def route_key(app, entry):
+    """Returns ``"METHOD /rule"`` for an entry, so samples are grouped per route rather than per URL."""
+    adapter = app.url_map.bind("localhost")
+    try:
+        rule, _ = adapter.match(entry["path"], entry["method"], return_rule=True)
+        return f"{entry['method']} {rule.rule}"
+    except HTTPException:
+        return f"{entry['method']} {entry['path']} (unmatched)"
+
+
+def replay(app, entries, workers, repeat=1):
+    """
+    Replays ``entries`` ``repeat`` times with ``workers`` concurrent test clients.
+
+    Returns:
+        tuple: ``(samples, elapsed)`` where samples are ``(route, seconds, status)``.
+    """
+    with app.app_context():
+        usernames = {e["user"] for e in entries if e.get("user")}
+        tokens = {c.username: create_token(c.id)
+                  for c in Customer.query.filter(Customer.username.in_(usernames))} if usernames else {}
+    keys = [route_key(app, e) for e in entries]
+    work = [(keys[i], e) for _ in range(repeat) for i, e in enumerate(entries)]
+
+    samples = []
+    position = [0]
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(workers + 1)
+
+    def worker():
+        client = app.test_client()
+        local = []
+        start_barrier.wait()
+        while True:
+            with lock:
+                if position[0] >= len(work):
+                    break
+                key, entry = work[position[0]]
+                position[0] += 1
+            headers = {}
+            token = tokens.get(entry.get("user"))
+            if token:
+                headers["Authorization"] = f"Bearer {token}"
+            started = time.perf_counter()
+            response = client.open(entry["path"], method=entry["method"], query_string=entry.get("query") or None,
+                                   json=entry.get("json"), headers=headers)
+            local.append((key, time.perf_counter() - started, response.status_code))
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    for t in threads:
+        t.start()
+    start_barrier.wait()
+    started = time.perf_counter()
+    for t in threads:
+        t.join()
+    return samples, time.perf_counter() - started
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(samples, elapsed):
+    """
+    Aggregates samples into one row per route plus a ``TOTAL`` row.
+
+    Latencies are in milliseconds; ``req_per_sec`` is each route's share of
+    the replay's wall-clock throughput.
+    """
+    by_route = {}
+    for key, seconds, status in samples:
+        by_route.setdefault(key, []).append((seconds, status))
+    by_route["TOTAL"] = [(seconds, status) for _, seconds, status in samples]
+
+    rows = []
+    for key in sorted(by_route, key=lambda k: (k == "TOTAL", k)):
+        results = by_route[key]
+        latencies = sorted(seconds * 1000.0 for seconds, _ in results)
+        rows.append({
+            "route": key,
+            "requests": len(results),
+            "errors": sum(1 for _, status in results if status >= 500),
+            "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95),
+            "p99_ms": percentile(latencies, 99),
+            "req_per_sec": len(results) / elapsed if elapsed else 0.0,
+        })
+    return rows
+
+
+def print_report(rows):
+    """Prints the summary rows as a table."""
+    width = max(len(row["route"]) for row in rows)
+    print(f"{'route':<{width}} {'requests':>8} {'errors':>6} {'p50_ms':>8} {'p95_ms':>8} {'p99_ms':>8} {'req/s':>9}")
+    for row in rows:
+        print(f"{row['route']:<{width}} {row['requests']:>8} {row['errors']:>6} {row['p50_ms']:>8.2f} "
+              f"{row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f} {row['req_per_sec']:>9.1f}")
+
+
+@contextlib.contextmanager
+def quiet(enabled=True):
+    """Silences the services' debug prints, which would otherwise dominate the timings."""
+    if not enabled:
+        yield
+        return
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--database-uri", help="Defaults to a temporary file-backed SQLite database")
+    parser.add_argument("--customers", type=int, default=50)
+    parser.add_argument("--goods", type=int, default=20)
+    parser.add_argument("--verbose", action="store_true", help="Keep the app's debug output")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = commands.add_parser("record", help="Record scripted shopping sessions to JSONL")
+    record_parser.add_argument("--output", default="loadtest.jsonl")
+    record_parser.add_argument("--sessions", type=int, default=200)
+    record_parser.add_argument("--seed", type=int, default=0)
+
+    replay_parser = commands.add_parser("replay", help="Replay a recording with concurrent workers")
+    replay_parser.add_argument("recording")
+    replay_parser.add_argument("--workers", type=int, default=8)
+    replay_parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    app = create_bench_app(args.database_uri, name="loadtest")
+    seed(app, args.customers, args.goods)
+
+    if args.command == "record":
+        if os.path.exists(args.output):
+            os.remove(args.output)
+        enable_recording(app, args.output)
+        with quiet(not args.verbose):
+            record_sessions(app, args.sessions, args.customers, args.goods, args.seed)
+        print(f"Recorded {len(load_entries(args.output))} requests to {args.output}")
+        return
+
+    entries = load_entries(args.recording)
+    with quiet(not args.verbose):
+        samples, elapsed = replay(app, entries, args.workers, args.repeat)
+    print(f"Replayed {len(samples)} requests with {args.workers} workers in {elapsed:.2f}s")
+    print_report(summarize(samples, elapsed))
+
+
+if __name__ == "__main__":
+    main()
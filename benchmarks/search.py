@@ -0,0 +1,105 @@
+"""
+Goods search benchmark
+======================
+
+Fills a file-backed SQLite catalog with synthetic goods and measures search
+latency through :meth:`inventory.services.InventoryService.search_goods` on
+the FTS5 backend and on the in-process fallback index.
+
+Usage::
+
+    python benchmarks/search.py --goods 1000000 --queries 500
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import insert
+from benchmarks.common import create_bench_app
+from benchmarks.loadtest import percentile, quiet
+from database.db_config import db
+from inventory.models import Goods
+from inventory.search import InMemorySearch, Fts5Search
+from inventory.services import InventoryService
+
+ADJECTIVES = ["red", "blue", "steel", "wooden", "compact", "deluxe", "solar", "wireless", "organic", "vintage",
+              "portable", "smart", "classic", "mini", "heavy", "silent", "bright", "rugged", "soft", "digital"]
+NOUNS = ["lamp", "chair", "kettle", "speaker", "jacket", "backpack", "charger", "blender", "desk", "camera",
+         "watch", "bottle", "scarf", "monitor", "tent", "drill", "mug", "pillow", "router", "keyboard"]
+CATEGORIES = ["electronics", "furniture", "clothes", "food", "outdoors", "kitchen", "tools", "office"]
+
+
+def seed(app, goods, seed_value=0, batch_size=20000):
+    """Bulk-inserts ``goods`` synthetic goods; the FTS triggers index them as they land."""
+    rng = random.Random(seed_value)
+    with app.app_context():
+        for start in range(0, goods, batch_size):
+            rows = []
+            for i in range(start, min(start + batch_size, goods)):
+                noun = rng.choice(NOUNS)
+                rows.append({
+                    "name": f"{rng.choice(ADJECTIVES)} {noun} {i}",
+                    "category": rng.choice(CATEGORIES),
+                    "price_per_item": round(rng.uniform(1, 500), 2),
+                    "description": " ".join(rng.choice(ADJECTIVES + NOUNS) for _ in range(12)),
+                    "count_in_stock": rng.randint(0, 100),
+                })
+            db.session.execute(insert(Goods), rows)
+            db.session.commit()
+
+
+def measure(app, backend, queries, limit, seed_value=0):
+    """Runs ``queries`` random one- and two-word searches and returns latency percentiles in ms."""
+    rng = random.Random(seed_value)
+    terms = [f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}" if rng.random() < 0.5 else rng.choice(NOUNS)
+             for _ in range(queries)]
+    with app.app_context():
+        app.extensions["goods_search"] = backend
+        started = time.perf_counter()
+        if isinstance(backend, InMemorySearch):
+            backend.build()
+        build_seconds = time.perf_counter() - started
+
+        latencies = []
+        for term in terms:
+            started = time.perf_counter()
+            InventoryService.search_goods(term, limit)
+            latencies.append((time.perf_counter() - started) * 1000.0)
+    latencies.sort()
+    return {
+        "backend": backend.name,
+        "build_s": build_seconds,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--goods", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--skip-memory", action="store_true", help="Only measure the FTS5 backend")
+    args = parser.parse_args()
+
+    app = create_bench_app(name="search")
+    started = time.perf_counter()
+    with quiet():
+        seed(app, args.goods)
+    print(f"Seeded {args.goods} goods in {time.perf_counter() - started:.1f}s")
+
+    backends = [Fts5Search()] + ([] if args.skip_memory else [InMemorySearch()])
+    for backend in backends:
+        with quiet():
+            result = measure(app, backend, args.queries, args.limit)
+        print(f"{result['backend']:>8}: build {result['build_s']:.1f}s  p50 {result['p50_ms']:.2f}ms  "
+              f"p95 {result['p95_ms']:.2f}ms  p99 {result['p99_ms']:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
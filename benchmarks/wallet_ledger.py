@@ -0,0 +1,133 @@
+"""
+Wallet ledger benchmark
+=======================
+
+Compares in-place wallet updates with the append-only wallet ledger
+(:mod:`customers.ledger`) on a file-backed SQLite database:
+
+1. Charge/deduct throughput through :class:`customers.services.CustomerService`
+   with ``WALLET_LEDGER`` off (UPDATE of ``customers``) and on (ledger append).
+2. Balance read latency against a ledger pre-filled with ``--entries`` rows
+   spread over ``--customers`` wallets, before and after compaction.
+3. Compaction time for that ledger.
+
+Usage::
+
+    python benchmarks/wallet_ledger.py --entries 10000000 --customers 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import insert
+from benchmarks.common import create_bench_app
+from benchmarks.loadtest import percentile, quiet
+from customers.ledger import compact_wallet_ledger, wallet_balance
+from customers.models import Customer, WalletLedgerEntry, WalletSnapshot
+from customers.services import CustomerService
+from database.db_config import db
+
+
+def seed(app, customers, entries, batch_size=50000, seed_value=0):
+    """Creates the customers, their snapshots and ``entries`` random ledger entries."""
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+    with app.app_context():
+        for start in range(0, customers, batch_size):
+            ids = range(start + 1, min(start + batch_size, customers) + 1)
+            db.session.execute(insert(Customer), [
+                {"id": i, "full_name": f"Customer {i}", "username": f"customer_{i}", "password": "password",
+                 "age": 30, "wallet_balance": 1000.0, "role": "customer"} for i in ids
+            ])
+            db.session.execute(insert(WalletSnapshot), [
+                {"customer_id": i, "balance": 1000.0, "last_entry_id": 0, "updated_at": now} for i in ids
+            ])
+            db.session.commit()
+        for start in range(0, entries, batch_size):
+            db.session.execute(insert(WalletLedgerEntry), [
+                {"customer_id": rng.randint(1, customers), "amount": rng.choice((5.0, -1.0)),
+                 "reason": "charge", "created_at": now}
+                for _ in range(min(batch_size, entries - start))
+            ])
+            db.session.commit()
+
+
+def measure_writes(app, customers, operations, ledger, seed_value=1):
+    """Returns wallet operations per second through CustomerService."""
+    rng = random.Random(seed_value)
+    app.config["WALLET_LEDGER"] = ledger
+    with app.app_context():
+        started = time.perf_counter()
+        for _ in range(operations):
+            username = f"customer_{rng.randint(1, customers)}"
+            if rng.random() < 0.5:
+                CustomerService.charge_wallet(username, 5.0)
+            else:
+                try:
+                    CustomerService.deduct_wallet(username, 1.0)
+                except ValueError:
+                    pass
+        elapsed = time.perf_counter() - started
+        db.session.remove()
+    return operations / elapsed
+
+
+def measure_reads(app, customers, reads, seed_value=2):
+    """Returns balance read latency percentiles in ms."""
+    rng = random.Random(seed_value)
+    app.config["WALLET_LEDGER"] = True
+    samples = []
+    with app.app_context():
+        for _ in range(reads):
+            customer_id = rng.randint(1, customers)
+            started = time.perf_counter()
+            wallet_balance(customer_id)
+            samples.append((time.perf_counter() - started) * 1000.0)
+        db.session.remove()
+    samples.sort()
+    return percentile(samples, 50), percentile(samples, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--entries", type=int, default=10000000)
+    parser.add_argument("--customers", type=int, default=100000)
+    parser.add_argument("--operations", type=int, default=5000)
+    parser.add_argument("--reads", type=int, default=2000)
+    args = parser.parse_args()
+
+    app = create_bench_app(name="wallet_ledger")
+    started = time.perf_counter()
+    with quiet():
+        seed(app, args.customers, args.entries)
+    print(f"Seeded {args.entries} ledger entries over {args.customers} customers "
+          f"in {time.perf_counter() - started:.1f}s")
+
+    # In-place writes move the column away from the snapshots; only the timings matter here
+    with quiet():
+        in_place = measure_writes(app, args.customers, args.operations, ledger=False)
+        appended = measure_writes(app, args.customers, args.operations, ledger=True)
+    print(f"writes: in-place {in_place:.0f} ops/s, ledger {appended:.0f} ops/s")
+
+    p50, p99 = measure_reads(app, args.customers, args.reads)
+    print(f"balance read, ~{args.entries // args.customers} entry tails: p50 {p50:.3f}ms  p99 {p99:.3f}ms")
+
+    with app.app_context():
+        app.config["WALLET_LEDGER"] = True
+        started = time.perf_counter()
+        report = compact_wallet_ledger(chunk_size=2000)
+        print(f"compaction: {report['entries']} entries for {report['customers']} customers "
+              f"in {time.perf_counter() - started:.1f}s")
+        db.session.remove()
+
+    p50, p99 = measure_reads(app, args.customers, args.reads)
+    print(f"balance read after compaction: p50 {p50:.3f}ms  p99 {p99:.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Request Authentication
+======================
+
+Verifies the bearer token once per request and keeps the caller in
+``flask.g.principal`` for the route handlers. Every blueprint registers
+:func:`load_principal` as a ``before_request`` hook.
+
+Tokens issued by :meth:`customers.services.CustomerService.login_customer`
+carry signed ``username`` and ``role`` claims, so authorizing a request needs
+no database query. Older tokens carry only ``sub``; their customer is looked
+up once per request instead, until they expire.
+
+Claims go stale when a customer's role or password changes or the customer is
+deleted. :func:`revoke_tokens` records that in the ``token_revocations`` table
+and tokens issued before it are refused. Requests check the table through a
+per-app :class:`RevocationList`, refreshed every ``TOKEN_REVOCATION_CACHE_TTL``
+seconds (default 30), so other processes refuse a revoked token within that
+long; the process that revoked it does so at once.
+"""
+import threading
+import time
+import jwt
+from flask import current_app, g, request
+from sqlalchemy import select
+from database.db_config import db
+from database.upsert import upsert_statement
+from customers.models import Customer, TokenRevocation
+from utils import TOKEN_LIFETIME, decode_token_claims
+
+MISSING_TOKEN_ERROR = "Authorization header missing or malformed"
+
+
+class Principal:
+    """
+    The verified caller of a request.
+
+    Attributes:
+        user_id (str): The customer ID, as in the token's ``sub``.
+        username (str): The customer's username.
+        role (str): The customer's role, e.g. ``admin``.
+    """
+
+    __slots__ = ("user_id", "username", "role")
+
+    def __init__(self, user_id, username, role):
+        self.user_id = user_id
+        self.username = username
+        self.role = role
+
+    @property
+    def is_admin(self):
+        return self.role == "admin"
+
+    def __repr__(self):
+        return f"<Principal {self.user_id} {self.username} {self.role}>"
+
+
+class RevocationList:
+    """
+    Cached copy of the ``token_revocations`` rows young enough to matter.
+
+    Args:
+        ttl (float): Seconds before the next check reloads the rows.
+    """
+
+    def __init__(self, ttl=30.0):
+        self.ttl = ttl
+        self._revoked = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def is_revoked(self, customer_id, issued_at):
+        """
+        Returns True if a token for ``customer_id`` issued at ``issued_at`` was revoked.
+        """
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl:
+            self.refresh()
+        revoked_at = self._revoked.get(str(customer_id))
+        return revoked_at is not None and (issued_at is None or issued_at < revoked_at)
+
+    def refresh(self):
+        """
+        Reloads the revocations; older ones than a token's lifetime can no longer match.
+        """
+        cutoff = time.time() - TOKEN_LIFETIME.total_seconds()
+        rows = db.session.execute(
+            select(TokenRevocation.customer_id, TokenRevocation.revoked_at)
+            .where(TokenRevocation.revoked_at > cutoff)
+        ).all()
+        with self._lock:
+            self._revoked = {str(row.customer_id): row.revoked_at for row in rows}
+            self._loaded_at = time.monotonic()
+
+    def add(self, customer_id, revoked_at):
+        """
+        Records a revocation made by this process without waiting for a refresh.
+        """
+        with self._lock:
+            key = str(customer_id)
+            self._revoked[key] = max(revoked_at, self._revoked.get(key, revoked_at))
+
+
+def get_revocation_list():
+    """
+    Returns the current app's revocation list, creating it on first use.
+    """
+    revocations = current_app.extensions.get("token_revocations")
+    if revocations is None:
+        revocations = RevocationList(current_app.config.get("TOKEN_REVOCATION_CACHE_TTL", 30))
+        current_app.extensions["token_revocations"] = revocations
+    return revocations
+
+
+def load_principal():
+    """
+    Verifies the request's bearer token and sets ``g.principal``.
+
+    ``g.principal`` is None when there is no valid token, and ``g.auth_error``
+    then says why.
+    """
+    g.principal = None
+    g.auth_error = MISSING_TOKEN_ERROR
+    header = request.headers.get("Authorization")
+    if not header:
+        return
+
+    try:
+        claims = decode_token_claims(header)
+    except jwt.ExpiredSignatureError:
+        g.auth_error = "Token has expired"
+        return
+    except jwt.InvalidTokenError:
+        g.auth_error = "Unauthorized"
+        return
+
+    user_id = str(claims["sub"])
+    if get_revocation_list().is_revoked(user_id, claims.get("iat")):
+        g.auth_error = "Token has been revoked"
+        return
+
+    username, role = claims.get("username"), claims.get("role")
+    if username is None or role is None:
+        # Issued before tokens carried claims
+        customer = db.session.execute(
+            select(Customer.username, Customer.role).where(Customer.id == user_id)
+        ).first()
+        if customer is None:
+            g.auth_error = "Unauthorized"
+            return
+        username, role = customer.username, customer.role
+    g.principal = Principal(user_id, username, role)
+
+
+def current_principal():
+    """
+    Returns the request's :class:`Principal`, or None if it is not authenticated.
+
+    Loads it first when the request did not go through a blueprint hook.
+    """
+    if "principal" not in g:
+        load_principal()
+    return g.principal
+
+
+def revoke_tokens(customer_id):
+    """
+    Refuses every token issued to a customer until now, in the current transaction.
+    """
+    revoked_at = time.time()
+    table = TokenRevocation.__table__
+    db.session.execute(
+        upsert_statement(table, ["customer_id"], lambda proposed: {"revoked_at": proposed.revoked_at}),
+        [{"customer_id": customer_id, "revoked_at": revoked_at}]
+    )
+    get_revocation_list().add(customer_id, revoked_at)
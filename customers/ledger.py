@@ -0,0 +1,373 @@
+"""
+Wallet Ledger
+=============
+
+Append-only wallet accounting, enabled with the ``WALLET_LEDGER`` config.
+
+Without it, wallet changes update ``customers.wallet_balance`` in place
+(:meth:`customers.models.Customer.adjust_wallet`). With it, every charge,
+deduction and sale appends a signed :class:`customers.models.WalletLedgerEntry`
+instead, and the customer row is left alone, so wallet traffic no longer
+contends with profile updates and every change is kept.
+
+A customer's balance is their :class:`customers.models.WalletSnapshot` plus
+the entries after it, read as one range of the ``(customer_id, id)`` index.
+The snapshot is created on the customer's first ledger write from the
+current ``wallet_balance``. :func:`compact_wallet_ledger` folds each tail into
+its snapshot so tails stay short, and writes the folded balance back to
+``customers.wallet_balance`` so readers of the column lag by at most one
+compaction. Run it periodically with :func:`init_wallet_compactor` or
+``flask customers compact-wallet-ledger``.
+
+To switch back to in-place updates, compact first and then delete the
+``wallet_snapshots`` rows, so a later switch to the ledger starts again from
+the column.
+"""
+import atexit
+import threading
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import case, func, insert, select, update
+from database.db_config import db
+from database.upsert import upsert_statement
+from customers.models import Customer, WalletLedgerEntry, WalletSnapshot
+
+DEFAULT_COMPACTION_CHUNK_SIZE = 500
+
+
+def ledger_enabled():
+    """
+    Returns whether the current app keeps wallets in the ledger.
+    """
+    return bool(current_app.config.get("WALLET_LEDGER"))
+
+
+def adjust_balance(condition, amount, reason):
+    """
+    Adds ``amount`` to one customer's wallet in the current transaction.
+
+    In ledger mode the customer's snapshot row is locked, the balance is
+    computed from it and the tail, and a deduction the balance does not
+    cover is refused before anything is written. Otherwise this is
+    :meth:`customers.models.Customer.adjust_wallet`.
+
+    Args:
+        condition: Selects the customer, e.g. ``Customer.username == username``.
+        amount (float): The amount to add; negative to deduct.
+        reason (str): Recorded on the ledger entry: ``charge``, ``deduct`` or ``sale``.
+
+    Returns:
+        float or None: The new balance, or None if no customer matched or
+        the balance does not cover the deduction.
+    """
+    if not ledger_enabled():
+        return Customer.adjust_wallet(condition, amount)
+
+    customer = db.session.execute(select(Customer.id, Customer.wallet_balance).where(condition)).first()
+    if customer is None:
+        return None
+    snapshot = _lock_snapshot(customer.id, customer.wallet_balance)
+    balance = snapshot.balance + _tail_sum(customer.id, snapshot.last_entry_id)
+    if amount < 0 and balance < -amount:
+        return None
+    db.session.execute(insert(WalletLedgerEntry).values(
+        customer_id=customer.id, amount=amount, reason=reason, created_at=datetime.utcnow()
+    ))
+    return balance + amount
+
+
+def credit_wallets(amounts, reason="charge"):
+    """
+    Adds non-negative amounts to many wallets in the current transaction.
+
+    In place, this is one ``UPDATE ... CASE`` over the customers. In ledger
+    mode the customers' snapshot rows are created where missing and locked,
+    so a compaction cannot skip the new entries, and the entries are
+    inserted with one executemany.
+
+    Args:
+        amounts (dict): Amount to add per customer ID. The customers must exist.
+        reason (str): Recorded on the ledger entries.
+    """
+    if not amounts:
+        return
+    customer_ids = sorted(amounts)
+    if not ledger_enabled():
+        db.session.execute(
+            update(Customer)
+            .where(Customer.id.in_(customer_ids))
+            .values(wallet_balance=Customer.wallet_balance + case(amounts, value=Customer.id))
+            .execution_options(synchronize_session=False)
+        )
+        return
+
+    query = (
+        select(WalletSnapshot.customer_id)
+        .where(WalletSnapshot.customer_id.in_(customer_ids))
+        .order_by(WalletSnapshot.customer_id)
+        .with_for_update()
+    )
+    missing = set(customer_ids) - set(db.session.execute(query).scalars())
+    if missing:
+        table = WalletSnapshot.__table__
+        now = datetime.utcnow()
+        db.session.execute(
+            upsert_statement(table, ["customer_id"], lambda proposed: {"balance": table.c.balance}),
+            [{"customer_id": row.id, "balance": row.wallet_balance or 0.0, "last_entry_id": 0, "updated_at": now}
+             for row in db.session.execute(
+                 select(Customer.id, Customer.wallet_balance).where(Customer.id.in_(sorted(missing)))
+             )]
+        )
+        db.session.execute(query).all()
+    now = datetime.utcnow()
+    db.session.execute(insert(WalletLedgerEntry), [
+        {"customer_id": customer_id, "amount": amounts[customer_id], "reason": reason, "created_at": now}
+        for customer_id in customer_ids
+    ])
+
+
+def set_balance(condition, balance, reason="set"):
+    """
+    Sets one customer's wallet to ``balance`` in the current transaction.
+
+    In ledger mode the difference from the current balance is appended as an
+    entry while the snapshot row is locked, so the new balance is not
+    overwritten by the next compaction. Otherwise the column is updated.
+
+    Args:
+        condition: Selects the customer, e.g. ``Customer.username == username``.
+        balance (float): The new balance.
+        reason (str): Recorded on the ledger entry.
+
+    Returns:
+        float or None: The new balance, or None if no customer matched.
+    """
+    if not ledger_enabled():
+        result = db.session.execute(
+            update(Customer).where(condition).values(wallet_balance=balance)
+            .execution_options(synchronize_session=False)
+        )
+        return balance if result.rowcount else None
+
+    customer = db.session.execute(select(Customer.id, Customer.wallet_balance).where(condition)).first()
+    if customer is None:
+        return None
+    snapshot = _lock_snapshot(customer.id, customer.wallet_balance)
+    current = snapshot.balance + _tail_sum(customer.id, snapshot.last_entry_id)
+    if balance != current:
+        db.session.execute(insert(WalletLedgerEntry).values(
+            customer_id=customer.id, amount=balance - current, reason=reason, created_at=datetime.utcnow()
+        ))
+    return balance
+
+
+def wallet_balance(customer_id):
+    """
+    Returns a customer's current balance, or None if the customer does not exist.
+
+    In ledger mode this is the snapshot (or, before the first ledger write,
+    ``wallet_balance``) plus the tail, in one query.
+    """
+    if not ledger_enabled():
+        return db.session.execute(select(Customer.wallet_balance).where(Customer.id == customer_id)).scalar()
+    return db.session.execute(_balance_query().where(Customer.id == customer_id)).scalar()
+
+
+def wallet_balances(customer_ids):
+    """
+    Returns the current balances of many customers, in one query.
+
+    Returns:
+        dict: Balance per customer ID; missing customers are left out.
+    """
+    if not customer_ids:
+        return {}
+    if not ledger_enabled():
+        query = select(Customer.id, Customer.wallet_balance.label("balance"))
+    else:
+        query = _balance_query().add_columns(Customer.id)
+    return {
+        row.id: row.balance
+        for row in db.session.execute(query.where(Customer.id.in_(list(customer_ids))))
+    }
+
+
+def compact_wallet_ledger(min_entries=1, chunk_size=DEFAULT_COMPACTION_CHUNK_SIZE):
+    """
+    Folds ledger tails into their snapshots.
+
+    Customers are compacted ``chunk_size`` at a time, one transaction each:
+    their snapshot rows are locked (so no entry for them is being written),
+    their tails summed in one grouped query, and the snapshots and
+    ``customers.wallet_balance`` updated with one ``UPDATE ... CASE`` each.
+    Ledger entries are kept.
+
+    Args:
+        min_entries (int): Skip customers with a shorter tail.
+        chunk_size (int): Customers per transaction.
+
+    Returns:
+        dict: The number of customers compacted and entries folded.
+    """
+    tail_length = func.count(WalletLedgerEntry.id)
+    customer_ids = db.session.execute(
+        select(WalletLedgerEntry.customer_id)
+        .join(WalletSnapshot, WalletSnapshot.customer_id == WalletLedgerEntry.customer_id)
+        .where(WalletLedgerEntry.id > WalletSnapshot.last_entry_id)
+        .group_by(WalletLedgerEntry.customer_id)
+        .having(tail_length >= min_entries)
+        .order_by(WalletLedgerEntry.customer_id)
+    ).scalars().all()
+    db.session.rollback()
+
+    report = {"customers": 0, "entries": 0}
+    for start in range(0, len(customer_ids), chunk_size):
+        chunk = customer_ids[start:start + chunk_size]
+        try:
+            snapshots = {
+                row.customer_id: row for row in db.session.execute(
+                    select(WalletSnapshot.customer_id, WalletSnapshot.balance)
+                    .where(WalletSnapshot.customer_id.in_(chunk))
+                    .order_by(WalletSnapshot.customer_id)
+                    .with_for_update()
+                )
+            }
+            tails = db.session.execute(
+                select(WalletLedgerEntry.customer_id, func.sum(WalletLedgerEntry.amount).label("amount"),
+                       func.max(WalletLedgerEntry.id).label("last_id"), tail_length.label("entries"))
+                .join(WalletSnapshot, WalletSnapshot.customer_id == WalletLedgerEntry.customer_id)
+                .where(WalletLedgerEntry.customer_id.in_(chunk),
+                       WalletLedgerEntry.id > WalletSnapshot.last_entry_id)
+                .group_by(WalletLedgerEntry.customer_id)
+            ).all()
+            if not tails:
+                db.session.rollback()
+                continue
+
+            balances = {tail.customer_id: snapshots[tail.customer_id].balance + tail.amount for tail in tails}
+            last_ids = {tail.customer_id: tail.last_id for tail in tails}
+            db.session.execute(
+                update(WalletSnapshot)
+                .where(WalletSnapshot.customer_id.in_(list(balances)))
+                .values(balance=case(balances, value=WalletSnapshot.customer_id),
+                        last_entry_id=case(last_ids, value=WalletSnapshot.customer_id),
+                        updated_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+            db.session.execute(
+                update(Customer)
+                .where(Customer.id.in_(list(balances)))
+                .values(wallet_balance=case(balances, value=Customer.id))
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        report["customers"] += len(tails)
+        report["entries"] += sum(tail.entries for tail in tails)
+    return report
+
+
+def _lock_snapshot(customer_id, wallet_balance):
+    """
+    Locks a customer's snapshot row, creating it from ``wallet_balance`` first if needed.
+    """
+    query = (
+        select(WalletSnapshot.balance, WalletSnapshot.last_entry_id)
+        .where(WalletSnapshot.customer_id == customer_id)
+        .with_for_update()
+    )
+    snapshot = db.session.execute(query).first()
+    if snapshot is None:
+        table = WalletSnapshot.__table__
+        # A concurrent first write may create it too; keep whichever landed first
+        db.session.execute(
+            upsert_statement(table, ["customer_id"], lambda proposed: {"balance": table.c.balance}),
+            [{"customer_id": customer_id, "balance": wallet_balance or 0.0, "last_entry_id": 0,
+              "updated_at": datetime.utcnow()}]
+        )
+        snapshot = db.session.execute(query).first()
+    return snapshot
+
+
+def _balance_query():
+    tail = (
+        select(func.coalesce(func.sum(WalletLedgerEntry.amount), 0.0))
+        .where(WalletLedgerEntry.customer_id == Customer.id,
+               WalletLedgerEntry.id > func.coalesce(WalletSnapshot.last_entry_id, 0))
+        .scalar_subquery()
+    )
+    return (
+        select((func.coalesce(WalletSnapshot.balance, Customer.wallet_balance, 0.0) + tail).label("balance"))
+        .select_from(Customer)
+        .outerjoin(WalletSnapshot, WalletSnapshot.customer_id == Customer.id)
+    )
+
+
+def _tail_sum(customer_id, last_entry_id):
+    return db.session.execute(
+        select(func.coalesce(func.sum(WalletLedgerEntry.amount), 0.0))
+        .where(WalletLedgerEntry.customer_id == customer_id, WalletLedgerEntry.id > last_entry_id)
+    ).scalar()
+
+
+class WalletCompactor:
+    """
+    Background thread that compacts the wallet ledger periodically.
+
+    Args:
+        app (Flask): The app whose ledger is compacted.
+        interval (float): Seconds between compactions.
+        min_entries (int): Skip customers with a shorter tail.
+    """
+
+    def __init__(self, app, interval=300.0, min_entries=1):
+        self.app = app
+        self.interval = interval
+        self.min_entries = min_entries
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Starts the compactor thread.
+        """
+        self._thread = threading.Thread(target=self._run, name="wallet-ledger-compactor", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stops the compactor thread. Safe to call more than once.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    compact_wallet_ledger(self.min_entries)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Error compacting wallet ledger: {e}")
+                finally:
+                    db.session.remove()
+
+
+def init_wallet_compactor(app, interval=300.0, **options):
+    """
+    Starts a wallet ledger compactor for an app.
+
+    The compactor is stored in ``app.extensions['wallet_compactor']`` and
+    stopped at interpreter exit.
+
+    Returns:
+        WalletCompactor: The running compactor.
+    """
+    compactor = WalletCompactor(app, interval, **options)
+    compactor.start()
+    app.extensions["wallet_compactor"] = compactor
+    atexit.register(compactor.stop)
+    return compactor
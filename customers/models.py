@@ -1,5 +1,7 @@
+from datetime import datetime
 from database.db_config import db
-from sqlalchemy.sql import text  
+from sqlalchemy import select, update
+from utils import load_only_fields
 
 
 class Customer(db.Model):
@@ -31,41 +33,141 @@ class Customer(db.Model):
     role = db.Column(db.String(20), default="customer", nullable=False)  # New field
 
 
+    @staticmethod
+    def adjust_wallet(condition, amount):
+        """
+        Adds ``amount`` to one customer's wallet in the current transaction.
+
+        The change is a single UPDATE; a deduction (negative ``amount``) only
+        matches if the balance covers it, so the check and the write cannot
+        race. Where the dialect supports ``UPDATE ... RETURNING`` (SQLite,
+        PostgreSQL) the new balance comes back from the same statement;
+        elsewhere (MySQL) it is read back in the same transaction.
+
+        Args:
+            condition: Selects the customer, e.g. ``Customer.username == username``.
+            amount (float): The amount to add; negative to deduct.
+
+        Returns:
+            float or None: The new balance, or None if no customer matched or
+            the balance does not cover the deduction.
+        """
+        stmt = update(Customer).where(condition)
+        if amount < 0:
+            stmt = stmt.where(Customer.wallet_balance >= -amount)
+        stmt = stmt.values(wallet_balance=Customer.wallet_balance + amount)
+
+        if db.session.get_bind().dialect.update_returning:
+            return db.session.execute(stmt.returning(Customer.wallet_balance)).scalar()
+        if db.session.execute(stmt).rowcount != 1:
+            return None
+        return db.session.execute(select(Customer.wallet_balance).where(condition)).scalar()
+
     @staticmethod
     def deduct_wallet(username, amount):
         """
         Deducts funds from a customer's wallet if sufficient balance exists.
         """
+        # Imported here because the ledger module imports this one
+        from customers.ledger import adjust_balance
         try:
-            query = text("""
-                UPDATE customers
-                SET wallet_balance = wallet_balance - :amount
-                WHERE username = :username AND wallet_balance >= :amount
-            """)
-            result = db.session.execute(query, {"amount": amount, "username": username})
+            balance = adjust_balance(Customer.username == username, -amount, "deduct")
             db.session.commit()
-            return result.rowcount > 0
+            return balance is not None
         except Exception as e:
             print(f"Error in deduct_wallet: {e}")
             db.session.rollback()
             return False
 
-    def to_dict(self):
+    # Keys of to_dict, in order. In production, passwords should be hashed and not exposed.
+    DICT_FIELDS = ("id", "username", "full_name", "password", "age", "address", "gender",
+                   "marital_status", "wallet_balance", "role")
+
+    def to_dict(self, fields=None):
         """
         Converts the customer object to a dictionary.
 
+        Args:
+            fields (iterable, optional): Only these keys of ``DICT_FIELDS``.
+                Only those attributes are read, so customers loaded with
+                :meth:`load_fields` are not fetched again.
+
         Returns:
             dict: A dictionary representation of the customer object.
         """
-        return {
-            "id": self.id,
-            "username": self.username,
-            "full_name": self.full_name,
-            "password": self.password,  # In production, passwords should be hashed and not exposed.
-            "age": self.age,
-            "address": self.address,
-            "gender": self.gender,
-            "marital_status": self.marital_status,
-            "wallet_balance": self.wallet_balance,
-            "role": self.role,
-        }
\ No newline at end of file
+        return {field: getattr(self, field) for field in fields or self.DICT_FIELDS}
+
+    @classmethod
+    def load_fields(cls, fields):
+        """
+        Returns a loader option that selects only the columns behind ``fields``.
+        """
+        return load_only_fields(cls, fields)
+
+class WalletLedgerEntry(db.Model):
+    """
+    One signed change to a customer's wallet, appended by :mod:`customers.ledger`.
+
+    Entries are never updated or deleted, so the ledger is also the audit
+    trail of every charge, deduction and sale.
+
+    Attributes:
+        id (int): The unique, increasing ID of the entry.
+        customer_id (int): The customer whose wallet changed. Links to :class:`Customer`.
+        amount (float): The change; negative for deductions and sales.
+        reason (str): ``charge``, ``deduct`` or ``sale``.
+        created_at (datetime): When the entry was written.
+    """
+    __tablename__ = 'wallet_ledger'
+    __table_args__ = (
+        # A customer's tail after their snapshot is one range of this index
+        db.Index('ix_wallet_ledger_customer_id', 'customer_id', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    reason = db.Column(db.String(20), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class WalletSnapshot(db.Model):
+    """
+    A customer's wallet balance folded up to a ledger entry.
+
+    The current balance is ``balance`` plus the entries after
+    ``last_entry_id``. Writers lock this row, not the customer row, while they
+    check the balance and append an entry.
+
+    Attributes:
+        customer_id (int): The customer. Links to :class:`Customer`.
+        balance (float): The balance including every entry up to ``last_entry_id``.
+        last_entry_id (int): The last ledger entry folded in, or 0.
+        updated_at (datetime): When the snapshot was last compacted.
+    """
+    __tablename__ = 'wallet_snapshots'
+
+    customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), primary_key=True, autoincrement=False)
+    balance = db.Column(db.Float, nullable=False, default=0.0)
+    last_entry_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class TokenRevocation(db.Model):
+    """
+    Refuses a customer's tokens issued before a point in time.
+
+    Written when a customer's role or password changes or the customer is
+    deleted (see :mod:`customers.auth`). There is no foreign key, so the row
+    outlives a deleted customer until their tokens have expired.
+
+    Attributes:
+        customer_id (int): The customer whose tokens are revoked.
+        revoked_at (float): Unix time; tokens with an earlier ``iat`` are refused.
+            Double precision: a MySQL ``FLOAT`` rounds current times to
+            steps of about two minutes.
+    """
+    __tablename__ = 'token_revocations'
+
+    customer_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    revoked_at = db.Column(db.Double, nullable=False, index=True)
@@ -18,16 +18,20 @@ Routes:
 - GET `/customers`: Fetch all customers.
 - POST `/customer/<username>/wallet/charge`: Charge an amount to a customer's wallet.
 - POST `/customer/<username>/wallet/deduct`: Deduct an amount from a customer's wallet.
+- POST `/customers/wallets/charge-batch`: Charge many wallets in one request.
 """
 
-from flask import Blueprint, request, jsonify
-from customers.services import CustomerService
+import click
+from flask import Blueprint, g, request, jsonify
+from customers.auth import current_principal, load_principal
+from customers.services import CustomerNotFound, CustomerService
+from customers.ledger import compact_wallet_ledger, ledger_enabled, wallet_balance
 from customers.models import Customer
-from utils import SECRET_KEY, create_token, extract_auth_token, decode_token, save_token
-import jwt
+from utils import parse_fields
 
 # Create a Blueprint for customer routes
 customers_blueprint = Blueprint('customers', __name__)
+customers_blueprint.before_request(load_principal)
 
 @customers_blueprint.route('/customer', methods=['POST'])
 def create_customer():
@@ -137,29 +141,15 @@ def update_customer(username):
     Update an existing customer's information.
     """
     
-    # Extract the token from the Authorization header
-    header = request.headers.get("Authorization")
-    if not header:
-        return jsonify({"error": "Authorization header missing or malformed"}), 403
+    # The token was verified before the request reached this handler
+    principal = current_principal()
+    if principal is None:
+        return jsonify({"error": g.auth_error}), 403
 
-    try:
-        # Decode the token and extract the user ID (primary key)
-        user_id = decode_token(header)
-    except jwt.ExpiredSignatureError:
-        return jsonify({"error": "Token has expired"}), 403
-    except jwt.InvalidTokenError:
-        return jsonify({"error": "Unauthorized"}), 403
+    print(f"DEBUG: Token belongs to customer {principal.username}")
 
-    # Verify user identity
-    customer = Customer.query.filter_by(id=user_id).first()
-    if not customer:
-        print(f"DEBUG: Customer with ID {user_id} not found.")
-        return jsonify({"error": "Customer not found"}), 404
-
-    print(f"DEBUG: Token belongs to customer {customer.username}")
-
-    if customer.username != username:
-        print(f"DEBUG: Username mismatch. Token belongs to {customer.username}, but {username} was requested.")
+    if principal.username != username:
+        print(f"DEBUG: Username mismatch. Token belongs to {principal.username}, but {username} was requested.")
         return jsonify({"error": "Unauthorized"}), 403
 
     # Get the JSON payload and validate
@@ -197,27 +187,13 @@ def delete_customer(username):
         - `404 Not Found`: If the customer does not exist.
         - `500 Internal Server Error`: If an unexpected error occurs.
     """
-    # Extract the token from the Authorization header
-    header = extract_auth_token(request)
-    if not header:
-        return jsonify({"error": "Authorization header missing or malformed"}), 403
+    # The token was verified before the request reached this handler
+    principal = current_principal()
+    if principal is None:
+        return jsonify({"error": g.auth_error}), 403
 
-    try:
-        # Decode the token and extract the user ID (primary key)
-        user_id = decode_token(header)
-    except jwt.ExpiredSignatureError:
-        return jsonify({"error": "Token has expired"}), 403
-    except jwt.InvalidTokenError:
-        return jsonify({"error": "Unauthorized"}), 403
-
-    # Verify user identity
-    customer = Customer.query.filter_by(id=user_id).first()
-    if not customer:
-        print(f"DEBUG: Customer with ID {user_id} not found.")
-        return jsonify({"error": "Customer not found"}), 404
-
-    if customer.username != username:
-        print(f"DEBUG: Username mismatch. Token belongs to {customer.username}, but {username} was requested.")
+    if principal.username != username:
+        print(f"DEBUG: Username mismatch. Token belongs to {principal.username}, but {username} was requested.")
         return jsonify({"error": "Unauthorized"}), 403
 
     # Delegate deletion logic to the service
@@ -247,7 +223,11 @@ def get_customer(username):
     customer = CustomerService.get_customer_by_username(username)
     if not customer:
         return jsonify({"error": "Customer not found"}), 404
-    return jsonify(customer.to_dict())
+    details = customer.to_dict()
+    if ledger_enabled():
+        # The column only catches up with the wallet ledger when it is compacted
+        details["wallet_balance"] = wallet_balance(customer.id)
+    return jsonify(details)
 
 @customers_blueprint.route('/customers', methods=['GET'])
 def get_all_customers():
@@ -258,29 +238,30 @@ def get_all_customers():
 
     **Method**: `GET`
 
+    **Query Parameters**:
+        - `fields` (optional): Comma-separated customer fields to return, e.g. `id,username,role`.
+          Only those columns are read from the database.
+
     **Response**:
         - `200 OK`: If the list of customers is retrieved successfully.
+        - `400 Bad Request`: If `fields` names an unknown field.
         - `403 Forbidden`: If the user is unauthorized to perform this action.
         - `500 Internal Server Error`: If an unexpected error occurs.
     """
-    header = extract_auth_token(request)
-    if header:
-        try:
-            user_id = decode_token(header)
-        except jwt.ExpiredSignatureError:
-            return jsonify({"error": "Token has expired"}), 403
-        except jwt.InvalidTokenError:
-            return jsonify({"error": "Unauthorized"}), 403
-
+    principal = current_principal()
+    if principal:
         # Verify admin role
-        customer = Customer.query.get(user_id)
-        if not customer or customer.role != "admin":
+        if not principal.is_admin:
             return jsonify({"error": "Access forbidden: Admins only"}), 403
 
-        customers = CustomerService.get_all_customers()
+        try:
+            fields = parse_fields(request.args.get('fields'), Customer.DICT_FIELDS)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        customers = CustomerService.get_all_customers(fields)
         return jsonify(customers)
 
-    return jsonify({"error": "Authorization header missing or malformed"}), 403
+    return jsonify({"error": g.auth_error}), 403
 
 @customers_blueprint.route('/customer/<username>/wallet/charge', methods=['POST'])
 def charge_wallet(username):
@@ -298,34 +279,19 @@ def charge_wallet(username):
         - `amount` (float): The amount to charge (required, must be non-negative).
 
     **Response**:
-        - `200 OK`: If the wallet is charged successfully.
+        - `200 OK`: If the wallet is charged successfully, with the new `wallet_balance`.
         - `400 Bad Request`: If the request payload is invalid or the amount is negative.
         - `403 Forbidden`: If the user is unauthorized to perform this action.
         - `404 Not Found`: If the customer does not exist.
         - `500 Internal Server Error`: If an unexpected error occurs.
     """
-    # Extract and validate token
-    header = extract_auth_token(request)
-    if not header:
-        return jsonify({"error": "Authorization header missing or malformed"}), 403
-
-    try:
-        # Decode the token to get the user ID
-        user_id = decode_token(header)
-    except jwt.ExpiredSignatureError:
-        return jsonify({"error": "Token has expired"}), 403
-    except jwt.InvalidTokenError:
-        return jsonify({"error": "Unauthorized"}), 403
-
-    # Verify user identity and ensure the customer exists
-    customer = Customer.query.filter_by(username=username).first()
-    if not customer:
-        return jsonify({"error": "Customer not found"}), 404
-    if customer.username != username:
-        return jsonify({"error": "Unauthorized"}), 403
+    # The token was verified before the request reached this handler
+    principal = current_principal()
+    if principal is None:
+        return jsonify({"error": g.auth_error}), 403
 
-    # Ensure the user ID from the token matches the requested customer
-    if str(customer.id) != user_id:
+    # Ensure the token belongs to the requested customer
+    if principal.username != username:
         return jsonify({"error": "Unauthorized"}), 403
 
     # Process wallet charge
@@ -338,11 +304,11 @@ def charge_wallet(username):
         return jsonify({"message": "Amount cannot be negative"}), 400
 
     # Charge the wallet
-    success = CustomerService.charge_wallet(username, amount)
-    if not success:
+    balance = CustomerService.charge_wallet(username, amount)
+    if balance is None:
         return jsonify({"error": "Error updating wallet balance"}), 500
 
-    return jsonify({"message": "Wallet charged successfully"}), 200
+    return jsonify({"message": "Wallet charged successfully", "wallet_balance": balance}), 200
 
 
 @customers_blueprint.route('/customer/<username>/wallet/deduct', methods=['POST'])
@@ -361,41 +327,86 @@ def deduct_wallet(username):
         - `amount` (float): The amount to deduct (required, must not exceed wallet balance).
 
     **Response**:
-        - `200 OK`: If the amount is deducted successfully.
-        - `400 Bad Request`: If the request payload is invalid or there is insufficient balance.
-        - `403 Forbidden`: If the user is unauthorized to perform this action.
+        - `200 OK`: If the amount is deducted successfully, with the new `wallet_balance`.
+        - `400 Bad Request`: If the request payload is invalid, the amount is negative or there is insufficient balance.
+        - `403 Forbidden`: If the caller is neither the customer nor an admin.
         - `404 Not Found`: If the customer does not exist.
         - `500 Internal Server Error`: If an unexpected error occurs.
     """
-    header = extract_auth_token(request)
-    if header:
-        try:
-            user_id = decode_token(header)
-        except jwt.ExpiredSignatureError:
-            return jsonify({"error": "Token has expired"}), 403
-        except jwt.InvalidTokenError:
-            return jsonify({"error": "Unauthorized"}), 403
-
-        # Verify user identity
-        customer = Customer.query.filter_by(username=username).first()
-        if not customer:
-            return jsonify({"error": "Customer not found"}), 404
-        if customer.username != username:
+    principal = current_principal()
+    if principal:
+        # Only the customer or an admin may spend from the wallet
+        if principal.username != username and not principal.is_admin:
             return jsonify({"error": "Unauthorized"}), 403
 
-        # Process wallet charge
+        # Process wallet deduction
         data = request.json
         if not data or "amount" not in data:
             return jsonify({"error": "Amount is required"}), 400
 
-        if data.get("amount") > customer.wallet_balance:
-            return jsonify({"message": "Insufficient balance"}), 400
+        amount = data.get("amount")
+        if amount < 0:
+            return jsonify({"message": "Amount cannot be negative"}), 400
 
-        success = CustomerService.deduct_wallet(username, data['amount'])
-        if not success:
+        # The balance is checked by the UPDATE itself
+        try:
+            balance = CustomerService.deduct_wallet(username, amount)
+        except CustomerNotFound as e:
+            return jsonify({"error": str(e)}), 404
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
+        if balance is None:
             return jsonify({"error": "Error updating wallet balance"}), 500
 
-        return jsonify({"message": "Wallet deducted successfully"}), 200
+        return jsonify({"message": "Wallet deducted successfully", "wallet_balance": balance}), 200
+
+    return jsonify({"error": g.auth_error}), 403
+
 
-    return jsonify({"error": "Authorization header missing or malformed"}), 403
+@customers_blueprint.route('/customers/wallets/charge-batch', methods=['POST'])
+def charge_wallets():
+    """
+    Charge many customers' wallets in one request (admin only).
+
+    **Endpoint**: `/customers/wallets/charge-batch`
+
+    **Method**: `POST`
+
+    **Request Body**:
+        - `credits` (list): Objects with `username` (str) and `amount` (float,
+          non-negative). At most 10000 lines.
 
+    **Response**:
+        - `200 OK`: With the number of lines `applied`, `customers_credited`,
+          and the `rejected` lines (unknown usernames or invalid lines), which
+          do not stop the others.
+        - `400 Bad Request`: If the payload is not a non-empty list or is too long.
+        - `403 Forbidden`: If the user is unauthorized to perform this action.
+    """
+    principal = current_principal()
+    if principal is None:
+        return jsonify({"error": g.auth_error}), 403
+
+    # Verify admin role
+    if not principal.is_admin:
+        return jsonify({"error": "Access forbidden: Admins only"}), 403
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or "credits" not in data:
+        return jsonify({"error": "Credits are required"}), 400
+
+    try:
+        result = CustomerService.charge_wallets(data["credits"])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result), 200
+
+
+@customers_blueprint.cli.command('compact-wallet-ledger')
+@click.option('--min-entries', default=1, show_default=True, help='Skip customers with a shorter ledger tail.')
+def compact_wallet_ledger_command(min_entries):
+    """
+    Fold wallet ledger entries into the per-customer balance snapshots.
+    """
+    report = compact_wallet_ledger(min_entries)
+    click.echo(f"Compacted {report['entries']} ledger entries for {report['customers']} customers.")
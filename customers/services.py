@@ -1,11 +1,17 @@
+from sqlalchemy import select
 from sqlalchemy.sql import text  
 from database.db_config import db
 from customers.models import Customer
+from customers.auth import revoke_tokens
+from customers.ledger import adjust_balance, credit_wallets, ledger_enabled, set_balance, wallet_balances
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from utils import SECRET_KEY, create_token, extract_auth_token, decode_token, save_token
 
 
 class CustomerService:
+    MAX_WALLET_CREDITS = 10000
+    WALLET_CREDIT_CHUNK_SIZE = 500
+
     @staticmethod
     def login_customer(username, password):
         """
@@ -23,8 +29,8 @@ class CustomerService:
             if not customer or customer.password != password:
                 return {"error": "Invalid username or password"}
             
-            # Generate JWT token
-            token = create_token(customer.id)
+            # Generate JWT token; the claims let requests skip the customer lookup
+            token = create_token(customer.id, customer.username, customer.role or "customer")
             return {"access_token": token}
         
         except SQLAlchemyError as e:
@@ -98,6 +104,11 @@ class CustomerService:
             # Include all fields in the update dictionary, defaulting to None for missing fields
             update_fields = {field: updates.get(field, None) for field in fields}
             update_fields["username"] = username
+            # The column is overwritten by the next ledger compaction, so the
+            # new balance is recorded as a ledger entry instead
+            new_balance = update_fields["wallet_balance"] if ledger_enabled() else None
+            if new_balance is not None:
+                update_fields["wallet_balance"] = None
 
             query = text("""
                 UPDATE customers
@@ -114,6 +125,11 @@ class CustomerService:
             """)
 
             result = db.session.execute(query, update_fields)
+            if result.rowcount and new_balance is not None:
+                set_balance(Customer.username == username, new_balance)
+            if result.rowcount and (updates.get("role") is not None or updates.get("password") is not None):
+                # Tokens carry the role, so refuse those issued before the change
+                CustomerService._revoke_tokens(username)
             db.session.commit()
 
             print(f"DEBUG: Update query affected {result.rowcount} rows.")
@@ -140,69 +156,52 @@ class CustomerService:
         return result.rowcount > 0
 
     @staticmethod
-    def get_all_customers():
+    def get_all_customers(fields=None):
         """
         Fetches all customers from the database.
 
+        Args:
+            fields (list, optional): Only these keys of ``Customer.DICT_FIELDS``;
+                only their columns are selected.
+
         Returns:
-            list: A list of customer dictionaries.
+            list: A list of customer dictionaries. In ledger mode
+            ``wallet_balance`` is the live balance, not the column.
         """
-        query = text("SELECT * FROM customers")
-        results = db.session.execute(query).mappings().fetchall()
-
-        return [Customer(
-            full_name=result["full_name"],
-            username=result["username"],
-            password=result["password"],
-            age=result["age"],
-            address=result["address"],
-            gender=result["gender"],
-            marital_status=result["marital_status"],
-            wallet_balance=result["wallet_balance"],
-            role=result["role"]
-        ).to_dict() for result in results]
+        query = select(Customer)
+        if fields:
+            query = query.options(Customer.load_fields(fields))
+        customers = [(customer.id, customer.to_dict(fields)) for customer in db.session.execute(query).scalars()]
+        if ledger_enabled() and (not fields or "wallet_balance" in fields):
+            balances = wallet_balances([customer_id for customer_id, _ in customers])
+            for customer_id, details in customers:
+                details["wallet_balance"] = balances.get(customer_id, details["wallet_balance"])
+        return [details for _, details in customers]
         
     @staticmethod
     def charge_wallet(username, amount):
         """
         Charges a specified amount to a customer's wallet.
 
+        The balance is updated and returned by one statement
+        (see :meth:`customers.models.Customer.adjust_wallet`), or appended
+        to the wallet ledger when it is enabled (see :mod:`customers.ledger`).
+
         Args:
             username (str): The username of the customer.
             amount (float): The amount to add to the wallet.
 
         Returns:
-            bool: True if successful, False if the customer is not found or other errors occur.
+            float or None: The new balance, or None if the customer is not found or other errors occur.
         """
         try:
-            # Log pre-update balance
-            pre_query = text("SELECT wallet_balance FROM customers WHERE username = :username")
-            pre_result = db.session.execute(pre_query, {"username": username}).mappings().fetchone()
-            if not pre_result:
-                print(f"DEBUG: Customer {username} not found.")
-                return False
-
-            print(f"DEBUG: Pre-update wallet balance for {username}: {pre_result['wallet_balance']}")
-
-            # Update wallet balance
-            query = text("""
-                UPDATE customers
-                SET wallet_balance = wallet_balance + :amount
-                WHERE username = :username
-            """)
-            result = db.session.execute(query, {"amount": amount, "username": username})
+            balance = adjust_balance(Customer.username == username, amount, "charge")
             db.session.commit()
-
-            # Log post-update balance
-            post_query = text("SELECT wallet_balance FROM customers WHERE username = :username")
-            post_result = db.session.execute(post_query, {"username": username}).mappings().fetchone()
-            print(f"DEBUG: Post-update wallet balance for {username}: {post_result['wallet_balance']}")
-
-            return result.rowcount > 0
+            return balance
         except Exception as e:
             print(f"Error in charge_wallet: {e}")
             db.session.rollback()
-            return False
+            return None
 
 
     @staticmethod
@@ -210,47 +209,106 @@ class CustomerService:
         """
         Deducts funds from a customer's wallet if sufficient balance exists.
 
+        The balance check is part of the UPDATE itself, so two concurrent
+        deductions cannot both pass it.
+
         Args:
             username (str): The username of the customer.
             amount (float): The amount to deduct.
 
         Returns:
-            bool: True if successful, False if the customer doesn't exist or has insufficient funds.
+            float or None: The new balance, or None if an error occurs.
+
+        Raises:
+            CustomerNotFound: If the customer doesn't exist.
+            ValueError: If the customer has insufficient funds.
         """
         try:
-            # Log pre-update balance
-            pre_query = text("SELECT wallet_balance FROM customers WHERE username = :username")
-            pre_result = db.session.execute(pre_query, {"username": username}).mappings().fetchone()
-            if not pre_result:
-                print(f"DEBUG: Customer {username} not found.")
-                return False
+            balance = adjust_balance(Customer.username == username, -amount, "deduct")
+            if balance is None:
+                # Only a refused deduction needs to tell the two apart
+                exists = db.session.execute(select(Customer.id).where(Customer.username == username)).first()
+                db.session.rollback()
+                if exists is None:
+                    raise CustomerNotFound()
+                raise ValueError("Insufficient balance")
+            db.session.commit()
+            return balance
+        except (CustomerNotFound, ValueError):
+            raise
+        except Exception as e:
+            print(f"Error in deduct_wallet: {e}")
+            db.session.rollback()
+            return None
 
-            print(f"DEBUG: Pre-update wallet balance for {username}: {pre_result['wallet_balance']}")
+    @staticmethod
+    def charge_wallets(credits):
+        """
+        Charges many wallets at once, e.g. for a promotion.
 
-            # Ensure sufficient balance before deducting
-            if pre_result['wallet_balance'] < amount:
-                print(f"DEBUG: Insufficient funds for {username}. Cannot deduct {amount} from balance {pre_result['wallet_balance']}.")
-                return False
+        Lines for the same customer are summed first. Customers are then
+        handled in chunks: one ``SELECT ... IN`` finds which usernames exist,
+        and every existing wallet in the chunk is credited by one statement
+        (see :func:`customers.ledger.credit_wallets`) and committed. Unknown
+        usernames and invalid lines are reported and do not stop the others.
 
-            # Update wallet balance
-            query = text("""
-                UPDATE customers
-                SET wallet_balance = wallet_balance - :amount
-                WHERE username = :username
-            """)
-            result = db.session.execute(query, {"amount": amount, "username": username})
-            db.session.commit()
+        Args:
+            credits (list): Objects with ``username`` (str) and ``amount``
+                (non-negative number).
 
-            # Log post-update balance
-            post_query = text("SELECT wallet_balance FROM customers WHERE username = :username")
-            post_result = db.session.execute(post_query, {"username": username}).mappings().fetchone()
-            print(f"DEBUG: Post-update wallet balance for {username}: {post_result['wallet_balance']}")
+        Returns:
+            dict: The number of lines applied and customers credited, and the
+            rejected lines with their 1-based position and reason.
 
-            return result.rowcount > 0
-        except Exception as e:
-            print(f"Error in charge_wallet: {e}")
-            db.session.rollback()
-            return False
+        Raises:
+            ValueError: If the payload is not a list, is too long, or a chunk
+                fails to write. Chunks committed before it stay applied.
+        """
+        if not isinstance(credits, list) or not credits:
+            raise ValueError("Credits must be a non-empty list")
+        if len(credits) > CustomerService.MAX_WALLET_CREDITS:
+            raise ValueError(f"At most {CustomerService.MAX_WALLET_CREDITS} credits per request")
+
+        rejected = []
+        amounts = {}
+        lines = {}
+        for line_no, line in enumerate(credits, start=1):
+            username = line.get("username") if isinstance(line, dict) else None
+            amount = line.get("amount") if isinstance(line, dict) else None
+            if not isinstance(username, str) or not username \
+                    or isinstance(amount, bool) or not isinstance(amount, (int, float)) or amount < 0:
+                rejected.append({"line": line_no, "username": username,
+                                 "error": "username must be a string and amount a non-negative number"})
+                continue
+            amounts[username] = amounts.get(username, 0.0) + amount
+            lines.setdefault(username, []).append(line_no)
+
+        usernames = sorted(amounts)
+        chunk_size = CustomerService.WALLET_CREDIT_CHUNK_SIZE
+        credited = 0
+        for start in range(0, len(usernames), chunk_size):
+            chunk = usernames[start:start + chunk_size]
+            try:
+                ids = dict(db.session.execute(
+                    select(Customer.username, Customer.id).where(Customer.username.in_(chunk))
+                ).all())
+                credit_wallets({ids[username]: amounts[username] for username in chunk if username in ids})
+                db.session.commit()
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                raise ValueError(f"Failed to charge wallets: {e}")
+            for username in chunk:
+                if username not in ids:
+                    for line_no in lines.pop(username):
+                        rejected.append({"line": line_no, "username": username, "error": "Customer not found"})
+            credited += len(ids)
+
+        rejected.sort(key=lambda item: item["line"])
+        return {
+            "applied": sum(len(line_nos) for line_nos in lines.values()),
+            "customers_credited": credited,
+            "rejected": rejected,
+        }
 
     @staticmethod
     def delete_customer(username):
@@ -264,6 +322,7 @@ class CustomerService:
             bool: True if the deletion was successful, False otherwise.
         """
         try:
+            CustomerService._revoke_tokens(username)
             query = text("DELETE FROM customers WHERE username = :username")
             result = db.session.execute(query, {"username": username})
             db.session.commit()
@@ -272,6 +331,13 @@ class CustomerService:
             print(f"Error in delete_customer: {e}")
             db.session.rollback()
             return False
+
+    @staticmethod
+    def _revoke_tokens(username):
+        customer_id = db.session.execute(select(Customer.id).where(Customer.username == username)).scalar()
+        if customer_id is not None:
+            revoke_tokens(customer_id)
+
     def validate_customer_payload(payload):
         required_fields = ['full_name', 'username', 'password', 'age', 'address', 'gender', 'marital_status']
         missing_fields = [field for field in required_fields if field not in payload]
@@ -280,3 +346,8 @@ class CustomerService:
             raise ValueError(f"Missing fields: {', '.join(missing_fields)}")
 
 
+class CustomerNotFound(Exception):
+    """Raised when the customer a wallet operation names does not exist."""
+
+    def __init__(self):
+        super().__init__("Customer not found")
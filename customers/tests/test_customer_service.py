@@ -1,3 +1,4 @@
+import pytest
 from pytest_mock import mocker
 import random
 import string
@@ -209,8 +210,8 @@ def test_deduct_wallet_insufficient_balance(client):
         "role": "customer"
     })
 
-    # Log in and get the token
-    token = test_login_and_authorization(client)
+    # Log in as the customer and get the token
+    token = client.post('/login', json={"username": username, "password": "password"}).json['access_token']
     headers = {"Authorization": f"Bearer {token}"}
 
     # Attempt to deduct without charging first
@@ -242,4 +243,203 @@ def test_login_sql_injection(client):
         "password": "password"
     })
     assert response.status_code == 400  # Should not allow login
-    assert "Invalid credentials" in response.json["message"]
\ No newline at end of file
+    assert "Invalid credentials" in response.json["message"]
+
+
+def test_adjust_wallet_single_statement(client, monkeypatch):
+    """Test guarded wallet updates return the new balance, with and without RETURNING."""
+    from sqlalchemy import select
+    username = generate_unique_username()
+    db.session.add(Customer(full_name="Test User", username=username, password="password", age=30))
+    db.session.commit()
+    dialect = db.session.get_bind().dialect
+
+    for returning in (True, False):
+        monkeypatch.setattr(dialect, "update_returning", returning)
+        assert Customer.adjust_wallet(Customer.username == username, 30.0) == 30.0
+        assert Customer.adjust_wallet(Customer.username == username, -20.0) == 10.0
+        # A deduction the balance does not cover leaves it untouched
+        assert Customer.adjust_wallet(Customer.username == username, -50.0) is None
+        assert Customer.adjust_wallet(Customer.username == "nobody", 5.0) is None
+        assert Customer.deduct_wallet(username, 10.0) is True
+        assert db.session.execute(select(Customer.wallet_balance).where(Customer.username == username)).scalar() == 0.0
+
+def test_wallet_ledger_and_compaction(client, monkeypatch):
+    """Test ledger-mode wallet changes leave the customer row alone until compaction folds them."""
+    from customers.ledger import compact_wallet_ledger, wallet_balance
+    from customers.models import WalletLedgerEntry
+    monkeypatch.setitem(client.application.config, "WALLET_LEDGER", True)
+    username = generate_unique_username()
+    customer = Customer(full_name="Test User", username=username, password="password", age=30, wallet_balance=10.0)
+    db.session.add(customer)
+    db.session.commit()
+
+    assert CustomerService.charge_wallet(username, 40.0) == 50.0
+    assert CustomerService.deduct_wallet(username, 15.0) == 35.0
+    with pytest.raises(ValueError, match="Insufficient balance"):
+        CustomerService.deduct_wallet(username, 100.0)
+    assert [e.amount for e in WalletLedgerEntry.query.filter_by(customer_id=customer.id)] == [40.0, -15.0]
+    assert wallet_balance(customer.id) == 35.0
+    db.session.refresh(customer)
+    assert customer.wallet_balance == 10.0
+
+    assert compact_wallet_ledger() == {"customers": 1, "entries": 2}
+    assert compact_wallet_ledger() == {"customers": 0, "entries": 0}
+    db.session.refresh(customer)
+    assert customer.wallet_balance == 35.0
+    assert CustomerService.deduct_wallet(username, 35.0) == 0.0
+    assert wallet_balance(customer.id) == 0.0
+
+def test_wallet_ledger_profile_update_and_listing(client, monkeypatch):
+    """Test a wallet_balance profile update survives compaction and the listing shows live balances."""
+    from customers.ledger import compact_wallet_ledger, wallet_balance
+    monkeypatch.setitem(client.application.config, "WALLET_LEDGER", True)
+    username = generate_unique_username()
+    customer = Customer(full_name="Test User", username=username, password="password", age=30, wallet_balance=10.0)
+    db.session.add(customer)
+    db.session.commit()
+
+    assert CustomerService.charge_wallet(username, 5.0) == 15.0
+    assert [c["wallet_balance"] for c in CustomerService.get_all_customers(["username", "wallet_balance"])
+            if c["username"] == username] == [15.0]
+    assert CustomerService.update_customer(username, {"wallet_balance": 100.0, "age": 31})
+    assert wallet_balance(customer.id) == 100.0
+    compact_wallet_ledger()
+    db.session.refresh(customer)
+    assert (customer.wallet_balance, customer.age) == (100.0, 31)
+    assert wallet_balance(customer.id) == 100.0
+
+def test_charge_wallets_batch(client, monkeypatch):
+    """Test the batch top-up credits known customers in place and through the ledger, reporting misses."""
+    from customers.ledger import wallet_balance
+    from utils import create_token
+    admin = Customer(full_name="Admin", username=generate_unique_username(), password="password", age=40, role="admin")
+    users = [Customer(full_name="Test User", username=generate_unique_username(), password="password", age=30)
+             for _ in range(3)]
+    db.session.add_all([admin] + users)
+    db.session.commit()
+    headers = {"Authorization": f"Bearer {create_token(admin.id)}"}
+    credits = [
+        {"username": users[0].username, "amount": 10.0},
+        {"username": "nobody", "amount": 5.0},
+        {"username": users[1].username, "amount": -1},
+        {"username": users[0].username, "amount": 2.5},
+        {"username": users[2].username, "amount": 7},
+    ]
+
+    for ledger in (False, True):
+        monkeypatch.setitem(client.application.config, "WALLET_LEDGER", ledger)
+        response = client.post('/customers/wallets/charge-batch', json={"credits": credits}, headers=headers)
+        assert response.status_code == 200
+        assert response.json["applied"] == 3
+        assert response.json["customers_credited"] == 2
+        assert [(r["line"], r["username"]) for r in response.json["rejected"]] == [(2, "nobody"), (3, users[1].username)]
+        assert [wallet_balance(u.id) for u in users] == [12.5 * (1 + ledger), 0.0, 7.0 * (1 + ledger)]
+
+    token = create_token(users[0].id)
+    response = client.post('/customers/wallets/charge-batch', json={"credits": credits},
+                           headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 403
+    assert client.post('/customers/wallets/charge-batch', json={"credits": []}, headers=headers).status_code == 400
+
+def test_token_claims_authorize_without_queries(client):
+    """Test login tokens carry the role, admin checks skip the database and role changes revoke tokens."""
+    import jwt
+    from sqlalchemy import event
+    from utils import SECRET_KEY
+    admin = Customer(full_name="Admin", username=generate_unique_username(), password="password", age=40, role="admin")
+    db.session.add(admin)
+    db.session.commit()
+    token = client.post('/login', json={"username": admin.username, "password": "password"}).json["access_token"]
+    claims = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+    assert (claims["username"], claims["role"]) == (admin.username, "admin")
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get('/customers?fields=id', headers=headers).status_code == 200
+
+    statements = []
+    record = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        assert client.get('/customers?fields=id', headers=headers).status_code == 200
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+    # Only the listing itself; neither the caller nor the revocations were read
+    assert len(statements) == 1
+
+    response = client.put(f'/customer/{admin.username}', json={"role": "customer"}, headers=headers)
+    assert response.status_code == 200
+    response = client.get('/customers', headers=headers)
+    assert response.status_code == 403
+    assert response.json["error"] == "Token has been revoked"
+    token = client.post('/login', json={"username": admin.username, "password": "password"}).json["access_token"]
+    response = client.get('/customers', headers={"Authorization": f"Bearer {token}"})
+    assert response.json["error"] == "Access forbidden: Admins only"
+
+def test_decode_token_cache(client):
+    """Test verified tokens are served from the cache until they expire."""
+    import hashlib
+    import time
+    import jwt
+    from utils import SECRET_KEY, TOKEN_CACHE, create_token, decode_token_claims, token_cache_info
+    TOKEN_CACHE.clear()
+    token = create_token(7, "cached", "customer")
+    assert decode_token_claims(f"Bearer {token}")["username"] == "cached"
+    assert decode_token_claims(token)["sub"] == "7"
+    assert token_cache_info()["misses"] == 1 and token_cache_info()["hits"] == 1
+
+    with pytest.raises(jwt.InvalidTokenError):
+        decode_token_claims(token[:-2] + "xx")
+
+    # A cached token past its exp is verified again, and refused
+    expired = jwt.encode({"sub": "7", "exp": int(time.time()) - 10}, SECRET_KEY, algorithm="HS256")
+    TOKEN_CACHE.set(hashlib.sha256(expired.encode("utf-8")).digest(), ({"sub": "7"}, time.time() - 10))
+    with pytest.raises(jwt.ExpiredSignatureError):
+        decode_token_claims(expired)
+    assert token_cache_info()["size"] == 1
+
+def test_token_revocation_keeps_full_precision(client):
+    """Test a revocation cutoff round-trips exactly and refuses a token issued a second earlier."""
+    from sqlalchemy.dialects import mysql
+    from sqlalchemy.schema import CreateColumn
+    from customers.auth import RevocationList, revoke_tokens
+    from customers.models import TokenRevocation
+    column = TokenRevocation.__table__.c.revoked_at
+    assert "DOUBLE" in str(CreateColumn(column).compile(dialect=mysql.dialect()))
+
+    revoke_tokens(424242)
+    db.session.commit()
+    revoked_at = client.application.extensions["token_revocations"]._revoked["424242"]
+    db.session.expire_all()
+    assert db.session.get(TokenRevocation, 424242).revoked_at == revoked_at
+
+    # A fresh list reads the cutoff back from the table
+    revocations = RevocationList()
+    assert revocations.is_revoked(424242, revoked_at - 1)
+    assert not revocations.is_revoked(424242, revoked_at + 0.001)
+
+
+def test_deduct_wallet_ownership_and_missing_customer(client):
+    """Test only the customer or an admin may deduct, and a missing customer is a 404."""
+    from utils import create_token
+    admin = Customer(full_name="Admin", username=generate_unique_username(), password="password", age=40, role="admin")
+    owner = Customer(full_name="Owner", username=generate_unique_username(), password="password", age=30, wallet_balance=80.0)
+    db.session.add_all([admin, owner])
+    db.session.commit()
+
+    # Another customer may not spend from the wallet
+    token = test_login_and_authorization(client)
+    response = client.post(f'/customer/{owner.username}/wallet/deduct', json={"amount": 10.0},
+                           headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 403
+
+    # An admin may, and an unknown customer is not mistaken for a low balance
+    headers = {"Authorization": f"Bearer {create_token(admin.id, admin.username, admin.role)}"}
+    response = client.post(f'/customer/{owner.username}/wallet/deduct', json={"amount": 30.0}, headers=headers)
+    assert response.status_code == 200
+    assert response.json["wallet_balance"] == 50.0
+    response = client.post('/customer/nobody_here/wallet/deduct', json={"amount": 1.0}, headers=headers)
+    assert response.status_code == 404
+    assert response.json["error"] == "Customer not found"
+    response = client.post(f'/customer/{owner.username}/wallet/deduct', json={"amount": 60.0}, headers=headers)
+    assert response.status_code == 400
+    assert "Insufficient balance" in response.json["message"]
@@ -0,0 +1,125 @@
+"""
+Schema Upgrades
+===============
+
+``db.create_all()`` creates missing tables but never alters a table that
+already exists. This module adds the columns and indexes that were added
+later to tables that existed before, and widens columns whose type changed,
+so a database created by an older version can be brought up to date with
+``flask upgrade-db`` (``--sql`` prints the statements instead of running
+them). The live schema is inspected first, so the command is safe to run
+again.
+
+The MySQL ``FULLTEXT`` search index is created by
+``flask inventory rebuild-search-index``.
+"""
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import Double, inspect
+from sqlalchemy.schema import CreateColumn, CreateIndex
+from database.db_config import db
+
+# Columns added to existing tables, oldest first; new columns need a server
+# default or must be nullable so existing rows can take them
+ADDED_COLUMNS = [
+    ("goods", "stock_shards"),  # flash-sale stock shards
+    ("goods", "version"),  # optimistic concurrency and ETags
+    ("goods", "reorder_threshold"),  # low-stock flags
+    ("goods", "low_stock"),
+]
+
+# Indexes added to existing tables, oldest first
+ADDED_INDEXES = [
+    ("purchase_history", "ix_purchase_history_customer_date_id"),  # keyset-paginated history
+    ("goods", "ix_goods_category_price"),  # filtered catalog listing
+    ("goods", "ix_goods_count_in_stock"),
+    ("goods", "ix_goods_low_stock"),  # low-stock listing
+]
+
+# Columns that were created single precision and are now double precision
+WIDENED_COLUMNS = [
+    ("token_revocations", "revoked_at"),  # token iat cutoffs
+]
+
+
+def pending_schema_changes():
+    """
+    Returns the DDL statements the current database is missing.
+
+    Tables that do not exist yet are left to ``db.create_all()``, which
+    creates them complete.
+
+    Returns:
+        list: ``(description, statement)`` tuples, in the order to run them.
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    preparer = engine.dialect.identifier_preparer
+    existing = set(inspector.get_table_names())
+    changes = []
+
+    for table_name, column_name in ADDED_COLUMNS:
+        if table_name not in existing:
+            continue
+        if column_name in {column["name"] for column in inspector.get_columns(table_name)}:
+            continue
+        table = db.metadata.tables[table_name]
+        column = CreateColumn(table.c[column_name]).compile(dialect=engine.dialect)
+        changes.append((
+            f"add column {table_name}.{column_name}",
+            f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {column}",
+        ))
+
+    for table_name, column_name in WIDENED_COLUMNS:
+        if table_name not in existing or engine.dialect.name != "mysql":
+            continue
+        current = {column["name"]: column["type"] for column in inspector.get_columns(table_name)}
+        if column_name not in current or isinstance(current[column_name], Double):
+            continue
+        table = db.metadata.tables[table_name]
+        column = CreateColumn(table.c[column_name]).compile(dialect=engine.dialect)
+        changes.append((
+            f"widen column {table_name}.{column_name}",
+            f"ALTER TABLE {preparer.format_table(table)} MODIFY COLUMN {column}",
+        ))
+
+    for table_name, index_name in ADDED_INDEXES:
+        if table_name not in existing:
+            continue
+        if index_name in {index["name"] for index in inspector.get_indexes(table_name)}:
+            continue
+        index = next(i for i in db.metadata.tables[table_name].indexes if i.name == index_name)
+        changes.append((f"add index {index_name}", str(CreateIndex(index).compile(dialect=engine.dialect))))
+    return changes
+
+
+def upgrade_schema():
+    """
+    Creates missing tables, then adds missing columns and indexes to existing ones.
+
+    Returns:
+        list: Descriptions of the changes made.
+    """
+    changes = pending_schema_changes()
+    db.create_all()
+    with db.engine.begin() as connection:
+        for _, statement in changes:
+            connection.exec_driver_sql(statement)
+    return [description for description, _ in changes]
+
+
+@click.command('upgrade-db')
+@click.option('--sql', is_flag=True, help='Print the statements instead of running them.')
+@with_appcontext
+def upgrade_db_command(sql):
+    """
+    Bring an existing database up to the current schema.
+    """
+    if sql:
+        for _, statement in pending_schema_changes():
+            click.echo(f"{statement};")
+        return
+    applied = upgrade_schema()
+    for description in applied:
+        click.echo(description)
+    click.echo(f"Applied {len(applied)} schema changes.")
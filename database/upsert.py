@@ -0,0 +1,35 @@
+from sqlalchemy.dialects import mysql, sqlite
+from database.db_config import db
+
+
+def upsert_statement(table, index_elements, set_):
+    """
+    Builds an insert-or-update statement for the active database dialect.
+
+    MySQL gets ``INSERT ... ON DUPLICATE KEY UPDATE`` and SQLite gets
+    ``INSERT ... ON CONFLICT (...) DO UPDATE``. Execute the result with a list
+    of row dictionaries to upsert them in one executemany round trip.
+
+    Args:
+        table (Table): The table to write to (e.g. ``Model.__table__``).
+        index_elements (list): Column names of the unique key rows collide on.
+            MySQL infers the key itself, so this is only used by SQLite.
+        set_ (callable): Receives the proposed row (``excluded`` on SQLite,
+            ``inserted`` on MySQL) and returns a dict mapping column names to
+            the values to write on conflict, e.g.
+            ``lambda new: {"units": table.c.units + new.units}``.
+
+    Returns:
+        Insert: The dialect-specific upsert statement.
+
+    Raises:
+        NotImplementedError: If the dialect has no upsert support here.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "mysql":
+        stmt = mysql.insert(table)
+        return stmt.on_duplicate_key_update(set_(stmt.inserted))
+    if dialect == "sqlite":
+        stmt = sqlite.insert(table)
+        return stmt.on_conflict_do_update(index_elements=index_elements, set_=set_(stmt.excluded))
+    raise NotImplementedError(f"Upsert is not supported for the {dialect} dialect")
@@ -0,0 +1,119 @@
+"""
+Low-Stock Alerts
+================
+
+Incremental tracking of goods whose stock is at or below their
+``reorder_threshold``.
+
+``Goods.low_stock`` is an indexed flag updated by :func:`sync_low_stock` in
+the same transaction as every stock change, so the low-stock set can be read
+straight from the index instead of scanning the catalog. Only goods whose
+flag actually flips are written.
+
+With ``LOW_STOCK_OUTBOX`` enabled, every flip to low also inserts a
+:class:`inventory.models.LowStockAlert` row in that transaction, and
+:func:`dispatch_low_stock_alerts` sends pending alerts in batches
+(``flask inventory dispatch-low-stock-alerts``). Alerts are sent at least
+once: a batch is marked dispatched only after the notifier returns.
+
+Goods in a flash sale keep their stock in shards and are never flagged until
+the sale ends.
+"""
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import insert, select, update
+from database.db_config import db
+from inventory.models import Goods, LowStockAlert
+
+
+def is_low_stock(count_in_stock, reorder_threshold, stock_shards=0):
+    """
+    Returns whether a good with these values belongs in the low-stock set.
+    """
+    return reorder_threshold is not None and not stock_shards and count_in_stock <= reorder_threshold
+
+
+def sync_low_stock(goods_ids):
+    """
+    Brings ``Goods.low_stock`` in line with the current stock of some goods.
+
+    Call it after changing their stock or threshold, before committing. The
+    rows are already locked by that change, so the values read here are the
+    ones being committed.
+
+    Args:
+        goods_ids (iterable): The goods whose stock or threshold changed.
+
+    Returns:
+        list: The IDs of the goods that just became low on stock.
+    """
+    goods_ids = list(goods_ids)
+    if not goods_ids:
+        return []
+    rows = db.session.execute(
+        select(Goods.id, Goods.count_in_stock, Goods.reorder_threshold, Goods.stock_shards, Goods.low_stock)
+        .where(Goods.id.in_(goods_ids))
+    )
+    became_low = []
+    recovered = []
+    alerts = []
+    for row in rows:
+        low = is_low_stock(row.count_in_stock, row.reorder_threshold, row.stock_shards)
+        if low and not row.low_stock:
+            became_low.append(row.id)
+            alerts.append({"good_id": row.id, "count_in_stock": row.count_in_stock,
+                           "reorder_threshold": row.reorder_threshold, "created_at": datetime.utcnow()})
+        elif row.low_stock and not low:
+            recovered.append(row.id)
+
+    for ids, flag in ((became_low, True), (recovered, False)):
+        if ids:
+            db.session.execute(
+                update(Goods).where(Goods.id.in_(ids)).values(low_stock=flag)
+                .execution_options(synchronize_session=False)
+            )
+    if alerts and current_app.config.get("LOW_STOCK_OUTBOX"):
+        db.session.execute(insert(LowStockAlert), alerts)
+    return became_low
+
+
+def dispatch_low_stock_alerts(send, batch_size=100):
+    """
+    Sends pending outbox alerts in batches and marks them dispatched.
+
+    Pending rows are claimed with ``SELECT ... FOR UPDATE SKIP LOCKED`` where
+    supported, so several dispatchers can run side by side.
+
+    Args:
+        send (callable): Receives a list of alert dictionaries. If it raises,
+            the batch stays pending and the error propagates.
+        batch_size (int): Alerts per call to ``send``.
+
+    Returns:
+        int: The number of alerts dispatched.
+    """
+    dispatched = 0
+    while True:
+        alerts = db.session.execute(
+            select(LowStockAlert)
+            .where(LowStockAlert.dispatched_at.is_(None))
+            .order_by(LowStockAlert.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).scalars().all()
+        if not alerts:
+            db.session.rollback()
+            return dispatched
+        try:
+            send([alert.to_dict() for alert in alerts])
+            db.session.execute(
+                update(LowStockAlert)
+                .where(LowStockAlert.id.in_([alert.id for alert in alerts]))
+                .values(dispatched_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        dispatched += len(alerts)
@@ -0,0 +1,274 @@
+"""
+Name Autocomplete
+=================
+
+In-memory prefix index over ``Goods.name`` for search-as-you-type.
+
+Names are kept in one sorted list of lowercase keys with parallel arrays of
+goods IDs and stock, so a prefix is two binary searches away from the range
+of every matching name and the database is never queried per keystroke.
+Suggestions are the matching goods with the most stock.
+
+The index is built once per app (at startup when :func:`init_autocomplete`
+is used, otherwise on first use) and kept current by
+:class:`inventory.services.InventoryService` as goods are added, renamed or
+bulk-imported. Stock moves on every sale without touching the index, so the
+index is also rebuilt in the background once it is older than ``max_age``
+seconds; until the rebuild finishes the previous index keeps serving.
+"""
+import heapq
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from flask import current_app
+from sqlalchemy import select
+from database.db_config import db
+from inventory.models import Goods
+
+# Prefixes this short match too many names to rank per request, so their
+# suggestions are cached until a name under them changes
+CACHED_PREFIX_LENGTH = 2
+
+
+class AutocompleteIndex:
+    """
+    Sorted-array prefix index of goods names.
+
+    Args:
+        max_age (float): Seconds after which the next lookup triggers a
+            background rebuild, picking up stock changes.
+        max_suggestions (int): Largest number of suggestions per lookup.
+    """
+
+    def __init__(self, max_age=300.0, max_suggestions=20):
+        self.max_age = max_age
+        self.max_suggestions = max_suggestions
+        self.built_at = None
+        self._keys = []
+        self._names = []
+        self._ids = array("q")
+        self._stock = array("q")
+        self._short_cache = {}
+        self._lock = threading.RLock()
+        self._rebuilding = False
+
+    def build(self, rows):
+        """
+        Replaces the index contents.
+
+        Args:
+            rows (iterable): ``(goods_id, name, count_in_stock)`` tuples.
+        """
+        entries = sorted(((_key(name), goods_id, name, stock) for goods_id, name, stock in rows),
+                         key=lambda entry: (entry[0], entry[1]))
+        keys = [entry[0] for entry in entries]
+        names = [entry[2] for entry in entries]
+        ids = array("q", (entry[1] for entry in entries))
+        stock = array("q", (entry[3] or 0 for entry in entries))
+        with self._lock:
+            self._keys, self._names, self._ids, self._stock = keys, names, ids, stock
+            self._short_cache = {}
+            self.built_at = time.monotonic()
+
+    def add(self, goods_id, name, count_in_stock):
+        """
+        Inserts one good.
+        """
+        key = _key(name)
+        with self._lock:
+            position = self._find(key, goods_id)
+            self._keys.insert(position, key)
+            self._names.insert(position, name)
+            self._ids.insert(position, goods_id)
+            self._stock.insert(position, count_in_stock or 0)
+            self._forget(key)
+
+    def remove(self, goods_id, name):
+        """
+        Removes one good, found by its current name.
+        """
+        key = _key(name)
+        with self._lock:
+            position = self._find(key, goods_id)
+            if position < len(self._ids) and self._ids[position] == goods_id and self._keys[position] == key:
+                del self._keys[position]
+                del self._names[position]
+                del self._ids[position]
+                del self._stock[position]
+                self._forget(key)
+
+    def update(self, goods_id, old_name, name, count_in_stock):
+        """
+        Re-files one good after a rename or stock change.
+        """
+        with self._lock:
+            self.remove(goods_id, old_name)
+            self.add(goods_id, name, count_in_stock)
+
+    def complete(self, prefix, limit):
+        """
+        Returns up to ``limit`` goods whose name starts with ``prefix``, most stock first.
+
+        Args:
+            prefix (str): The typed text; matching ignores case.
+            limit (int): Number of suggestions, capped at ``max_suggestions``.
+
+        Returns:
+            list: Dictionaries with ``id``, ``name`` and ``count_in_stock``.
+        """
+        prefix = prefix.lower()
+        limit = min(limit, self.max_suggestions)
+        with self._lock:
+            if len(prefix) <= CACHED_PREFIX_LENGTH and prefix in self._short_cache:
+                return self._short_cache[prefix][:limit]
+            lo = bisect_left(self._keys, prefix)
+            hi = bisect_right(self._keys, prefix + "\U0010ffff", lo)
+            count = self.max_suggestions if len(prefix) <= CACHED_PREFIX_LENGTH else limit
+            # Ties on stock go to the alphabetically first name
+            best = heapq.nsmallest(count, range(lo, hi), key=lambda i: (-self._stock[i], i))
+            suggestions = [
+                {"id": self._ids[i], "name": self._names[i], "count_in_stock": self._stock[i]} for i in best
+            ]
+            if len(prefix) <= CACHED_PREFIX_LENGTH:
+                self._short_cache[prefix] = suggestions
+            return suggestions[:limit]
+
+    def is_stale(self):
+        """
+        Returns True if the index was never built or is older than ``max_age``.
+        """
+        return self.built_at is None or time.monotonic() - self.built_at > self.max_age
+
+    def rebuild_in_background(self, app):
+        """
+        Rebuilds the index from the app's database in a daemon thread.
+
+        Does nothing if a rebuild is already running.
+        """
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+
+        def run():
+            try:
+                with app.app_context():
+                    try:
+                        self.build(_load_rows())
+                    finally:
+                        db.session.remove()
+            except Exception as e:
+                print(f"Error rebuilding autocomplete index: {e}")
+            finally:
+                with self._lock:
+                    self._rebuilding = False
+
+        threading.Thread(target=run, name="autocomplete-rebuild", daemon=True).start()
+
+    def invalidate(self):
+        """
+        Marks the index as stale so the next lookup rebuilds it.
+        """
+        with self._lock:
+            self.built_at = time.monotonic() - self.max_age - 1 if self.built_at is not None else None
+
+    def memory_bytes(self):
+        """
+        Returns the approximate memory held by the index, in bytes.
+
+        Counts the list and array buffers plus every key and name string
+        (shared strings once).
+        """
+        with self._lock:
+            strings = {id(s): sys.getsizeof(s) for s in self._keys}
+            strings.update((id(s), sys.getsizeof(s)) for s in self._names)
+            return (sys.getsizeof(self._keys) + sys.getsizeof(self._names) + sys.getsizeof(self._ids)
+                    + sys.getsizeof(self._stock) + sum(strings.values()))
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _find(self, key, goods_id):
+        lo = bisect_left(self._keys, key)
+        hi = bisect_right(self._keys, key, lo)
+        while lo < hi and self._ids[lo] < goods_id:
+            lo += 1
+        return lo
+
+    def _forget(self, key):
+        for length in range(CACHED_PREFIX_LENGTH + 1):
+            self._short_cache.pop(key[:length], None)
+
+
+def _key(name):
+    key = name.lower()
+    # Reuse the name itself when it is already lowercase
+    return name if key == name else key
+
+
+def _load_rows():
+    return db.session.execute(
+        select(Goods.id, Goods.name, Goods.count_in_stock).execution_options(yield_per=10000)
+    ).tuples()
+
+
+def init_autocomplete(app, max_age=300.0):
+    """
+    Builds the app's autocomplete index in the background at startup.
+
+    The index is stored in ``app.extensions['goods_autocomplete']``.
+
+    Returns:
+        AutocompleteIndex: The index, which starts empty until the build finishes.
+    """
+    index = AutocompleteIndex(max_age=max_age)
+    app.extensions["goods_autocomplete"] = index
+    index.rebuild_in_background(app)
+    return index
+
+
+def get_autocomplete_index():
+    """
+    Returns the current app's index, building it on first use and
+    refreshing it in the background when stale.
+    """
+    index = current_app.extensions.get("goods_autocomplete")
+    if index is None:
+        index = AutocompleteIndex()
+        index.build(_load_rows())
+        current_app.extensions["goods_autocomplete"] = index
+    elif index.is_stale():
+        if index.built_at is None and not index._rebuilding:
+            index.build(_load_rows())
+        else:
+            index.rebuild_in_background(current_app._get_current_object())
+    return index
+
+
+def autocomplete_goods_added(goods):
+    """
+    Adds a new good to the index, if the app has one.
+    """
+    index = current_app.extensions.get("goods_autocomplete")
+    if index is not None:
+        index.add(goods["id"], goods["name"], goods["count_in_stock"])
+
+
+def autocomplete_goods_updated(old_name, goods):
+    """
+    Re-files an edited good in the index, if the app has one.
+    """
+    index = current_app.extensions.get("goods_autocomplete")
+    if index is not None:
+        index.update(goods["id"], old_name, goods["name"], goods["count_in_stock"])
+
+
+def autocomplete_bulk_changed():
+    """
+    Schedules a rebuild after many goods changed at once.
+    """
+    index = current_app.extensions.get("goods_autocomplete")
+    if index is not None:
+        index.invalidate()
@@ -0,0 +1,174 @@
+"""
+Bulk Goods Import
+=================
+
+Streaming parsers and row validation for ``POST /inventory/bulk``.
+
+The request body is read in chunks and yielded one row at a time, so a large
+catalog is never held in memory as a whole. Rows that cannot be parsed or
+fail validation are reported by their 1-based position and do not stop the
+rows after them.
+"""
+import codecs
+import json
+
+# Bytes read from the request stream per chunk
+READ_CHUNK_SIZE = 64 * 1024
+
+# Largest single array element buffered before the body is rejected
+MAX_ROW_CHARS = 1024 * 1024
+
+# Fields a row may set, with whether the row must provide them
+GOODS_FIELDS = {
+    "id": False,
+    "name": True,
+    "category": True,
+    "price_per_item": True,
+    "description": False,
+    "count_in_stock": True,
+    "reorder_threshold": False,
+}
+
+
+class RowError(ValueError):
+    """A row that could not be parsed or validated."""
+    pass
+
+
+def iter_ndjson(stream):
+    """
+    Yields one parsed object (or a :class:`RowError`) per non-blank line.
+
+    Args:
+        stream (file-like): A binary stream, e.g. ``request.stream``.
+    """
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield RowError(f"Invalid JSON: {e}")
+
+
+def iter_json_array(stream, chunk_size=READ_CHUNK_SIZE):
+    """
+    Yields the elements of a top-level JSON array one at a time.
+
+    Only the element being decoded and the unread remainder of the current
+    chunk are buffered.
+
+    Args:
+        stream (file-like): A binary stream, e.g. ``request.stream``.
+
+    Raises:
+        ValueError: If the body is not a JSON array. Elements already yielded
+            stay yielded.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    pos = 0
+    exhausted = False
+    started = False
+
+    def fill():
+        nonlocal buffer, pos, exhausted
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            exhausted = True
+            buffer = buffer[pos:] + utf8.decode(b"", final=True)
+        else:
+            buffer = buffer[pos:] + utf8.decode(chunk)
+        pos = 0
+
+    while True:
+        # Skip whitespace, and the separating comma once inside the array
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n" + ("," if started else ""):
+                pos += 1
+            if pos < len(buffer) or exhausted:
+                break
+            fill()
+
+        if pos >= len(buffer):
+            raise ValueError("Unexpected end of JSON array")
+        if not started:
+            if buffer[pos] != "[":
+                raise ValueError("Expected a JSON array")
+            started = True
+            pos += 1
+            continue
+        if buffer[pos] == "]":
+            return
+
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            value, end = None, None
+        # A value that ends at the buffer edge may be cut short (e.g. a number)
+        if end is None or (end == len(buffer) and not exhausted):
+            if exhausted or len(buffer) - pos > MAX_ROW_CHARS:
+                raise ValueError("Invalid JSON in array")
+            fill()
+            continue
+        pos = end
+        yield value
+
+
+def validate_goods_row(row):
+    """
+    Checks a parsed row and returns the column values to write.
+
+    Returns:
+        dict: The row's columns, with ``description`` and
+        ``reorder_threshold`` defaulting to None.
+
+    Raises:
+        RowError: If the row is not an object, has unknown or missing fields,
+            or a value has the wrong type or range.
+    """
+    if not isinstance(row, dict):
+        raise RowError("Row must be a JSON object")
+    unknown = sorted(set(row) - set(GOODS_FIELDS))
+    if unknown:
+        raise RowError(f"Unknown fields: {', '.join(unknown)}")
+    missing = [field for field, required in GOODS_FIELDS.items() if required and row.get(field) is None]
+    if missing:
+        raise RowError(f"Missing fields: {', '.join(missing)}")
+
+    goods_id = row.get("id")
+    if goods_id is not None and (not _is_int(goods_id) or goods_id <= 0):
+        raise RowError("id must be a positive integer")
+    for field, max_length in (("name", 100), ("category", 50)):
+        value = row[field]
+        if not isinstance(value, str) or not value.strip() or len(value) > max_length:
+            raise RowError(f"{field} must be a non-empty string of at most {max_length} characters")
+    price = row["price_per_item"]
+    if isinstance(price, bool) or not isinstance(price, (int, float)) or price < 0:
+        raise RowError("price_per_item must be a non-negative number")
+    if not _is_int(row["count_in_stock"]) or row["count_in_stock"] < 0:
+        raise RowError("count_in_stock must be a non-negative integer")
+    description = row.get("description")
+    if description is not None and not isinstance(description, str):
+        raise RowError("description must be a string")
+    reorder_threshold = row.get("reorder_threshold")
+    if reorder_threshold is not None and (not _is_int(reorder_threshold) or reorder_threshold < 0):
+        raise RowError("reorder_threshold must be a non-negative integer")
+
+    values = {
+        "name": row["name"],
+        "category": row["category"],
+        "price_per_item": float(price),
+        "description": description,
+        "count_in_stock": row["count_in_stock"],
+        "reorder_threshold": reorder_threshold,
+    }
+    if goods_id is not None:
+        values["id"] = goods_id
+    return values
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
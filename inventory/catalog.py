@@ -0,0 +1,113 @@
+"""
+Catalog Cache
+=============
+
+Process-wide catalog version and a read-through cache for serialized goods listings.
+
+Every service method that changes goods calls :func:`bump_catalog_version`
+after its commit, which invalidates every cached listing in this process.
+Writes made by other processes cannot bump this counter, so each entry also
+expires after a short TTL.
+
+Listing caches belong to an app (see :func:`get_goods_listing_cache`), so
+apps on different databases in one process never serve each other's goods.
+"""
+import json
+import threading
+import time
+from flask import current_app
+
+_version = 0
+_version_lock = threading.Lock()
+
+
+def catalog_version():
+    """
+    Returns the current catalog version of this process.
+    """
+    return _version
+
+
+def bump_catalog_version():
+    """
+    Marks the catalog as changed, invalidating cached listings.
+    """
+    global _version
+    with _version_lock:
+        _version += 1
+
+
+class CatalogCache:
+    """
+    Read-through cache of pre-encoded JSON payloads tied to the catalog version.
+
+    Entries hold the response body as bytes, so a hit skips both the ORM and
+    JSON encoding.
+
+    Args:
+        ttl (float): Seconds an entry may be served, even if the version did not change.
+    """
+
+    def __init__(self, ttl=30.0):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, builder):
+        """
+        Returns the cached JSON bytes for ``key``, building them on a miss.
+
+        Args:
+            key (hashable): Identifies the listing (e.g. its filters).
+            builder (callable): Returns the JSON-serializable listing.
+
+        Returns:
+            bytes: The encoded listing, as ``jsonify`` would have produced it.
+        """
+        # Read the version before building so a concurrent bump is not lost
+        version = catalog_version()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == version and entry[1] > now:
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        payload = json.dumps(builder(), sort_keys=True, separators=(",", ":")).encode("utf-8") + b"\n"
+        with self._lock:
+            self._entries[key] = (version, now + self.ttl, payload)
+        return payload
+
+    def clear(self):
+        """
+        Removes every entry and resets the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        """
+        Returns the hit/miss counters and current size.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "ttl": self.ttl}
+
+
+def get_goods_listing_cache():
+    """
+    Returns the current app's cache of the serialized ``/sales/goods`` listing.
+
+    The cache is stored in ``app.extensions['goods_listing_cache']`` and
+    created on first use, with entries kept for ``GOODS_LISTING_CACHE_TTL``
+    seconds (default 30).
+    """
+    cache = current_app.extensions.get("goods_listing_cache")
+    if cache is None:
+        cache = CatalogCache(ttl=current_app.config.get("GOODS_LISTING_CACHE_TTL", 30.0))
+        current_app.extensions["goods_listing_cache"] = cache
+    return cache
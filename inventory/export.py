@@ -0,0 +1,80 @@
+"""
+Catalog Export
+==============
+
+Streaming serializers for ``GET /inventory/export``.
+
+Goods are read through a server-side cursor (``yield_per``) and written out
+a batch at a time, so memory use stays flat however large the catalog is.
+The exported fields are those accepted by ``POST /inventory/bulk``, so an
+NDJSON export can be imported again as is.
+"""
+import csv
+import io
+import json
+from sqlalchemy import select
+from database.db_config import db
+from inventory.bulk import GOODS_FIELDS
+from inventory.models import Goods
+
+# Rows fetched from the cursor, and serialized per chunk of output
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_COLUMNS = list(GOODS_FIELDS)
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def iter_goods_batches(batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yields lists of goods rows in ID order, ``batch_size`` rows at a time.
+    """
+    result = db.session.execute(
+        select(*(getattr(Goods, column) for column in EXPORT_COLUMNS))
+        .order_by(Goods.id)
+        .execution_options(yield_per=batch_size)
+    )
+    for partition in result.partitions():
+        yield partition
+
+
+def export_ndjson(batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yields the catalog as NDJSON, one chunk of lines per batch.
+    """
+    for rows in iter_goods_batches(batch_size):
+        yield "".join(json.dumps(dict(zip(EXPORT_COLUMNS, row))) + "\n" for row in rows)
+
+
+def export_csv(batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yields the catalog as CSV with a header row, one chunk of lines per batch.
+
+    Missing values are written as empty cells.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in iter_goods_batches(batch_size):
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_goods(export_format, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Returns the chunk generator and MIME type for an export format.
+
+    Raises:
+        ValueError: If the format is not ``ndjson`` or ``csv``.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Format must be one of: {', '.join(EXPORT_FORMATS)}")
+    serializer = export_ndjson if export_format == "ndjson" else export_csv
+    return serializer(batch_size), EXPORT_FORMATS[export_format]
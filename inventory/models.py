@@ -1,4 +1,6 @@
+from datetime import datetime
 from database.db_config import db
+from utils import load_only_fields
 
 class Goods(db.Model):
     """
@@ -11,8 +13,24 @@ class Goods(db.Model):
         price_per_item (float): Price per item.
         description (str): Description of the item (optional).
         count_in_stock (int): Count of available items in stock.
+        stock_shards (int): Number of :class:`GoodsStockShard` rows holding the
+            stock during a flash sale, or 0 when stock lives in ``count_in_stock``.
+        version (int): Incremented on every change to the row. ORM flushes bump
+            it automatically; bulk UPDATE statements must set ``Goods.version + 1``.
+        reorder_threshold (int): Stock at or below which the good counts as
+            low on stock, or None for no alerts.
+        low_stock (bool): Whether the stock is at or below the threshold.
+            Kept in step with the stock by :func:`inventory.alerts.sync_low_stock`.
     """
     __tablename__ = 'goods'
+    __table_args__ = (
+        # Serve the catalog listing filters: category with a price range or
+        # price sort, and in-stock filtering
+        db.Index('ix_goods_category_price', 'category', 'price_per_item'),
+        db.Index('ix_goods_count_in_stock', 'count_in_stock'),
+        # The low-stock set, read in ID order
+        db.Index('ix_goods_low_stock', 'low_stock', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -20,6 +38,12 @@ class Goods(db.Model):
     price_per_item = db.Column(db.Float, nullable=False)
     description = db.Column(db.Text, nullable=True)
     count_in_stock = db.Column(db.Integer, nullable=False)
+    stock_shards = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    reorder_threshold = db.Column(db.Integer, nullable=True)
+    low_stock = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
+
+    __mapper_args__ = {"version_id_col": version}
 
     def add_stock(self, quantity):
         """Increase the stock of the item."""
@@ -31,13 +55,90 @@ class Goods(db.Model):
             raise ValueError("Insufficient stock to deduct.")
         self.count_in_stock -= quantity
 
+    # Keys of to_dict, in order
+    DICT_FIELDS = ("id", "name", "category", "price_per_item", "description", "count_in_stock",
+                   "flash_sale", "version", "reorder_threshold", "low_stock")
+
+    def to_dict(self, fields=None):
+        """
+        Convert a Goods object to a dictionary.
+
+        Args:
+            fields (iterable, optional): Only these keys of ``DICT_FIELDS``.
+                Only the attributes behind them are read, so goods loaded with
+                :meth:`load_fields` are not fetched again.
+        """
+        values = {}
+        for field in fields or self.DICT_FIELDS:
+            if field == "flash_sale":
+                values[field] = bool(self.stock_shards)
+            elif field == "low_stock":
+                values[field] = bool(self.low_stock)
+            else:
+                values[field] = getattr(self, field)
+        return values
+
+    @classmethod
+    def load_fields(cls, fields, always=()):
+        """
+        Returns a loader option that selects only the columns behind ``fields``.
+        """
+        return load_only_fields(cls, fields, {"flash_sale": "stock_shards"}, always)
+
+
+class GoodsStockShard(db.Model):
+    """
+    One slice of a good's stock while it is in flash-sale mode.
+
+    Splitting a hot good's stock across several rows lets concurrent buyers
+    debit different rows instead of all contending on ``goods.count_in_stock``.
+
+    Attributes:
+        good_id (int): The good the shard belongs to.
+        shard_no (int): The shard's index, from 0 to ``Goods.stock_shards - 1``.
+        count_in_stock (int): Units left in this shard.
+    """
+    __tablename__ = 'goods_stock_shards'
+
+    good_id = db.Column(db.Integer, db.ForeignKey('goods.id'), primary_key=True)
+    shard_no = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    count_in_stock = db.Column(db.Integer, nullable=False)
+
+
+class LowStockAlert(db.Model):
+    """
+    Outbox row recording that a good fell to or below its reorder threshold.
+
+    Written in the same transaction as the stock change when
+    ``LOW_STOCK_OUTBOX`` is enabled, and handed to a notifier in batches by
+    :func:`inventory.alerts.dispatch_low_stock_alerts`.
+
+    Attributes:
+        id (int): The unique ID of the alert.
+        good_id (int): The good that ran low. Links to :class:`Goods`.
+        count_in_stock (int): The stock when it crossed the threshold.
+        reorder_threshold (int): The threshold it crossed.
+        created_at (datetime): When the stock crossed the threshold.
+        dispatched_at (datetime): When the alert was sent, or None while pending.
+    """
+    __tablename__ = 'low_stock_alerts'
+    __table_args__ = (
+        db.Index('ix_low_stock_alerts_pending', 'dispatched_at', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    good_id = db.Column(db.Integer, db.ForeignKey('goods.id'), nullable=False)
+    count_in_stock = db.Column(db.Integer, nullable=False)
+    reorder_threshold = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    dispatched_at = db.Column(db.DateTime, nullable=True)
+
     def to_dict(self):
-        """Convert a Goods object to a dictionary."""
+        """Convert a LowStockAlert object to a dictionary."""
         return {
             "id": self.id,
-            "name": self.name,
-            "category": self.category,
-            "price_per_item": self.price_per_item,
-            "description": self.description,
-            "count_in_stock": self.count_in_stock
-        }
\ No newline at end of file
+            "good_id": self.good_id,
+            "count_in_stock": self.count_in_stock,
+            "reorder_threshold": self.reorder_threshold,
+            "created_at": self.created_at.isoformat(),
+        }
@@ -1,8 +1,18 @@
-from flask import Blueprint, request, jsonify
-from inventory.services import InventoryService, UnauthorizedAccess
+import json
+import click
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from inventory.services import InventoryService, UnauthorizedAccess, VersionConflict
+from inventory.bulk import iter_json_array, iter_ndjson
+from inventory.search import rebuild_search_index
+from inventory.alerts import dispatch_low_stock_alerts
+from inventory.export import export_goods
+from inventory.models import Goods
+from customers.auth import load_principal
+from utils import not_modified, parse_fields
 from sqlalchemy.exc import SQLAlchemyError
 
 inventory_bp = Blueprint('inventory', __name__, url_prefix='/inventory')
+inventory_bp.before_request(load_principal)
 
 
 @inventory_bp.route('/', methods=['POST'])
@@ -18,6 +28,8 @@ def add_goods():
     - price_per_item (float): Price per item.
     - description (str, optional): Description of the goods.
     - count_in_stock (int): Number of items in stock.
+    - reorder_threshold (int, optional): Stock at or below which the goods
+      are reported as low on stock.
 
     Returns:
         JSON response with the created goods details.
@@ -30,7 +42,8 @@ def add_goods():
             category=data['category'],
             price_per_item=data['price_per_item'],
             description=data.get('description'),
-            count_in_stock=data['count_in_stock']
+            count_in_stock=data['count_in_stock'],
+            reorder_threshold=data.get('reorder_threshold')
         )
         return jsonify(goods), 201
     except UnauthorizedAccess as e:
@@ -41,6 +54,187 @@ def add_goods():
         print(f"Unexpected error: {e}")
         return jsonify({"error": "An unexpected error occurred."}), 500
 
+@inventory_bp.route('/bulk', methods=['POST'])
+def bulk_upsert_goods():
+    """
+    API to import or update many goods in one request.
+
+    Requires an Authorization token in the header to identify the user and validate admin privileges.
+
+    Expects either NDJSON (``Content-Type: application/x-ndjson``, one object
+    per line) or a JSON array of objects. Each object has the fields of
+    ``POST /inventory/`` and an optional ``id``; rows with an ``id`` update
+    that good, or create it if it does not exist. The ``count_in_stock`` of a
+    good in a flash sale is left unchanged. The body is parsed as it streams
+    in and written in batches.
+
+    Returns:
+        JSON response with the number of rows received, imported and failed,
+        per-row errors and rows/sec. Invalid rows do not stop the import.
+    """
+    try:
+        InventoryService.require_admin_role(request)
+        if request.mimetype in ("application/x-ndjson", "application/jsonl"):
+            rows = iter_ndjson(request.stream)
+        else:
+            rows = iter_json_array(request.stream)
+        report = InventoryService.bulk_upsert_goods(rows)
+        status = 200 if report["imported"] or not report["failed"] else 400
+        return jsonify(report), status
+    except UnauthorizedAccess as e:
+        return jsonify({"error": str(e)}), 403
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+        return jsonify({"error": "An unexpected error occurred."}), 500
+
+@inventory_bp.route('/stock-adjustments', methods=['POST'])
+def adjust_stock():
+    """
+    API to apply many signed stock changes in one transaction.
+
+    Requires an Authorization token in the header to identify the user and validate admin privileges.
+
+    Expects:
+    - adjustments (list): Objects with ``good_id`` (int) and ``delta`` (int,
+      negative to deduct). At most 10000 lines.
+
+    Returns:
+        JSON response with the number of lines applied and the rejected lines
+        (unknown goods, goods in a flash sale, or deltas that would make the
+        stock negative). Rejected lines do not stop the others.
+    """
+    try:
+        InventoryService.require_admin_role(request)
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or "adjustments" not in data:
+            return jsonify({"error": "Adjustments are required"}), 400
+
+        result = InventoryService.adjust_stock(data["adjustments"])
+        return jsonify(result), 200
+    except UnauthorizedAccess as e:
+        return jsonify({"error": str(e)}), 403
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+        return jsonify({"error": "An unexpected error occurred."}), 500
+
+@inventory_bp.route('/export', methods=['GET'])
+def export_catalog():
+    """
+    API to download the whole catalog.
+
+    The goods are streamed from the database as the response is sent, in ID
+    order, so the catalog is never held in memory as a whole.
+
+    Query Parameters:
+        - format (str, optional): ``ndjson`` (default) or ``csv``.
+
+    Returns:
+        The goods as NDJSON (one object per line, importable through
+        ``POST /inventory/bulk``) or as CSV with a header row.
+    """
+    try:
+        export_format = request.args.get('format', 'ndjson')
+        chunks, mimetype = export_goods(export_format)
+        return Response(
+            stream_with_context(chunks),
+            mimetype=mimetype,
+            headers={"Content-Disposition": f"attachment; filename=goods.{export_format}"}
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+        return jsonify({"error": "An unexpected error occurred."}), 500
+
+@inventory_bp.route('/search', methods=['GET'])
+def search_goods():
+    """
+    API to search goods by words in their name, category and description.
+
+    Query Parameters:
+        - q (str): The search words; every word must match.
+        - limit (int, optional): Page size (default 20, max 100).
+        - page (int, optional): 1-based page number (default 1).
+        - fields (str, optional): Comma-separated goods fields to return, e.g. ``id,name,price_per_item``.
+
+    Returns:
+        JSON response with the ranked ``results`` and ``next_page``, which is
+        null on the last page.
+    """
+    try:
+        query = request.args.get('q', '')
+        limit = _int_arg('limit', InventoryService.DEFAULT_SEARCH_PAGE_SIZE)
+        page = _int_arg('page', 1)
+        fields = parse_fields(request.args.get('fields'), Goods.DICT_FIELDS)
+        results, has_more = InventoryService.search_goods(query, limit, page, fields)
+        return jsonify({"results": results, "page": page, "next_page": page + 1 if has_more else None}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+        return jsonify({"error": "An unexpected error occurred."}), 500
+
+@inventory_bp.route('/autocomplete', methods=['GET'])
+def autocomplete_goods():
+    """
+    API to suggest goods names while the user types.
+
+    Query Parameters:
+        - prefix (str): The start of the name; case is ignored.
+        - limit (int, optional): Number of suggestions (default 10, max 20).
+
+    Returns:
+        JSON response with a list of ``id``, ``name`` and ``count_in_stock``
+        for the matching goods with the most stock.
+    """
+    try:
+        limit = _int_arg('limit', InventoryService.DEFAULT_AUTOCOMPLETE_LIMIT)
+        suggestions = InventoryService.autocomplete(request.args.get('prefix', ''), limit)
+        return jsonify(suggestions), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+        return jsonify({"error": "An unexpected error occurred."}), 500
+
+@inventory_bp.route('/low-stock', methods=['GET'])
+def list_low_stock():
+    """
+    API to list the goods at or below their reorder threshold.
+
+    Requires an Authorization token in the header to identify the user and validate admin privileges.
+
+    Query Parameters:
+        - limit (int, optional): Page size (default 100, max 500).
+        - cursor (str, optional): The ``X-Next-Cursor`` header of the previous page.
+        - fields (str, optional): Comma-separated goods fields to return, e.g. ``id,name,count_in_stock``.
+
+    Returns:
+        JSON response with a list of goods, in ID order. When more goods are
+        low on stock, the ``X-Next-Cursor`` response header holds the cursor
+        for the next page.
+    """
+    try:
+        InventoryService.require_admin_role(request)
+        goods, next_cursor = InventoryService.list_low_stock(
+            limit=_int_arg('limit', InventoryService.DEFAULT_PAGE_SIZE),
+            cursor=request.args.get('cursor'),
+            fields=parse_fields(request.args.get('fields'), Goods.DICT_FIELDS)
+        )
+        response = jsonify(goods)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response, 200
+    except UnauthorizedAccess as e:
+        return jsonify({"error": str(e)}), 403
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+        return jsonify({"error": "An unexpected error occurred."}), 500
+
 @inventory_bp.route('/<int:goods_id>', methods=['PUT'])
 def update_goods(goods_id):
     """
@@ -51,18 +245,26 @@ def update_goods(goods_id):
     Args:
         goods_id (int): ID of the goods to update.
 
-    Expects a JSON payload with the fields to update.
+    Expects a JSON payload with the fields to update. To reject the update if
+    someone else changed the goods first, send the ``ETag`` of the copy being
+    edited in ``If-Match`` or its ``version`` in the payload.
 
     Returns:
-        JSON response with the updated goods details.
+        JSON response with the updated goods details, or 409 with the current
+        version if the goods changed in the meantime.
     """
     try:
         InventoryService.require_admin_role(request)
         data = request.json
-        goods = InventoryService.update_goods(goods_id, data)
-        return jsonify(goods), 200
+        expected_version = _expected_version(goods_id, data)
+        goods = InventoryService.update_goods(goods_id, data, expected_version)
+        response = jsonify(goods)
+        response.set_etag(InventoryService.goods_etag(goods_id, goods["version"]))
+        return response, 200
     except UnauthorizedAccess as e:
         return jsonify({"error": str(e)}), 403
+    except VersionConflict as e:
+        return jsonify({"error": str(e), "current_version": e.current_version}), 409
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
     except Exception as e:
@@ -75,6 +277,10 @@ def get_goods(goods_id):
     """
     API to retrieve goods by ID.
 
+    Supports conditional requests: the response carries an ``ETag`` derived
+    from the good's version, and a request whose ``If-None-Match`` matches it
+    gets an empty ``304`` without the good being loaded or serialized.
+
     Args:
         goods_id (int): ID of the goods.
 
@@ -82,8 +288,15 @@ def get_goods(goods_id):
         JSON response with the goods details.
     """
     try:
+        etag = InventoryService.get_goods_etag(goods_id)
+        if etag:
+            cached = not_modified(etag)
+            if cached:
+                return cached
         goods = InventoryService.get_goods_by_id(goods_id)
-        return jsonify(goods), 200
+        response = jsonify(goods)
+        response.set_etag(InventoryService.goods_etag(goods_id, goods["version"]))
+        return response, 200
     except ValueError as e:
         return jsonify({"error": str(e)}), 404
     except Exception as e:
@@ -94,19 +307,89 @@ def get_goods(goods_id):
 @inventory_bp.route('/', methods=['GET'])
 def get_all_goods():
     """
-    API to retrieve all goods from the inventory.
+    API to retrieve one page of goods from the inventory.
+
+    Query Parameters:
+        - category (str, optional): Only goods in this category.
+        - min_price (float, optional): Lowest price per item.
+        - max_price (float, optional): Highest price per item.
+        - in_stock (bool, optional): ``true`` for goods with stock, ``false`` for sold-out goods.
+        - sort (str, optional): ``id`` (default), ``price`` or ``name``; prefix with ``-`` for descending.
+        - limit (int, optional): Page size (default 100, max 500).
+        - cursor (str, optional): The ``X-Next-Cursor`` header of the previous page.
+        - fields (str, optional): Comma-separated goods fields to return, e.g.
+          ``id,name,price_per_item``. Only those columns are read from the database.
 
     Returns:
-        JSON response with a list of all goods.
+        JSON response with a list of goods. When more goods match, the
+        ``X-Next-Cursor`` response header holds the cursor for the next page.
     """
     try:
-        goods = InventoryService.get_all_goods()
-        return jsonify(goods), 200
+        args = request.args
+        in_stock = args.get('in_stock')
+        if in_stock is not None:
+            if in_stock.lower() not in ("true", "false", "1", "0"):
+                return jsonify({"error": "in_stock must be true or false"}), 400
+            in_stock = in_stock.lower() in ("true", "1")
+        goods, next_cursor = InventoryService.list_goods(
+            category=args.get('category'),
+            min_price=_float_arg('min_price'),
+            max_price=_float_arg('max_price'),
+            in_stock=in_stock,
+            sort=args.get('sort', 'id'),
+            limit=_int_arg('limit', InventoryService.DEFAULT_PAGE_SIZE),
+            cursor=args.get('cursor'),
+            fields=parse_fields(args.get('fields'), Goods.DICT_FIELDS)
+        )
+        response = jsonify(goods)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response, 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print(f"Unexpected error: {e}")
         return jsonify({"error": "An unexpected error occurred."}), 500
 
 
+def _expected_version(goods_id, data):
+    """
+    Reads the version a write is based on from ``If-Match`` or the payload's ``version``.
+
+    The ``version`` key is removed from the payload. Returns None if neither is
+    given. ``If-Match: *`` matches any existing good, so it sets no version.
+    """
+    version = data.pop("version", None) if isinstance(data, dict) else None
+    if request.headers.get('If-Match') and not request.if_match.star_tag:
+        tags = request.if_match.as_set()
+        if len(tags) != 1:
+            raise ValueError("If-Match must name exactly one ETag")
+        return InventoryService.version_from_etag(goods_id, tags.pop())
+    if version is not None and (not isinstance(version, int) or isinstance(version, bool)):
+        raise ValueError("Version must be an integer")
+    return version
+
+
+def _float_arg(name):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number")
+
+
+def _int_arg(name, default):
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+
+
 @inventory_bp.route('/<int:goods_id>/deduct', methods=['POST'])
 def deduct_goods_stock(goods_id):
     """
@@ -119,9 +402,12 @@ def deduct_goods_stock(goods_id):
 
     Expects:
     - quantity (int): Number of items to deduct.
+    - version (int, optional): Only deduct if the goods are still at this
+      version; ``If-Match`` with the goods' ETag does the same.
 
     Returns:
-        JSON response with the updated goods details.
+        JSON response with the updated goods details, or 409 with the current
+        version if a version was given and the goods changed since.
     """
     try:
         InventoryService.require_admin_role(request)
@@ -133,10 +419,12 @@ def deduct_goods_stock(goods_id):
         if quantity <= 0:
             return jsonify({"error": "Quantity must be a positive integer"}), 400
 
-        goods = InventoryService.deduct_goods(goods_id, quantity)
+        goods = InventoryService.deduct_goods(goods_id, quantity, _expected_version(goods_id, data))
         return jsonify({"message": f"Successfully deducted {quantity} from stock.", "updated_stock": goods}), 200
     except UnauthorizedAccess as e:
         return jsonify({"error": str(e)}), 403
+    except VersionConflict as e:
+        return jsonify({"error": str(e), "current_version": e.current_version}), 409
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
     except SQLAlchemyError as e:
@@ -144,3 +432,82 @@ def deduct_goods_stock(goods_id):
     except Exception as e:
         print(f"Unexpected error: {e}")
         return jsonify({"error": "An unexpected error occurred."}), 500
+
+
+@inventory_bp.route('/<int:goods_id>/flash-sale', methods=['POST'])
+def start_flash_sale(goods_id):
+    """
+    API to put a good into flash-sale mode.
+
+    Requires an Authorization token in the header to identify the user and validate admin privileges.
+
+    Args:
+        goods_id (int): ID of the goods.
+
+    Expects:
+    - shards (int, optional): Number of stock sub-counters to split the stock across (default 8).
+
+    Returns:
+        JSON response with the updated goods details.
+    """
+    try:
+        InventoryService.require_admin_role(request)
+        data = request.get_json(silent=True) or {}
+        goods = InventoryService.start_flash_sale(goods_id, data.get("shards", 8))
+        return jsonify(goods), 200
+    except UnauthorizedAccess as e:
+        return jsonify({"error": str(e)}), 403
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+        return jsonify({"error": "An unexpected error occurred."}), 500
+
+
+@inventory_bp.route('/<int:goods_id>/flash-sale', methods=['DELETE'])
+def end_flash_sale(goods_id):
+    """
+    API to end a good's flash sale and fold its remaining stock back.
+
+    Requires an Authorization token in the header to identify the user and validate admin privileges.
+
+    Args:
+        goods_id (int): ID of the goods.
+
+    Returns:
+        JSON response with the updated goods details.
+    """
+    try:
+        InventoryService.require_admin_role(request)
+        goods = InventoryService.end_flash_sale(goods_id)
+        return jsonify(goods), 200
+    except UnauthorizedAccess as e:
+        return jsonify({"error": str(e)}), 403
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+        return jsonify({"error": "An unexpected error occurred."}), 500
+
+
+@inventory_bp.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """
+    Create missing search tables or indexes and re-index every good.
+    """
+    backend = rebuild_search_index()
+    click.echo(f"Search index rebuilt ({backend}).")
+
+
+@inventory_bp.cli.command('dispatch-low-stock-alerts')
+@click.option('--batch-size', default=100, show_default=True, help='Alerts sent per batch.')
+def dispatch_low_stock_alerts_command(batch_size):
+    """
+    Print pending low-stock alerts as JSON lines and mark them dispatched.
+    """
+    def send(alerts):
+        for alert in alerts:
+            click.echo(json.dumps(alert))
+
+    dispatched = dispatch_low_stock_alerts(send, batch_size)
+    click.echo(f"Dispatched {dispatched} low-stock alerts.", err=True)
@@ -0,0 +1,297 @@
+"""
+Goods Search
+============
+
+Ranked full-text search over ``Goods.name``, ``Goods.description`` and
+``Goods.category``.
+
+One of three backends serves each app, picked from the database:
+
+- SQLite: an FTS5 table (``goods_fts``) using ``goods`` as external content,
+  kept in sync by triggers, ranked with ``bm25``.
+- MySQL: a ``FULLTEXT`` index on the three columns, queried in boolean mode.
+- Anything else (or ``GOODS_SEARCH_BACKEND = "memory"``): an in-process
+  inverted index, built on first use and updated incrementally as goods are
+  added or edited through :class:`inventory.services.InventoryService`.
+
+The FTS5 table, its triggers and the FULLTEXT index are created together with
+the ``goods`` table. Databases created before search existed can be brought up
+to date with ``flask inventory rebuild-search-index``.
+
+Every backend matches goods that contain all query words. FTS5 and the
+in-memory index weight each column by :data:`FIELD_WEIGHTS`, ranking name
+matches above category matches above description matches. MySQL ranks by
+the relevance of one ``MATCH`` over the three columns together, which does
+not tell the columns apart; weighting them would need a FULLTEXT index per
+column.
+"""
+import heapq
+import math
+import re
+import threading
+from flask import current_app
+from sqlalchemy import DDL, event, select, text
+from database.db_config import db
+from inventory.models import Goods
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Relative weight of a match in each column
+FIELD_WEIGHTS = {"name": 3.0, "category": 2.0, "description": 1.0}
+
+SQLITE_SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS goods_fts USING fts5("
+    "name, description, category, content='goods', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS goods_fts_insert AFTER INSERT ON goods BEGIN "
+    "INSERT INTO goods_fts(rowid, name, description, category) "
+    "VALUES (new.id, new.name, new.description, new.category); END",
+    "CREATE TRIGGER IF NOT EXISTS goods_fts_delete AFTER DELETE ON goods BEGIN "
+    "INSERT INTO goods_fts(goods_fts, rowid, name, description, category) "
+    "VALUES ('delete', old.id, old.name, old.description, old.category); END",
+    # Stock changes do not touch the text columns, so they skip this trigger
+    "CREATE TRIGGER IF NOT EXISTS goods_fts_update AFTER UPDATE OF name, description, category ON goods BEGIN "
+    "INSERT INTO goods_fts(goods_fts, rowid, name, description, category) "
+    "VALUES ('delete', old.id, old.name, old.description, old.category); "
+    "INSERT INTO goods_fts(rowid, name, description, category) "
+    "VALUES (new.id, new.name, new.description, new.category); END",
+]
+MYSQL_SCHEMA = ["ALTER TABLE goods ADD FULLTEXT INDEX ft_goods_text (name, description, category)"]
+
+for statement in SQLITE_SCHEMA:
+    event.listen(Goods.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+for statement in MYSQL_SCHEMA:
+    event.listen(Goods.__table__, "after_create", DDL(statement).execute_if(dialect="mysql"))
+event.listen(Goods.__table__, "before_drop", DDL("DROP TABLE IF EXISTS goods_fts").execute_if(dialect="sqlite"))
+
+
+def tokenize(value):
+    """
+    Splits text into lowercase words.
+    """
+    return WORD_RE.findall(value.lower()) if value else []
+
+
+class Fts5Search:
+    """
+    Search backed by the SQLite ``goods_fts`` table.
+    """
+
+    name = "fts5"
+
+    def search(self, words, limit, offset):
+        match = " ".join(f'"{word}"' for word in words)
+        weights = ", ".join(str(FIELD_WEIGHTS[f]) for f in ("name", "description", "category"))
+        rows = db.session.execute(
+            text(f"SELECT rowid FROM goods_fts WHERE goods_fts MATCH :match "
+                 f"ORDER BY bm25(goods_fts, {weights}), rowid LIMIT :limit OFFSET :offset"),
+            {"match": match, "limit": limit, "offset": offset}
+        )
+        return [row[0] for row in rows]
+
+    def index_goods(self, goods):
+        pass
+
+    def invalidate(self):
+        pass
+
+
+class MySQLFulltextSearch:
+    """
+    Search backed by the MySQL ``ft_goods_text`` FULLTEXT index.
+
+    Ranked by MySQL's relevance over name, description and category as one
+    text; :data:`FIELD_WEIGHTS` does not apply.
+    """
+
+    name = "mysql_fulltext"
+
+    def search(self, words, limit, offset):
+        against = " ".join(f"+{word}" for word in words)
+        score = "MATCH(name, description, category) AGAINST (:against IN BOOLEAN MODE)"
+        rows = db.session.execute(
+            text(f"SELECT id FROM goods WHERE {score} ORDER BY {score} DESC, id LIMIT :limit OFFSET :offset"),
+            {"against": against, "limit": limit, "offset": offset}
+        )
+        return [row[0] for row in rows]
+
+    def index_goods(self, goods):
+        pass
+
+    def invalidate(self):
+        pass
+
+
+class InMemorySearch:
+    """
+    In-process inverted index over the goods text columns.
+
+    Postings map each word to ``{goods_id: weight}``, where the weight sums
+    :data:`FIELD_WEIGHTS` over the columns the word appears in. Queries
+    intersect the postings of every word, starting from the rarest, and rank
+    by weight times inverse document frequency.
+
+    The index is built from the database on first search and after
+    :meth:`invalidate`; single goods are re-indexed in place by
+    :meth:`index_goods`.
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self._postings = {}
+        self._doc_words = {}
+        self._built = False
+        self._lock = threading.Lock()
+
+    def search(self, words, limit, offset):
+        if not self._built:
+            self.build()
+        with self._lock:
+            postings = [self._postings.get(word) for word in set(words)]
+            if not all(postings):
+                return []
+            postings.sort(key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+            total = len(self._doc_words)
+            idf = [math.log(1.0 + total / len(p)) for p in postings]
+            scored = [
+                (-sum(p[goods_id] * w for p, w in zip(postings, idf)), goods_id)
+                for goods_id in candidates
+            ]
+        return [goods_id for _, goods_id in heapq.nsmallest(offset + limit, scored)][offset:]
+
+    def build(self):
+        """
+        Rebuilds the index from the ``goods`` table.
+        """
+        rows = db.session.execute(
+            select(Goods.id, Goods.name, Goods.description, Goods.category).execution_options(yield_per=5000)
+        )
+        with self._lock:
+            self._postings = {}
+            self._doc_words = {}
+            for row in rows:
+                self._add(row.id, row.name, row.description, row.category)
+            self._built = True
+
+    def index_goods(self, goods):
+        """
+        Adds or replaces one good in the index.
+
+        Args:
+            goods (dict): The good as returned by ``Goods.to_dict``.
+        """
+        if not self._built:
+            return
+        with self._lock:
+            self._remove(goods["id"])
+            self._add(goods["id"], goods["name"], goods["description"], goods["category"])
+
+    def invalidate(self):
+        """
+        Forces a rebuild before the next search, e.g. after a bulk import.
+        """
+        with self._lock:
+            self._built = False
+
+    def _add(self, goods_id, name, description, category):
+        weights = {}
+        for field, value in (("name", name), ("description", description), ("category", category)):
+            for word in set(tokenize(value)):
+                weights[word] = weights.get(word, 0.0) + FIELD_WEIGHTS[field]
+        for word, weight in weights.items():
+            self._postings.setdefault(word, {})[goods_id] = weight
+        self._doc_words[goods_id] = list(weights)
+
+    def _remove(self, goods_id):
+        for word in self._doc_words.pop(goods_id, ()):
+            posting = self._postings.get(word)
+            if posting is not None:
+                posting.pop(goods_id, None)
+                if not posting:
+                    del self._postings[word]
+
+
+def get_search_backend():
+    """
+    Returns the current app's search backend, choosing it on first use.
+    """
+    backend = current_app.extensions.get("goods_search")
+    if backend is None:
+        backend = _detect_backend()
+        current_app.extensions["goods_search"] = backend
+    return backend
+
+
+def _detect_backend():
+    if current_app.config.get("GOODS_SEARCH_BACKEND") == "memory":
+        return InMemorySearch()
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "sqlite":
+        found = db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'goods_fts'")
+        ).first()
+        if found:
+            return Fts5Search()
+    elif dialect == "mysql":
+        found = db.session.execute(
+            text("SELECT 1 FROM information_schema.statistics WHERE table_schema = DATABASE() "
+                 "AND table_name = 'goods' AND index_name = 'ft_goods_text' LIMIT 1")
+        ).first()
+        if found:
+            return MySQLFulltextSearch()
+    return InMemorySearch()
+
+
+def search_goods_ids(query, limit, offset):
+    """
+    Returns the IDs of the goods matching ``query``, best match first.
+
+    Raises:
+        ValueError: If the query contains no words.
+    """
+    words = tokenize(query)
+    if not words:
+        raise ValueError("Search query must contain at least one word")
+    return get_search_backend().search(words, limit, offset)
+
+
+def goods_changed(goods):
+    """
+    Re-indexes a good after it was added or edited; a no-op for database-backed search.
+    """
+    get_search_backend().index_goods(goods)
+
+
+def goods_bulk_changed():
+    """
+    Tells the in-process index that many goods changed at once.
+    """
+    get_search_backend().invalidate()
+
+
+def rebuild_search_index():
+    """
+    Creates any missing search schema and re-indexes every good.
+
+    Returns:
+        str: The name of the backend now serving searches.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "sqlite" and current_app.config.get("GOODS_SEARCH_BACKEND") != "memory":
+        for statement in SQLITE_SCHEMA:
+            db.session.execute(text(statement))
+        db.session.execute(text("INSERT INTO goods_fts(goods_fts) VALUES ('rebuild')"))
+        db.session.commit()
+    elif dialect == "mysql" and current_app.config.get("GOODS_SEARCH_BACKEND") != "memory":
+        current_app.extensions.pop("goods_search", None)
+        if not isinstance(get_search_backend(), MySQLFulltextSearch):
+            for statement in MYSQL_SCHEMA:
+                db.session.execute(text(statement))
+            db.session.commit()
+
+    current_app.extensions.pop("goods_search", None)
+    backend = get_search_backend()
+    if isinstance(backend, InMemorySearch):
+        backend.build()
+    return backend.name
@@ -1,10 +1,20 @@
-from flask import jsonify
-import jwt
+from flask import g, jsonify
+import time
 from sqlalchemy.exc import SQLAlchemyError
-from customers.models import Customer
-from utils import decode_token
-from inventory.models import Goods
+from sqlalchemy.orm.exc import StaleDataError
+from customers.auth import current_principal
+from utils import decode_cursor, encode_cursor
+from sqlalchemy import and_, case, delete, insert, or_, select, update
+from inventory.models import Goods, GoodsStockShard
+from inventory.alerts import is_low_stock, sync_low_stock
+from inventory.catalog import bump_catalog_version
+from inventory.bulk import RowError, validate_goods_row
+from inventory.search import goods_bulk_changed, goods_changed, search_goods_ids
+from inventory.autocomplete import (
+    autocomplete_bulk_changed, autocomplete_goods_added, autocomplete_goods_updated, get_autocomplete_index
+)
 from database.db_config import db
+from database.upsert import upsert_statement
 
 
 class InventoryService:
@@ -12,8 +22,22 @@ class InventoryService:
     Service layer for managing inventory operations.
     """
 
+    MAX_STOCK_SHARDS = 64
+    BULK_BATCH_SIZE = 1000
+    MAX_REPORTED_ERRORS = 1000
+    MAX_STOCK_ADJUSTMENTS = 10000
+    STOCK_ADJUSTMENT_CHUNK_SIZE = 500
+    DEFAULT_PAGE_SIZE = 100
+    MAX_PAGE_SIZE = 500
+    SORT_COLUMNS = {"id": Goods.id, "price": Goods.price_per_item, "name": Goods.name}
+    DEFAULT_SEARCH_PAGE_SIZE = 20
+    MAX_SEARCH_PAGE_SIZE = 100
+    MAX_SEARCH_RESULTS = 1000
+    DEFAULT_AUTOCOMPLETE_LIMIT = 10
+    UPDATABLE_FIELDS = ("name", "category", "price_per_item", "description", "count_in_stock", "reorder_threshold")
+
     @staticmethod
-    def add_goods(name, category, price_per_item, description, count_in_stock):
+    def add_goods(name, category, price_per_item, description, count_in_stock, reorder_threshold=None):
         """
         Add new goods to the inventory.
         """
@@ -22,41 +46,193 @@ class InventoryService:
             category=category,
             price_per_item=price_per_item,
             description=description,
-            count_in_stock=count_in_stock
+            count_in_stock=count_in_stock,
+            reorder_threshold=reorder_threshold
         )
         db.session.add(goods)
         try:
+            db.session.flush()
+            sync_low_stock([goods.id])
             db.session.commit()
-            return goods.to_dict()
+            bump_catalog_version()
+            goods_dict = goods.to_dict()
+            goods_changed(goods_dict)
+            autocomplete_goods_added(goods_dict)
+            return goods_dict
         except SQLAlchemyError as e:
             db.session.rollback()
             raise ValueError(f"Failed to add goods: {e}")
 
     @staticmethod
-    def update_goods(goods_id, updates):
+    def bulk_upsert_goods(rows, batch_size=BULK_BATCH_SIZE):
+        """
+        Inserts or updates goods from an iterable of parsed rows, in batches.
+
+        Rows with an ``id`` are upserted on it (``INSERT ... ON DUPLICATE KEY
+        UPDATE`` on MySQL, ``ON CONFLICT DO UPDATE`` on SQLite); rows without
+        one are inserted. Each batch is written with one executemany per kind
+        and committed on its own. Invalid rows are reported and skipped, and a
+        batch the database rejects is retried row by row so only the offending
+        rows fail.
+
+        Args:
+            rows (iterable): Parsed rows, or :class:`inventory.bulk.RowError`
+                instances for rows that could not be parsed.
+            batch_size (int): Rows written per transaction.
+
+        Returns:
+            dict: Counts of received, imported and failed rows, the per-row
+            errors (at most ``MAX_REPORTED_ERRORS``), and rows/sec.
+        """
+        started = time.perf_counter()
+        report = {"received": 0, "imported": 0, "failed": 0, "errors": []}
+
+        def fail(row_no, message):
+            report["failed"] += 1
+            if len(report["errors"]) < InventoryService.MAX_REPORTED_ERRORS:
+                report["errors"].append({"row": row_no, "error": message})
+
+        batch = []
+        try:
+            for row in rows:
+                report["received"] += 1
+                try:
+                    if isinstance(row, RowError):
+                        raise row
+                    batch.append((report["received"], validate_goods_row(row)))
+                except RowError as e:
+                    fail(report["received"], str(e))
+                if len(batch) >= batch_size:
+                    report["imported"] += InventoryService._write_goods_batch(batch, fail)
+                    batch = []
+        except ValueError as e:
+            # The body itself is malformed; keep what was parsed before it
+            fail(report["received"] + 1, str(e))
+        if batch:
+            report["imported"] += InventoryService._write_goods_batch(batch, fail)
+
+        if report["imported"]:
+            bump_catalog_version()
+            goods_bulk_changed()
+            autocomplete_bulk_changed()
+        elapsed = time.perf_counter() - started
+        report["seconds"] = round(elapsed, 3)
+        report["rows_per_sec"] = round(report["received"] / elapsed, 1) if elapsed else 0.0
+        return report
+
+    @staticmethod
+    def _write_goods_batch(batch, fail):
+        """
+        Writes one batch of validated rows and commits it.
+
+        Returns:
+            int: The number of rows written.
+        """
+        try:
+            InventoryService._execute_goods_upsert([values for _, values in batch])
+            db.session.commit()
+            return len(batch)
+        except SQLAlchemyError:
+            db.session.rollback()
+
+        # Isolate the rows the database rejects
+        written = 0
+        for row_no, values in batch:
+            try:
+                InventoryService._execute_goods_upsert([values])
+                db.session.commit()
+                written += 1
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                fail(row_no, f"Failed to write row: {e.__class__.__name__}")
+        return written
+
+    @staticmethod
+    def _execute_goods_upsert(rows):
+        """
+        Upserts rows that carry an ``id`` and inserts the rest, without committing.
+
+        Goods in a flash sale keep their stock in :class:`GoodsStockShard`
+        rows, so an upsert leaves their ``count_in_stock`` alone.
+        """
+        keyed = [values for values in rows if "id" in values]
+        new = [values for values in rows if "id" not in values]
+        if keyed:
+            table = Goods.__table__
+            db.session.execute(
+                upsert_statement(table, ["id"], lambda proposed: dict(
+                    {column: getattr(proposed, column)
+                     for column in ("name", "category", "price_per_item", "description", "reorder_threshold")},
+                    count_in_stock=case(
+                        (table.c.stock_shards == 0, proposed.count_in_stock), else_=table.c.count_in_stock
+                    ),
+                    version=table.c.version + 1
+                )),
+                keyed
+            )
+            sync_low_stock([values["id"] for values in keyed])
+        if new:
+            for values in new:
+                values["low_stock"] = is_low_stock(values["count_in_stock"], values["reorder_threshold"])
+            db.session.execute(insert(Goods), new)
+
+    @staticmethod
+    def update_goods(goods_id, updates, expected_version=None):
         """
         Update fields of a specific goods item.
+
+        With ``expected_version`` the change is a single
+        ``UPDATE ... WHERE id = :id AND version = :version``, so an edit based
+        on an outdated copy fails instead of overwriting a concurrent one.
+        Without it the last write wins, as before; a change that lands
+        between this method's read and write still raises
+        :class:`VersionConflict`.
+
+        Raises:
+            ValueError: If the goods do not exist or the update fails.
+            VersionConflict: If the goods changed since ``expected_version``.
         """
+        if expected_version is not None:
+            return InventoryService._update_goods_if_version(goods_id, updates, expected_version)
+
         goods = Goods.query.get(goods_id)
         if not goods:
             raise ValueError("Goods not found.")
 
+        old_name = goods.name
         for key, value in updates.items():
-            if hasattr(goods, key):
+            if key in InventoryService.UPDATABLE_FIELDS:
                 setattr(goods, key, value)
 
         try:
+            db.session.flush()
+            sync_low_stock([goods_id])
             db.session.commit()
-            return goods.to_dict()
+        except StaleDataError:
+            db.session.rollback()
+            raise VersionConflict(goods_id, InventoryService._current_version(goods_id))
         except SQLAlchemyError as e:
             db.session.rollback()
             raise ValueError(f"Failed to update goods: {e}")
+        return InventoryService._goods_updated(goods, old_name)
 
     @staticmethod
-    def deduct_goods(goods_id, quantity):
+    def deduct_goods(goods_id, quantity, expected_version=None):
         """
         Deduct items from inventory.
+
+        With ``expected_version`` the deduction is a single guarded UPDATE
+        that also requires the version to match, so a high-rate writer can
+        re-read and retry on :class:`VersionConflict` instead of holding a
+        row lock.
+
+        Raises:
+            ValueError: If the goods do not exist or the stock is insufficient.
+            VersionConflict: If the goods changed since ``expected_version``.
         """
+        if expected_version is not None:
+            return InventoryService._deduct_goods_if_version(goods_id, quantity, expected_version)
+
         goods = Goods.query.get(goods_id)
         if not goods:
             raise ValueError("Goods not found.")
@@ -66,14 +242,284 @@ class InventoryService:
 
         try:
             goods.deduct_stock(quantity)
+            db.session.flush()
+            sync_low_stock([goods_id])
             db.session.commit()
+            bump_catalog_version()
             return goods.to_dict()
         except ValueError as e:
             raise ValueError(f"Error deducting goods: {e}")
+        except StaleDataError:
+            db.session.rollback()
+            raise VersionConflict(goods_id, InventoryService._current_version(goods_id))
         except SQLAlchemyError as e:
             db.session.rollback()
             raise ValueError(f"Failed to deduct goods: {e}")
 
+    @staticmethod
+    def _update_goods_if_version(goods_id, updates, expected_version):
+        """
+        Applies ``updates`` only if the goods are still at ``expected_version``.
+        """
+        values = {key: value for key, value in updates.items() if key in InventoryService.UPDATABLE_FIELDS}
+        # The name is read at the expected version for the autocomplete index
+        row = db.session.execute(select(Goods.name, Goods.version).where(Goods.id == goods_id)).first()
+        if not row:
+            raise ValueError("Goods not found.")
+        if row.version != expected_version:
+            raise VersionConflict(goods_id, row.version)
+
+        try:
+            result = db.session.execute(
+                update(Goods)
+                .where(Goods.id == goods_id, Goods.version == expected_version)
+                .values(version=Goods.version + 1, **values)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount != 1:
+                db.session.rollback()
+                raise VersionConflict(goods_id, InventoryService._current_version(goods_id))
+            sync_low_stock([goods_id])
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            raise ValueError(f"Failed to update goods: {e}")
+        goods = db.session.get(Goods, goods_id, populate_existing=True)
+        return InventoryService._goods_updated(goods, row.name)
+
+    @staticmethod
+    def _deduct_goods_if_version(goods_id, quantity, expected_version):
+        """
+        Deducts ``quantity`` only if the goods are still at ``expected_version``.
+        """
+        try:
+            result = db.session.execute(
+                update(Goods)
+                .where(Goods.id == goods_id, Goods.version == expected_version,
+                       Goods.stock_shards == 0, Goods.count_in_stock >= quantity)
+                .values(count_in_stock=Goods.count_in_stock - quantity, version=Goods.version + 1)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 1:
+                sync_low_stock([goods_id])
+                db.session.commit()
+                bump_catalog_version()
+                return db.session.get(Goods, goods_id, populate_existing=True).to_dict()
+            db.session.rollback()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            raise ValueError(f"Failed to deduct goods: {e}")
+
+        # Work out which guard failed
+        row = db.session.execute(
+            select(Goods.version, Goods.count_in_stock, Goods.stock_shards).where(Goods.id == goods_id)
+        ).first()
+        if not row:
+            raise ValueError("Goods not found.")
+        if row.version != expected_version:
+            raise VersionConflict(goods_id, row.version)
+        if row.stock_shards:
+            raise ValueError("Stock is held in a flash sale.")
+        raise ValueError("Insufficient stock available")
+
+    @staticmethod
+    def _goods_updated(goods, old_name):
+        """
+        Invalidates caches and indexes after a committed edit and returns the goods.
+        """
+        bump_catalog_version()
+        goods_dict = goods.to_dict()
+        goods_changed(goods_dict)
+        autocomplete_goods_updated(old_name, goods_dict)
+        return goods_dict
+
+    @staticmethod
+    def _current_version(goods_id):
+        return db.session.execute(select(Goods.version).where(Goods.id == goods_id)).scalar()
+
+    @staticmethod
+    def adjust_stock(adjustments):
+        """
+        Applies signed stock deltas to many goods in one transaction.
+
+        Lines for the same good are summed first. The goods are locked with
+        ``SELECT ... FOR UPDATE`` in chunks, and every accepted good in a chunk
+        is changed by one ``UPDATE ... CASE`` whose WHERE clause also refuses
+        to take stock below zero. A good that is missing, in a flash sale or
+        whose net delta would make its stock negative is rejected, along with
+        every line for it; the other lines are still applied.
+
+        Args:
+            adjustments (list): Objects with ``good_id`` (int) and ``delta`` (int).
+
+        Returns:
+            dict: The number of lines applied and goods updated, and the
+            rejected lines with their 1-based position and reason.
+
+        Raises:
+            ValueError: If the payload is not a list, is too long, or the stock
+                changed underneath the update.
+        """
+        if not isinstance(adjustments, list) or not adjustments:
+            raise ValueError("Adjustments must be a non-empty list")
+        if len(adjustments) > InventoryService.MAX_STOCK_ADJUSTMENTS:
+            raise ValueError(f"At most {InventoryService.MAX_STOCK_ADJUSTMENTS} adjustments per request")
+
+        rejected = []
+        deltas = {}
+        lines = {}
+        for line_no, line in enumerate(adjustments, start=1):
+            good_id = line.get("good_id") if isinstance(line, dict) else None
+            delta = line.get("delta") if isinstance(line, dict) else None
+            if not isinstance(good_id, int) or isinstance(good_id, bool) or good_id <= 0 \
+                    or not isinstance(delta, int) or isinstance(delta, bool):
+                rejected.append({"line": line_no, "good_id": good_id,
+                                 "error": "good_id must be a positive integer and delta an integer"})
+                continue
+            deltas[good_id] = deltas.get(good_id, 0) + delta
+            lines.setdefault(good_id, []).append(line_no)
+
+        def reject(good_id, message):
+            for line_no in lines.pop(good_id):
+                rejected.append({"line": line_no, "good_id": good_id, "error": message})
+
+        goods_ids = sorted(deltas)
+        chunk_size = InventoryService.STOCK_ADJUSTMENT_CHUNK_SIZE
+        updated = 0
+        try:
+            for start in range(0, len(goods_ids), chunk_size):
+                chunk = goods_ids[start:start + chunk_size]
+                current = {
+                    row.id: row for row in db.session.execute(
+                        select(Goods.id, Goods.count_in_stock, Goods.stock_shards)
+                        .where(Goods.id.in_(chunk))
+                        .with_for_update()
+                    )
+                }
+                accepted = {}
+                for good_id in chunk:
+                    row = current.get(good_id)
+                    if row is None:
+                        reject(good_id, "Goods not found.")
+                    elif row.stock_shards:
+                        reject(good_id, "Stock is held in a flash sale.")
+                    elif row.count_in_stock + deltas[good_id] < 0:
+                        reject(good_id, "Insufficient stock available")
+                    elif deltas[good_id]:
+                        accepted[good_id] = deltas[good_id]
+                if not accepted:
+                    continue
+
+                delta = case(accepted, value=Goods.id, else_=0)
+                result = db.session.execute(
+                    update(Goods)
+                    .where(Goods.id.in_(list(accepted)), Goods.stock_shards == 0,
+                           Goods.count_in_stock + delta >= 0)
+                    .values(count_in_stock=Goods.count_in_stock + delta, version=Goods.version + 1)
+                    .execution_options(synchronize_session=False)
+                )
+                if result.rowcount != len(accepted):
+                    raise ValueError("Stock changed during the adjustment, please retry.")
+                sync_low_stock(accepted)
+                updated += len(accepted)
+            db.session.commit()
+        except ValueError:
+            db.session.rollback()
+            raise
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            raise ValueError(f"Failed to adjust stock: {e}")
+
+        if updated:
+            bump_catalog_version()
+        rejected.sort(key=lambda item: item["line"])
+        return {
+            "applied": sum(len(line_nos) for line_nos in lines.values()),
+            "goods_updated": updated,
+            "rejected": rejected,
+        }
+
+    @staticmethod
+    def start_flash_sale(goods_id, shards):
+        """
+        Moves a good's stock into ``shards`` sub-counter rows for a flash sale.
+
+        While the sale runs, purchases debit a random shard instead of the
+        single ``goods.count_in_stock`` row, which stays at 0.
+        """
+        if not isinstance(shards, int) or not 1 <= shards <= InventoryService.MAX_STOCK_SHARDS:
+            raise ValueError(f"Shards must be an integer between 1 and {InventoryService.MAX_STOCK_SHARDS}")
+
+        goods = Goods.query.get(goods_id)
+        if not goods:
+            raise ValueError("Goods not found.")
+        if goods.stock_shards:
+            raise ValueError("Flash sale already running.")
+
+        stock = goods.count_in_stock
+        base, extra = divmod(stock, shards)
+        try:
+            # Only switch if the stock did not change since it was read
+            result = db.session.execute(
+                update(Goods)
+                .where(Goods.id == goods_id, Goods.stock_shards == 0, Goods.count_in_stock == stock)
+                .values(count_in_stock=0, stock_shards=shards, version=Goods.version + 1)
+            )
+            if result.rowcount != 1:
+                raise ValueError("Goods changed while starting the flash sale, please retry.")
+            db.session.execute(insert(GoodsStockShard), [
+                {"good_id": goods_id, "shard_no": n, "count_in_stock": base + (1 if n < extra else 0)}
+                for n in range(shards)
+            ])
+            sync_low_stock([goods_id])
+            db.session.commit()
+        except ValueError:
+            db.session.rollback()
+            raise
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            raise ValueError(f"Failed to start flash sale: {e}")
+        bump_catalog_version()
+        db.session.refresh(goods)
+        return goods.to_dict()
+
+    @staticmethod
+    def end_flash_sale(goods_id):
+        """
+        Folds a flash sale's shards back into ``goods.count_in_stock``.
+
+        The shard rows are locked before they are summed, so a purchase that
+        is debiting a shard concurrently either lands before the fold or finds
+        the shard gone and fails; no sold unit is counted back into stock.
+        """
+        goods = Goods.query.get(goods_id)
+        if not goods:
+            raise ValueError("Goods not found.")
+        if not goods.stock_shards:
+            raise ValueError("No flash sale running.")
+
+        try:
+            remaining = sum(db.session.execute(
+                select(GoodsStockShard.count_in_stock)
+                .where(GoodsStockShard.good_id == goods_id)
+                .with_for_update()
+            ).scalars())
+            db.session.execute(delete(GoodsStockShard).where(GoodsStockShard.good_id == goods_id))
+            db.session.execute(
+                update(Goods)
+                .where(Goods.id == goods_id)
+                .values(count_in_stock=Goods.count_in_stock + remaining, stock_shards=0,
+                        version=Goods.version + 1)
+            )
+            sync_low_stock([goods_id])
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            raise ValueError(f"Failed to end flash sale: {e}")
+        bump_catalog_version()
+        db.session.refresh(goods)
+        return goods.to_dict()
+
     @staticmethod
     def get_goods_by_id(goods_id):
         """
@@ -84,6 +530,37 @@ class InventoryService:
             raise ValueError("Goods not found.")
         return goods.to_dict()
 
+    @staticmethod
+    def get_goods_etag(goods_id):
+        """
+        Returns the entity tag of a good from its version, without loading the row.
+
+        Returns:
+            str or None: The ETag, or None if the good does not exist.
+        """
+        version = db.session.execute(select(Goods.version).where(Goods.id == goods_id)).scalar()
+        return None if version is None else InventoryService.goods_etag(goods_id, version)
+
+    @staticmethod
+    def goods_etag(goods_id, version):
+        """
+        Builds the strong ETag of a good at a given version.
+        """
+        return f"goods-{goods_id}-v{version}"
+
+    @staticmethod
+    def version_from_etag(goods_id, etag):
+        """
+        Returns the version named by an ETag made by :meth:`goods_etag`.
+
+        Raises:
+            ValueError: If the ETag does not belong to this good.
+        """
+        prefix = f"goods-{goods_id}-v"
+        if not etag.startswith(prefix) or not etag[len(prefix):].isdigit():
+            raise ValueError("If-Match does not match an ETag of this good")
+        return int(etag[len(prefix):])
+
     @staticmethod
     def get_all_goods():
         """
@@ -93,39 +570,195 @@ class InventoryService:
         return [goods.to_dict() for goods in goods_list]
     
     @staticmethod
-    def require_admin_role(request):
-        print("Entering require_admin_role")
-        header = request.headers.get("Authorization")
-        print(f"Authorization Header: {header}")  # Debug log
+    def list_goods(category=None, min_price=None, max_price=None, in_stock=None, sort="id",
+                   limit=DEFAULT_PAGE_SIZE, cursor=None, fields=None):
+        """
+        Returns one page of goods matching the filters.
 
-        if not header:
-            raise UnauthorizedAccess("Authorization header missing or malformed")
+        Pages are keyed on the sort column plus ``id`` instead of an OFFSET,
+        so later pages cost the same as the first.
 
-        try:
-            user_id = decode_token(header)
-            print(f"Decoded User ID: {user_id}")
-        except jwt.ExpiredSignatureError:
-            raise UnauthorizedAccess("Token has expired")
-        except jwt.InvalidTokenError as e:
-            raise UnauthorizedAccess(f"Unauthorized: {e}")
-
-        user = Customer.query.get(user_id)
-        print(f"Fetched User: {user}")  # Debug log
-        if user:
-            print(f"User Role: {user.role}")
+        Args:
+            category (str, optional): Only goods in this category.
+            min_price (float, optional): Lowest ``price_per_item`` (inclusive).
+            max_price (float, optional): Highest ``price_per_item`` (inclusive).
+            in_stock (bool, optional): Only goods with (True) or without (False) stock.
+            sort (str): ``id``, ``price`` or ``name``; prefix with ``-`` for descending.
+            limit (int): Page size, capped at ``MAX_PAGE_SIZE``.
+            cursor (str, optional): The cursor returned with the previous page.
+            fields (list, optional): Only these keys of ``Goods.DICT_FIELDS``;
+                only their columns are selected.
+
+        Returns:
+            tuple: ``(goods, next_cursor)``; ``next_cursor`` is None on the last page.
+
+        Raises:
+            ValueError: If the sort, limit or cursor is invalid.
+        """
+        descending = sort.startswith("-")
+        column = InventoryService.SORT_COLUMNS.get(sort.lstrip("-"))
+        if column is None:
+            raise ValueError(f"Sort must be one of: {', '.join(InventoryService.SORT_COLUMNS)} (prefix - for descending)")
+        if not isinstance(limit, int) or limit <= 0:
+            raise ValueError("Limit must be a positive integer")
+        limit = min(limit, InventoryService.MAX_PAGE_SIZE)
+
+        query = select(Goods)
+        if fields:
+            query = query.options(Goods.load_fields(fields, always=[column.key]))
+        if category is not None:
+            query = query.where(Goods.category == category)
+        if min_price is not None:
+            query = query.where(Goods.price_per_item >= min_price)
+        if max_price is not None:
+            query = query.where(Goods.price_per_item <= max_price)
+        if in_stock is True:
+            query = query.where(or_(Goods.count_in_stock > 0, Goods.stock_shards > 0))
+        elif in_stock is False:
+            query = query.where(Goods.count_in_stock == 0, Goods.stock_shards == 0)
+
+        if cursor:
+            values = decode_cursor(cursor)
+            if len(values) != 3 or values[0] != sort:
+                raise ValueError("Invalid cursor")
+            _, last_value, last_id = values
+            after = (lambda a, b: a < b) if descending else (lambda a, b: a > b)
+            if column is Goods.id:
+                query = query.where(after(Goods.id, last_id))
+            else:
+                query = query.where(or_(
+                    after(column, last_value),
+                    and_(column == last_value, after(Goods.id, last_id)),
+                ))
+
+        if descending:
+            query = query.order_by(column.desc(), Goods.id.desc())
         else:
-            print("No user found with this ID.")
+            query = query.order_by(column, Goods.id)
+        rows = db.session.execute(query.limit(limit + 1)).scalars().all()
 
-        if not user or user.role != "admin":
-            print("User is not authorized")
-            raise UnauthorizedAccess("Access forbidden: Admins only")
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor([sort, getattr(last, column.key), last.id])
+        return [goods.to_dict(fields) for goods in rows], next_cursor
+
+    @staticmethod
+    def list_low_stock(limit=DEFAULT_PAGE_SIZE, cursor=None, fields=None):
+        """
+        Returns one page of the goods at or below their reorder threshold, by ID.
+
+        Reads the ``ix_goods_low_stock`` index, so the cost follows the size
+        of the page rather than of the catalog.
+
+        Returns:
+            tuple: ``(goods, next_cursor)``; ``next_cursor`` is None on the last page.
+
+        Raises:
+            ValueError: If the limit or cursor is invalid.
+        """
+        if not isinstance(limit, int) or limit <= 0:
+            raise ValueError("Limit must be a positive integer")
+        limit = min(limit, InventoryService.MAX_PAGE_SIZE)
+
+        query = select(Goods).where(Goods.low_stock.is_(True))
+        if fields:
+            query = query.options(Goods.load_fields(fields))
+        if cursor:
+            values = decode_cursor(cursor)
+            if len(values) != 2 or values[0] != "low_stock":
+                raise ValueError("Invalid cursor")
+            query = query.where(Goods.id > values[1])
+        rows = db.session.execute(query.order_by(Goods.id).limit(limit + 1)).scalars().all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(["low_stock", rows[-1].id])
+        return [goods.to_dict(fields) for goods in rows], next_cursor
+
+    @staticmethod
+    def search_goods(query, limit=DEFAULT_SEARCH_PAGE_SIZE, page=1, fields=None):
+        """
+        Returns one page of goods matching every word of ``query``, best match first.
+
+        Args:
+            query (str): Words to look for in the name, category and description.
+            limit (int): Page size, capped at ``MAX_SEARCH_PAGE_SIZE``.
+            page (int): 1-based page number. Only the first
+                ``MAX_SEARCH_RESULTS`` matches can be paged through.
+            fields (list, optional): Only these keys of ``Goods.DICT_FIELDS``.
+
+        Returns:
+            tuple: ``(goods, has_more)``.
 
-        print("User is authorized")
-        return user
+        Raises:
+            ValueError: If the query has no words or the limit or page is invalid.
+        """
+        if not isinstance(limit, int) or limit <= 0:
+            raise ValueError("Limit must be a positive integer")
+        if not isinstance(page, int) or page <= 0:
+            raise ValueError("Page must be a positive integer")
+        limit = min(limit, InventoryService.MAX_SEARCH_PAGE_SIZE)
+        offset = (page - 1) * limit
+        if offset >= InventoryService.MAX_SEARCH_RESULTS:
+            raise ValueError(f"Only the first {InventoryService.MAX_SEARCH_RESULTS} results can be paged through")
+
+        ids = search_goods_ids(query, limit + 1, offset)
+        has_more = len(ids) > limit and offset + limit < InventoryService.MAX_SEARCH_RESULTS
+        ids = ids[:limit]
+        query = select(Goods).where(Goods.id.in_(ids))
+        if fields:
+            query = query.options(Goods.load_fields(fields))
+        goods = {g.id: g for g in db.session.execute(query).scalars()} if ids else {}
+        return [goods[goods_id].to_dict(fields) for goods_id in ids if goods_id in goods], has_more
+
+    @staticmethod
+    def autocomplete(prefix, limit=DEFAULT_AUTOCOMPLETE_LIMIT):
+        """
+        Returns goods whose name starts with ``prefix``, most stock first.
+
+        Served from the in-memory :mod:`inventory.autocomplete` index.
+
+        Raises:
+            ValueError: If the prefix is empty or the limit is invalid.
+        """
+        if not prefix or not prefix.strip():
+            raise ValueError("Prefix is required")
+        if not isinstance(limit, int) or limit <= 0:
+            raise ValueError("Limit must be a positive integer")
+        return get_autocomplete_index().complete(prefix, limit)
+
+    @staticmethod
+    def require_admin_role(request):
+        """
+        Returns the request's principal if it is an admin.
+
+        The principal is verified once per request by
+        :func:`customers.auth.load_principal`, from the token's claims.
+
+        Raises:
+            UnauthorizedAccess: If the token is missing, invalid or not an admin's.
+        """
+        principal = current_principal()
+        if principal is None:
+            raise UnauthorizedAccess(g.auth_error)
+        if not principal.is_admin:
+            raise UnauthorizedAccess("Access forbidden: Admins only")
+        return principal
 
 
 class UnauthorizedAccess(Exception):
     """Custom exception for unauthorized access."""
     pass
 
+class VersionConflict(Exception):
+    """Raised when goods changed since the version a write was based on."""
+
+    def __init__(self, goods_id, current_version):
+        super().__init__(f"Goods {goods_id} was changed by another request; reload it and retry.")
+        self.goods_id = goods_id
+        self.current_version = current_version
+
 
@@ -11,6 +11,7 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"
 from customers.models import Customer
 from utils import create_token
 from database.db_config import db
+from sqlalchemy import text
 
 def generate_unique_item_name():
     """Generate a random unique item name for each test."""
@@ -129,6 +130,12 @@ def test_update_item(client):
     assert updated_item["description"] == "Updated electronic item."
     assert updated_item["count_in_stock"] == 10
 
+    # Fields outside the updatable ones are ignored
+    response = client.put(f'/inventory/{item_id}', json={"stock_shards": 4, "low_stock": True})
+    assert response.status_code == 200
+    assert response.json["flash_sale"] is False
+    assert response.json["low_stock"] is False
+
 @profile_test
 @log_memory(output_file="inventory_api_memory_usage.log")
 def test_deduct_item(client):
@@ -209,3 +216,362 @@ def test_deduct_item_insufficient_stock(client):
     
     assert response.status_code == 400  # Bad request (insufficient stock)
     assert response.json["error"] == "Insufficient stock available"
+
+def test_flash_sale_start_and_end(client):
+    """Test stock is split into shards for a flash sale and folded back afterwards."""
+    response = client.post('/inventory/', json={
+        "name": generate_unique_item_name(),
+        "category": "electronics",
+        "price_per_item": 9.99,
+        "description": "Flash sale item",
+        "count_in_stock": 10
+    })
+    item_id = response.json["id"]
+
+    response = client.post(f'/inventory/{item_id}/flash-sale', json={"shards": 3})
+    assert response.status_code == 200
+    assert response.json["flash_sale"] is True
+    assert response.json["count_in_stock"] == 0
+
+    # A second start is rejected while the sale runs
+    assert client.post(f'/inventory/{item_id}/flash-sale', json={"shards": 3}).status_code == 400
+
+    response = client.delete(f'/inventory/{item_id}/flash-sale')
+    assert response.status_code == 200
+    assert response.json["flash_sale"] is False
+    assert response.json["count_in_stock"] == 10
+
+def test_bulk_upsert_goods(client):
+    """Test bulk import from NDJSON and a JSON array, with per-row errors."""
+    import io
+    import json
+    from inventory.bulk import iter_json_array
+    from inventory.models import Goods
+    from inventory.services import InventoryService
+
+    existing = client.post('/inventory/', json={
+        "name": generate_unique_item_name(), "category": "food", "price_per_item": 1.0, "count_in_stock": 1
+    }).json
+
+    lines = [
+        json.dumps({"name": "bulk_a", "category": "food", "price_per_item": 2.5, "count_in_stock": 10}),
+        "{not json",
+        json.dumps({"name": "bulk_b", "category": "food", "count_in_stock": 3}),
+        "",
+        json.dumps({"id": existing["id"], "name": "renamed", "category": "food",
+                    "price_per_item": 9.0, "count_in_stock": 7}),
+        json.dumps({"id": 5000, "name": "bulk_c", "category": "clothes", "price_per_item": 1, "count_in_stock": 0}),
+    ]
+    response = client.post('/inventory/bulk', data="\n".join(lines), content_type="application/x-ndjson")
+    assert response.status_code == 200
+    report = response.json
+    assert (report["received"], report["imported"], report["failed"]) == (5, 3, 2)
+    assert [e["row"] for e in report["errors"]] == [2, 3]
+    assert "price_per_item" in report["errors"][1]["error"]
+    assert "rows_per_sec" in report
+
+    renamed = db.session.get(Goods, existing["id"])
+    db.session.refresh(renamed)
+    assert (renamed.name, renamed.price_per_item, renamed.count_in_stock) == ("renamed", 9.0, 7)
+    assert db.session.get(Goods, 5000).name == "bulk_c"
+
+    # A JSON array is parsed across chunk boundaries and written in several batches
+    rows = [{"name": f"arr_{i}", "category": "food", "price_per_item": i, "count_in_stock": i} for i in range(25)]
+    rows.append({"name": "arr_bad", "category": "food", "price_per_item": 1, "count_in_stock": -1, "colour": "red"})
+    parsed = iter_json_array(io.BytesIO(json.dumps(rows).encode("utf-8")), chunk_size=7)
+    report = InventoryService.bulk_upsert_goods(parsed, batch_size=4)
+    assert report["imported"] == 25
+    assert report["errors"] == [{"row": 26, "error": "Unknown fields: colour"}]
+    assert Goods.query.filter(Goods.name.like("arr_%")).count() == 25
+
+    response = client.post('/inventory/bulk', data=json.dumps(rows[:2]), content_type="application/json")
+    assert response.json["imported"] == 2
+    response = client.post('/inventory/bulk', data='[{"name": "x"', content_type="application/json")
+    assert response.status_code == 400
+
+    response = client.post('/inventory/bulk', data="[]", content_type="application/json", no_auth=True)
+    assert response.status_code == 403
+
+def test_bulk_upsert_keeps_flash_sale_stock(client):
+    """Test a bulk upsert does not overwrite the stock of goods in a flash sale."""
+    import json
+    from inventory.models import Goods
+
+    item_id = client.post('/inventory/', json={
+        "name": generate_unique_item_name(), "category": "food", "price_per_item": 1.0, "count_in_stock": 10
+    }).json["id"]
+    assert client.post(f'/inventory/{item_id}/flash-sale', json={"shards": 2}).status_code == 200
+
+    row = {"id": item_id, "name": "flash_renamed", "category": "food", "price_per_item": 2.0, "count_in_stock": 50}
+    response = client.post('/inventory/bulk', data=json.dumps(row), content_type="application/x-ndjson")
+    assert response.json["imported"] == 1
+
+    goods = db.session.get(Goods, item_id)
+    db.session.refresh(goods)
+    assert (goods.name, goods.price_per_item, goods.count_in_stock) == ("flash_renamed", 2.0, 0)
+
+    # The shards still hold the sale's stock, which is folded back at the end
+    response = client.delete(f'/inventory/{item_id}/flash-sale')
+    assert response.json["count_in_stock"] == 10
+
+def test_stock_adjustments(client):
+    """Test signed deltas are applied together and unsafe lines are rejected."""
+    ids = []
+    for stock in (10, 5, 0):
+        response = client.post('/inventory/', json={
+            "name": generate_unique_item_name(), "category": "food", "price_per_item": 1.0, "count_in_stock": stock
+        })
+        ids.append(response.json["id"])
+
+    response = client.post('/inventory/stock-adjustments', json={"adjustments": [
+        {"good_id": ids[0], "delta": -4},
+        {"good_id": ids[1], "delta": -6},
+        {"good_id": ids[0], "delta": 1},
+        {"good_id": ids[2], "delta": 20},
+        {"good_id": 999999, "delta": 1},
+        {"good_id": ids[1], "delta": "x"},
+    ]})
+    assert response.status_code == 200
+    assert response.json["applied"] == 3
+    assert response.json["goods_updated"] == 2
+    assert [(r["line"], r["good_id"]) for r in response.json["rejected"]] == [
+        (2, ids[1]), (5, 999999), (6, ids[1])
+    ]
+
+    stock = [client.get(f'/inventory/{good_id}').json["count_in_stock"] for good_id in ids]
+    assert stock == [7, 5, 20]
+
+    assert client.post('/inventory/stock-adjustments', json={"adjustments": []}).status_code == 400
+
+def test_list_goods_filters_and_cursor(client):
+    """Test the catalog listing filters, sorts and pages with a cursor header."""
+    for i in range(7):
+        client.post('/inventory/', json={
+            "name": generate_unique_item_name(), "category": "food" if i % 2 else "toys",
+            "price_per_item": float(i), "count_in_stock": i % 3
+        })
+
+    prices = []
+    cursor = None
+    while True:
+        url = '/inventory/?category=food&sort=-price&limit=2' + (f'&cursor={cursor}' if cursor else '')
+        response = client.get(url)
+        assert response.status_code == 200
+        prices.extend(item["price_per_item"] for item in response.json)
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            break
+    assert prices == [5.0, 3.0, 1.0]
+
+    response = client.get('/inventory/?min_price=2&max_price=5&in_stock=true&sort=price')
+    assert [(item["price_per_item"], item["count_in_stock"]) for item in response.json] == [(2.0, 2), (4.0, 1), (5.0, 2)]
+    assert 'X-Next-Cursor' not in response.headers
+
+    assert client.get('/inventory/?sort=colour').status_code == 400
+    assert client.get('/inventory/?min_price=cheap').status_code == 400
+    assert client.get(f'/inventory/?sort=price&cursor={cursor or "bm9wZQ=="}').status_code == 400
+
+def test_search_goods_fts_and_memory_backends(client):
+    """Test ranked search on SQLite FTS5 and on the in-process fallback index."""
+    def add(name, category, description):
+        return client.post('/inventory/', json={"name": name, "category": category, "price_per_item": 1.0,
+                                                "description": description, "count_in_stock": 1}).json["id"]
+
+    lamp = add("Desk Lamp", "furniture", "Warm reading light")
+    light = add("Light Bulb", "electronics", "Spare bulb for a desk lamp")
+    add("Office Chair", "furniture", "Ergonomic chair")
+
+    app = client.application
+    for backend in ("fts5", "memory"):
+        if backend == "memory":
+            app.config["GOODS_SEARCH_BACKEND"] = "memory"
+            app.extensions.pop("goods_search", None)
+
+        response = client.get('/inventory/search?q=desk lamp')
+        assert response.status_code == 200
+        # A name match outranks a description match
+        assert [item["id"] for item in response.json["results"]] == [lamp, light]
+        assert client.get('/inventory/search?q=furniture&limit=1').json["next_page"] == 2
+        assert client.get('/inventory/search?q=furniture&limit=1&page=2').json["next_page"] is None
+
+        # Edits are searchable straight away
+        client.put(f'/inventory/{light}', json={"name": "LED Globe"})
+        assert client.get('/inventory/search?q=globe').json["results"][0]["id"] == light
+        client.put(f'/inventory/{light}', json={"name": "Light Bulb"})
+        assert client.get('/inventory/search?q=globe').json["results"] == []
+
+    assert client.get('/inventory/search?q=%20!').status_code == 400
+
+def test_autocomplete_prefix_index(client):
+    """Test name suggestions are ranked by stock and follow renames."""
+    ids = {}
+    for name, stock in (("Apple Juice", 5), ("apple pie", 50), ("Apricot Jam", 20), ("Banana", 99)):
+        ids[name] = client.post('/inventory/', json={
+            "name": name, "category": "food", "price_per_item": 1.0, "count_in_stock": stock
+        }).json["id"]
+
+    response = client.get('/inventory/autocomplete?prefix=AP')
+    assert response.status_code == 200
+    assert [item["name"] for item in response.json] == ["apple pie", "Apricot Jam", "Apple Juice"]
+    assert [item["name"] for item in client.get('/inventory/autocomplete?prefix=appl&limit=1').json] == ["apple pie"]
+
+    # Writes after the index was built are reflected, including cached short prefixes
+    client.post('/inventory/', json={"name": "Apex Gear", "category": "tools", "price_per_item": 1.0,
+                                     "count_in_stock": 70})
+    client.put(f'/inventory/{ids["apple pie"]}', json={"name": "Cherry Pie"})
+    assert [item["name"] for item in client.get('/inventory/autocomplete?prefix=ap').json] == [
+        "Apex Gear", "Apricot Jam", "Apple Juice"
+    ]
+    assert client.get('/inventory/autocomplete?prefix=cher').json[0]["id"] == ids["apple pie"]
+    assert client.get('/inventory/autocomplete?prefix=').status_code == 400
+
+def test_get_item_conditional_etag(client):
+    """Test If-None-Match answers 304 until the good changes."""
+    item_id = client.post('/inventory/', json={
+        "name": generate_unique_item_name(), "category": "food", "price_per_item": 1.0, "count_in_stock": 5
+    }).json["id"]
+
+    response = client.get(f'/inventory/{item_id}')
+    etag = response.headers["ETag"]
+    assert response.json["version"] == 1
+
+    response = client.get(f'/inventory/{item_id}', headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.data == b""
+
+    # Both ORM and set-based writes bump the version
+    client.put(f'/inventory/{item_id}', json={"price_per_item": 2.0})
+    client.post('/inventory/stock-adjustments', json={"adjustments": [{"good_id": item_id, "delta": 1}]})
+    response = client.get(f'/inventory/{item_id}', headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json["version"] == 3
+    assert response.headers["ETag"] != etag
+
+def test_update_and_deduct_with_version_conflict(client):
+    """Test version-checked writes succeed once and then report a 409 conflict."""
+    item = client.post('/inventory/', json={
+        "name": generate_unique_item_name(), "category": "food", "price_per_item": 1.0, "count_in_stock": 10
+    }).json
+    item_id = item["id"]
+    etag = client.get(f'/inventory/{item_id}').headers["ETag"]
+
+    response = client.put(f'/inventory/{item_id}', json={"price_per_item": 2.0}, headers={"If-Match": etag})
+    assert response.status_code == 200
+    assert response.json["version"] == 2
+
+    # A second edit based on the same copy loses
+    response = client.put(f'/inventory/{item_id}', json={"price_per_item": 3.0}, headers={"If-Match": etag})
+    assert response.status_code == 409
+    assert response.json["current_version"] == 2
+    assert client.get(f'/inventory/{item_id}').json["price_per_item"] == 2.0
+
+    response = client.post(f'/inventory/{item_id}/deduct', json={"quantity": 3, "version": 2})
+    assert response.status_code == 200
+    assert response.json["updated_stock"]["count_in_stock"] == 7
+    assert response.json["updated_stock"]["version"] == 3
+
+    assert client.post(f'/inventory/{item_id}/deduct', json={"quantity": 1, "version": 2}).status_code == 409
+    response = client.post(f'/inventory/{item_id}/deduct', json={"quantity": 50, "version": 3})
+    assert response.status_code == 400
+    assert response.json["error"] == "Insufficient stock available"
+    assert client.put(f'/inventory/{item_id}', json={"name": "x"}, headers={"If-Match": '"goods-0-v1"'}).status_code == 400
+
+    # "*" matches whatever version exists
+    response = client.put(f'/inventory/{item_id}', json={"price_per_item": 4.0}, headers={"If-Match": "*"})
+    assert response.status_code == 200
+    assert response.json["version"] == 4
+
+def test_low_stock_flags_and_outbox(client):
+    """Test stock changes keep the low-stock set current and queue one alert per crossing."""
+    from inventory.alerts import dispatch_low_stock_alerts
+    client.application.config["LOW_STOCK_OUTBOX"] = True
+    item_id = client.post('/inventory/', json={
+        "name": generate_unique_item_name(), "category": "food", "price_per_item": 1.0,
+        "count_in_stock": 10, "reorder_threshold": 5
+    }).json["id"]
+    low_ids = lambda: [item["id"] for item in client.get('/inventory/low-stock').json]
+    assert item_id not in low_ids()
+
+    client.post(f'/inventory/{item_id}/deduct', json={"quantity": 6})
+    assert item_id in low_ids()
+    # Staying low does not queue a second alert
+    client.post('/inventory/stock-adjustments', json={"adjustments": [{"good_id": item_id, "delta": -1}]})
+
+    sent = []
+    assert dispatch_low_stock_alerts(sent.extend) == 1
+    assert (sent[0]["good_id"], sent[0]["count_in_stock"], sent[0]["reorder_threshold"]) == (item_id, 4, 5)
+    assert dispatch_low_stock_alerts(sent.extend) == 0
+
+    client.post('/inventory/stock-adjustments', json={"adjustments": [{"good_id": item_id, "delta": 10}]})
+    assert item_id not in low_ids()
+    response = client.put(f'/inventory/{item_id}', json={"reorder_threshold": 20})
+    assert response.json["low_stock"] is True
+    assert client.get('/inventory/low-stock', no_auth=True).status_code == 403
+    client.application.config["LOW_STOCK_OUTBOX"] = False
+
+def test_export_catalog_ndjson_and_csv(client):
+    """Test the streamed export in both formats, across several cursor batches."""
+    import csv
+    import io
+    import json
+    from inventory.export import export_ndjson
+    ids = [client.post('/inventory/', json={
+        "name": f"export {i}", "category": "food", "price_per_item": 1.5, "count_in_stock": i
+    }).json["id"] for i in range(5)]
+
+    response = client.get('/inventory/export')
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert [row["id"] for row in rows if row["id"] in ids] == ids
+    assert rows[-1] == {"id": ids[-1], "name": "export 4", "category": "food", "price_per_item": 1.5,
+                        "description": None, "count_in_stock": 4, "reorder_threshold": None}
+    assert "".join(export_ndjson(batch_size=2)) == response.data.decode()
+
+    response = client.get('/inventory/export?format=csv')
+    assert response.mimetype == "text/csv"
+    table = list(csv.reader(io.StringIO(response.data.decode())))
+    assert table[0][:3] == ["id", "name", "category"]
+    assert table[-1][:2] == [str(ids[-1]), "export 4"]
+    assert len(table) == len(rows) + 1
+    assert client.get('/inventory/export?format=xml').status_code == 400
+
+def test_list_goods_sparse_fieldsets(client):
+    """Test fields= narrows both the response keys and the selected columns."""
+    from sqlalchemy import event
+    client.post('/inventory/', json={"name": generate_unique_item_name(), "category": "sparse",
+                                     "price_per_item": 2.0, "description": "x" * 500, "count_in_stock": 3})
+    statements = []
+    capture = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.engine, "before_cursor_execute", capture)
+    try:
+        response = client.get('/inventory/?category=sparse&sort=-price&fields=name,flash_sale')
+    finally:
+        event.remove(db.engine, "before_cursor_execute", capture)
+    assert response.status_code == 200
+    assert set(response.json[0]) == {"name", "flash_sale"}
+    listing = [s for s in statements if "FROM goods" in s][-1]
+    assert "goods.stock_shards" in listing and "goods.description" not in listing
+
+    assert set(client.get('/inventory/search?q=sparse&fields=id').json["results"][0]) == {"id"}
+    assert client.get('/inventory/?fields=id,secret').status_code == 400
+    assert client.get('/inventory/?fields=,').status_code == 400
+
+def test_upgrade_schema_adds_missing_columns_and_indexes(client):
+    """Test an older goods table gains the later columns and indexes without losing rows."""
+    from database.upgrade import pending_schema_changes, upgrade_schema
+    from inventory.models import Goods
+    db.session.add(Goods(name="upgrade_item", category="misc", price_per_item=1.0, count_in_stock=4))
+    db.session.commit()
+    assert pending_schema_changes() == []
+
+    # The goods table as it was before low-stock flags existed
+    db.session.execute(text("DROP INDEX ix_goods_low_stock"))
+    db.session.execute(text("ALTER TABLE goods DROP COLUMN low_stock"))
+    db.session.commit()
+    assert [d for d, _ in pending_schema_changes()] == ["add column goods.low_stock", "add index ix_goods_low_stock"]
+
+    assert upgrade_schema() == ["add column goods.low_stock", "add index ix_goods_low_stock"]
+    assert pending_schema_changes() == []
+    assert Goods.query.filter_by(name="upgrade_item").one().low_stock is False
@@ -1,22 +1,84 @@
 from flask import Flask
 from database.db_config import init_db, db
+from database.upgrade import upgrade_db_command
 from inventory.models import Goods  # Import the Inventory model
 from inventory.routes import inventory_bp  # Import the Inventory Blueprint
+from inventory.autocomplete import init_autocomplete
 from sales.models import Sale, PurchaseHistory  # Import the Sales models
 from sales.routes import sales_bp  # Import the Sales Blueprint
+from sales.history_writer import init_history_writer
+from sales.reservations import init_reservation_sweeper
+from sales.rollups import init_rollup_refresher
 from customers.routes import customers_blueprint  # Import the Customers Blueprint
+from customers.ledger import init_wallet_compactor
 from customers.models import Customer  # Import the Customer model
 from reviews.models import Review  # Import the Reviews model
 from reviews.routes import reviews_bp  # Import the Reviews Blueprint
 
-app = Flask(__name__)
-init_db(app)
 
-# Register Blueprints
-app.register_blueprint(inventory_bp)
-app.register_blueprint(sales_bp)
-app.register_blueprint(customers_blueprint)
-app.register_blueprint(reviews_bp)  # Register the Reviews Blueprint
+def create_app(database_uri=None, config=None):
+    """
+    Build the combined Flask app with every service blueprint registered.
+
+    Args:
+        database_uri (str, optional): The URI of the database to use. Defaults
+            to the production MySQL database configured in :func:`init_db`.
+        config (dict, optional): Extra Flask config applied before the
+            database is initialised (e.g. ``SQLALCHEMY_ENGINE_OPTIONS``). Set
+            ``PURCHASE_HISTORY_WRITE_BEHIND`` to record purchase history
+            through :mod:`sales.history_writer`. Background jobs only run when
+            configured, since this module builds an app at import:
+            ``RESERVATION_SWEEP_INTERVAL`` starts the expired-reservation
+            sweeper with that many seconds between sweeps, and
+            ``SALES_ROLLUP_INTERVAL`` does the same for the sales rollup
+            refresher (otherwise run ``flask sales backfill-rollups``).
+            ``AUTOCOMPLETE_MAX_AGE`` creates any missing tables and builds the
+            name autocomplete index at startup, refreshing it after that many
+            seconds; without it the index is built on first use.
+            ``WALLET_LEDGER`` keeps wallets in the append-only
+            :mod:`customers.ledger`, compacted every
+            ``WALLET_LEDGER_COMPACT_INTERVAL`` seconds (default 300, 0 disables
+            the compactor). ``TOKEN_REVOCATION_CACHE_TTL`` sets the seconds
+            revoked tokens may take to be refused by other processes
+            (default 30, see :mod:`customers.auth`).
+
+    Returns:
+        Flask: The configured app instance.
+    """
+    app = Flask(__name__)
+    app.config.update(config or {})
+    init_db(app, database_uri)
+
+    # Register Blueprints
+    app.register_blueprint(inventory_bp)
+    app.register_blueprint(sales_bp)
+    app.register_blueprint(customers_blueprint)
+    app.register_blueprint(reviews_bp)  # Register the Reviews Blueprint
+    # Existing databases are brought up to date with `flask upgrade-db`
+    app.cli.add_command(upgrade_db_command)
+
+    if app.config.get("PURCHASE_HISTORY_WRITE_BEHIND"):
+        init_history_writer(app)
+    sweep_interval = app.config.get("RESERVATION_SWEEP_INTERVAL")
+    if sweep_interval:
+        init_reservation_sweeper(app, sweep_interval)
+    rollup_interval = app.config.get("SALES_ROLLUP_INTERVAL")
+    if rollup_interval:
+        init_rollup_refresher(app, rollup_interval)
+    autocomplete_max_age = app.config.get("AUTOCOMPLETE_MAX_AGE")
+    if autocomplete_max_age:
+        # The index is read from goods, so the tables must exist before the build starts
+        with app.app_context():
+            db.create_all()
+        init_autocomplete(app, autocomplete_max_age)
+    if app.config.get("WALLET_LEDGER"):
+        compact_interval = app.config.get("WALLET_LEDGER_COMPACT_INTERVAL", 300)
+        if compact_interval:
+            init_wallet_compactor(app, compact_interval)
+    return app
+
+
+app = create_app()
 
 if __name__ == "__main__":
     with app.app_context():
@@ -1,5 +1,6 @@
 from database.db_config import db
 from datetime import datetime
+from utils import load_only_fields
 
 class Review(db.Model):
     """
@@ -28,20 +29,30 @@ class Review(db.Model):
     status = db.Column(db.String(20), default='pending')  # New field
 
 
-    def to_dict(self):
+    # Keys of to_dict, in order
+    DICT_FIELDS = ("id", "customer_username", "product_id", "rating", "comment", "created_at", "updated_at", "status")
+
+    def to_dict(self, fields=None):
         """
         Converts the review to a dictionary for API responses.
 
+        Args:
+            fields (iterable, optional): Only these keys of ``DICT_FIELDS``.
+                Only those attributes are read, so reviews loaded with
+                :meth:`load_fields` are not fetched again.
+
         Returns:
             dict: A dictionary representation of the review.
         """
-        return {
-            "id": self.id,
-            "customer_username": self.customer_username,
-            "product_id": self.product_id,
-            "rating": self.rating,
-            "comment": self.comment,
-            "created_at": self.created_at.isoformat(),
-            "updated_at": self.updated_at.isoformat(),
-            "status": self.status
-        }
+        values = {}
+        for field in fields or self.DICT_FIELDS:
+            value = getattr(self, field)
+            values[field] = value.isoformat() if field in ("created_at", "updated_at") else value
+        return values
+
+    @classmethod
+    def load_fields(cls, fields):
+        """
+        Returns a loader option that selects only the columns behind ``fields``.
+        """
+        return load_only_fields(cls, fields)
@@ -1,10 +1,11 @@
-from flask import Blueprint, request, jsonify
-from utils import SECRET_KEY, extract_auth_token, decode_token
-from customers.models import Customer
+from flask import Blueprint, g, request, jsonify
+from utils import parse_fields
+from customers.auth import current_principal, load_principal
+from reviews.models import Review
 from reviews.services import ReviewService
 from sqlalchemy.exc import SQLAlchemyError
-import jwt
 reviews_bp = Blueprint('reviews', __name__, url_prefix='/reviews')
+reviews_bp.before_request(load_principal)
 
 # Your JWT_SECRET_KEY (make sure it matches the one used during token generation)
 JWT_SECRET_KEY = "your-secret-key"
@@ -27,19 +28,8 @@ def submit_review():
         - Error: An error message (status code 400 or 403).
     """
     # Extract and validate token
-    header = extract_auth_token(request)
-    if header:
-        try:
-            user_id = decode_token(header)
-        except jwt.ExpiredSignatureError:
-            return jsonify({"error": "Token has expired"}), 403
-        except jwt.InvalidTokenError:
-            return jsonify({"error": "Unauthorized"}), 403
-
-        # Verify user existence
-        existing_user = Customer.query.get(user_id)
-        if not existing_user:
-            return jsonify({"error": "Unauthorized"}), 403
+    principal = current_principal()
+    if principal:
 
         # Parse review details from request
         data = request.json
@@ -54,7 +44,7 @@ def submit_review():
         try:
             # Submit the review using the service
             review = ReviewService.submit_review(
-                customer_username=existing_user.username,
+                customer_username=principal.username,
                 product_id=product_id,
                 rating=rating,
                 comment=comment
@@ -64,7 +54,7 @@ def submit_review():
             return jsonify({"error": str(e)}), 400
 
     # If no header or invalid header
-    return jsonify({"error": "Authorization header missing or malformed"}), 403
+    return jsonify({"error": g.auth_error}), 403
 
 
 @reviews_bp.route('/<int:review_id>', methods=['PUT'])
@@ -87,19 +77,8 @@ def update_review(review_id):
         - Error: An error message (status code 404 or 403).
     """
     # Extract and validate token
-    header = extract_auth_token(request)
-    if header:
-        try:
-            user_id = decode_token(header)
-        except jwt.ExpiredSignatureError:
-            return jsonify({"error": "Token has expired"}), 403
-        except jwt.InvalidTokenError:
-            return jsonify({"error": "Unauthorized"}), 403
-
-        # Verify user existence
-        existing_user = Customer.query.get(user_id)
-        if not existing_user:
-            return jsonify({"error": "Unauthorized"}), 403
+    principal = current_principal()
+    if principal:
 
         # Parse review details from request
         data = request.json
@@ -121,7 +100,7 @@ def update_review(review_id):
             return jsonify({"error": "An unknown error occurred"}), 400
 
     # If no header or invalid header
-    return jsonify({"error": "Authorization header missing or malformed"}), 403
+    return jsonify({"error": g.auth_error}), 403
 
 @reviews_bp.route('/<int:review_id>', methods=['DELETE'])
 def delete_review(review_id):
@@ -139,19 +118,8 @@ def delete_review(review_id):
         - Error: An error message (status code 404 or 403).
     """
     # Extract and validate token
-    header = extract_auth_token(request)
-    if header:
-        try:
-            user_id = decode_token(header)
-        except jwt.ExpiredSignatureError:
-            return jsonify({"error": "Token has expired"}), 403
-        except jwt.InvalidTokenError:
-            return jsonify({"error": "Unauthorized"}), 403
-
-        # Verify user existence
-        existing_user = Customer.query.get(user_id)
-        if not existing_user:
-            return jsonify({"error": "Unauthorized"}), 403
+    principal = current_principal()
+    if principal:
 
         try:
             ReviewService.delete_review(review_id)
@@ -160,7 +128,7 @@ def delete_review(review_id):
             return jsonify({"error": str(e)}), 404
 
     # If no header or invalid header
-    return jsonify({"error": "Authorization header missing or malformed"}), 403
+    return jsonify({"error": g.auth_error}), 403
 
 @reviews_bp.route('/product/<int:product_id>', methods=['GET'])
 def get_product_reviews(product_id):
@@ -170,12 +138,18 @@ def get_product_reviews(product_id):
     Args:
         product_id (int): ID of the product.
 
+    Query Parameters:
+        fields (str, optional): Comma-separated review fields to return, e.g. ``id,rating``.
+
     Returns:
         JSON response: A list of reviews for the product (status code 200).
     """
     try:
-        reviews = ReviewService.get_product_reviews(product_id)
+        fields = parse_fields(request.args.get('fields'), Review.DICT_FIELDS)
+        reviews = ReviewService.get_product_reviews(product_id, fields)
         return jsonify(reviews)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except SQLAlchemyError as e:
         return jsonify({"error": str(e)}), 500
 
@@ -187,12 +161,18 @@ def get_customer_reviews(customer_username):
     Args:
         customer_username (str): Username of the customer.
 
+    Query Parameters:
+        fields (str, optional): Comma-separated review fields to return, e.g. ``id,product_id,rating``.
+
     Returns:
         JSON response: A list of reviews by the customer (status code 200).
     """
     try:
-        reviews = ReviewService.get_customer_reviews(customer_username)
+        fields = parse_fields(request.args.get('fields'), Review.DICT_FIELDS)
+        reviews = ReviewService.get_customer_reviews(customer_username, fields)
         return jsonify(reviews)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except SQLAlchemyError as e:
         return jsonify({"error": str(e)}), 500
 
@@ -235,20 +215,9 @@ def moderate_review(review_id):
         - Error: An error message (status code 400 or 403).
     """
     # Extract and validate token
-    header = extract_auth_token(request)
-    if header:
-        try:
-            user_id = decode_token(header)
-        except jwt.ExpiredSignatureError:
-            return jsonify({"error": "Token has expired"}), 403
-        except jwt.InvalidTokenError:
-            return jsonify({"error": "Unauthorized"}), 403
-
-        # Verify user existence
-        existing_user = Customer.query.get(user_id)
-        if not existing_user:
-            return jsonify({"error": "Unauthorized"}), 403
-        if existing_user.role != "admin":
+    principal = current_principal()
+    if principal:
+        if not principal.is_admin:
             return jsonify({"error": "Must be admin"})
         # Parse moderation details from request
         data = request.json
@@ -262,4 +231,4 @@ def moderate_review(review_id):
             return jsonify({"error": str(e)}), 400
 
     # If no header or invalid header
-    return jsonify({"error": "Authorization header missing or malformed"}), 403
+    return jsonify({"error": g.auth_error}), 403
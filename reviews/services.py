@@ -1,3 +1,4 @@
+from sqlalchemy import select
 from database.db_config import db
 from reviews.models import Review
 from customers.models import Customer
@@ -91,30 +92,41 @@ class ReviewService:
         db.session.commit()
 
     @staticmethod
-    def get_product_reviews(product_id):
+    def get_product_reviews(product_id, fields=None):
         """
         Retrieves all reviews for a product.
 
         Args:
             product_id (int): The ID of the product.
+            fields (list, optional): Only these keys of ``Review.DICT_FIELDS``;
+                only their columns are selected.
 
         Returns:
             list: A list of reviews.
         """
-        return [review.to_dict() for review in Review.query.filter_by(product_id=product_id).all()]
+        return ReviewService._list_reviews(Review.product_id == product_id, fields)
 
     @staticmethod
-    def get_customer_reviews(customer_username):
+    def get_customer_reviews(customer_username, fields=None):
         """
         Retrieves all reviews submitted by a customer.
 
         Args:
             customer_username (str): The username of the customer.
+            fields (list, optional): Only these keys of ``Review.DICT_FIELDS``;
+                only their columns are selected.
 
         Returns:
             list: A list of reviews.
         """
-        return [review.to_dict() for review in Review.query.filter_by(customer_username=customer_username).all()]
+        return ReviewService._list_reviews(Review.customer_username == customer_username, fields)
+
+    @staticmethod
+    def _list_reviews(condition, fields):
+        query = select(Review).where(condition)
+        if fields:
+            query = query.options(Review.load_fields(fields))
+        return [review.to_dict(fields) for review in db.session.execute(query).scalars()]
 
     @staticmethod
     def get_review_details(review_id):
@@ -232,6 +232,12 @@ def test_get_product_reviews(client):
         assert any(r["customer_username"] == username1 for r in reviews)
         assert any(r["customer_username"] == username2 for r in reviews)
 
+        # Only the requested fields are returned
+        response = client.get(f'/reviews/product/{product.id}?fields=rating,created_at')
+        assert sorted(r["rating"] for r in response.json) == [4, 5]
+        assert all(set(r) == {"rating", "created_at"} for r in response.json)
+        assert client.get(f'/reviews/product/{product.id}?fields=password').status_code == 400
+
 @profile_test
 @log_memory(output_file="reviews_api_memory_usage.log")
 def test_moderate_review(client):
@@ -0,0 +1,155 @@
+"""
+Purchase History Writer
+=======================
+
+Optional write-behind recording of :class:`sales.models.PurchaseHistory` rows.
+
+When enabled, sales commit only the stock, wallet and ``Sale`` changes; the
+history rows are handed to a bounded in-process queue after the commit and a
+worker thread bulk-inserts them in batches. A batch is written as soon as
+``batch_size`` rows are waiting or ``flush_interval`` seconds have passed,
+whichever comes first. Stopping the writer (also registered with ``atexit``)
+drains everything still queued before returning.
+
+Rows still queued when the process is killed without a clean shutdown are
+lost, which is the trade-off of write-behind for a table that is only read
+for history views.
+"""
+import atexit
+import threading
+import time
+from collections import deque
+from sqlalchemy import insert
+from database.db_config import db
+from sales.models import PurchaseHistory
+
+
+class PurchaseHistoryWriter:
+    """
+    Background batch writer for purchase history rows.
+
+    Args:
+        app (Flask): The app whose database the rows are written to.
+        max_queue_size (int): Maximum number of rows waiting to be written.
+            ``enqueue`` refuses rows beyond this so callers can fall back to a
+            synchronous insert instead of blocking.
+        batch_size (int): Rows written per bulk insert.
+        flush_interval (float): Seconds a row may wait before a partial batch is written.
+        max_retries (int): Attempts per batch before it is dropped and logged.
+    """
+
+    def __init__(self, app, max_queue_size=10000, batch_size=500, flush_interval=1.0, max_retries=3):
+        self.app = app
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.written = 0
+        self.rejected = 0
+        self.dropped = 0
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = None
+
+    def start(self):
+        """
+        Starts the worker thread.
+        """
+        self._thread = threading.Thread(target=self._run, name="purchase-history-writer", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, rows):
+        """
+        Queues history rows for a later bulk insert.
+
+        Args:
+            rows (list): Dictionaries of ``PurchaseHistory`` column values.
+
+        Returns:
+            bool: True if the rows were queued, False if the queue is full or
+            the writer is stopping (the caller must write them itself).
+        """
+        with self._cond:
+            if self._stopping or len(self._pending) + len(rows) > self.max_queue_size:
+                self.rejected += len(rows)
+                return False
+            self._pending.extend(rows)
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+            return True
+
+    def stop(self, timeout=None):
+        """
+        Writes every queued row and stops the worker thread.
+
+        Safe to call more than once.
+        """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        """
+        Returns counters describing the writer's activity.
+        """
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "written": self.written,
+                "rejected": self.rejected,
+                "dropped": self.dropped,
+            }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if len(self._pending) < self.batch_size and not self._stopping:
+                    self._cond.wait(self.flush_interval)
+                batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+                stopping = self._stopping
+            if batch:
+                self._write(batch)
+            elif stopping:
+                return
+
+    def _write(self, batch):
+        for attempt in range(1, self.max_retries + 1):
+            with self.app.app_context():
+                try:
+                    db.session.execute(insert(PurchaseHistory), batch)
+                    db.session.commit()
+                    self.written += len(batch)
+                    return
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Error writing purchase history batch (attempt {attempt}): {e}")
+                finally:
+                    db.session.remove()
+            time.sleep(min(self.flush_interval, 1.0))
+        self.dropped += len(batch)
+        print(f"Dropped {len(batch)} purchase history rows after {self.max_retries} attempts")
+
+
+def init_history_writer(app, **options):
+    """
+    Enables write-behind purchase history for an app.
+
+    The writer is stored in ``app.extensions['purchase_history_writer']``,
+    where :class:`sales.services.SalesService` picks it up, and is flushed at
+    interpreter exit.
+
+    Args:
+        app (Flask): The app to enable write-behind for.
+        **options: Keyword arguments for :class:`PurchaseHistoryWriter`.
+
+    Returns:
+        PurchaseHistoryWriter: The running writer.
+    """
+    writer = PurchaseHistoryWriter(app, **options)
+    writer.start()
+    app.extensions["purchase_history_writer"] = writer
+    atexit.register(writer.stop)
+    return writer
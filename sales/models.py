@@ -1,5 +1,6 @@
 from database.db_config import db
 from datetime import datetime
+from utils import load_only_fields
 
 class Sale(db.Model):
     """
@@ -24,21 +25,24 @@ class Sale(db.Model):
     sale_date = db.Column(db.DateTime, default=datetime.utcnow)
 
 
-    def to_dict(self):
+    # Keys of to_dict, in order
+    DICT_FIELDS = ("id", "good_id", "customer_username", "quantity", "total_price", "sale_date")
+
+    def to_dict(self, fields=None):
         """
         Converts the Sale record to a dictionary.
 
+        Args:
+            fields (iterable, optional): Only these keys of ``DICT_FIELDS``.
+
         Returns:
             dict: A dictionary representation of the Sale record.
         """
-        return {
-            "id": self.id,
-            "good_id": self.good_id,
-            "customer_username": self.customer_username,
-            "quantity": self.quantity,
-            "total_price": self.total_price,
-            "sale_date": self.sale_date.isoformat(),
-        }
+        values = {}
+        for field in fields or self.DICT_FIELDS:
+            value = getattr(self, field)
+            values[field] = value.isoformat() if field == "sale_date" else value
+        return values
 
 class PurchaseHistory(db.Model):
     """
@@ -52,7 +56,11 @@ class PurchaseHistory(db.Model):
         purchase_date (datetime): The date of the purchase.
     """
     __tablename__ = 'purchase_history'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        # Serves the newest-first keyset pages of one customer's history
+        db.Index('ix_purchase_history_customer_date_id', 'customer_username', 'purchase_date', 'id'),
+        {'extend_existing': True},
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     customer_username = db.Column(db.String(100), db.ForeignKey('customers.username'), nullable=False)
@@ -60,17 +68,198 @@ class PurchaseHistory(db.Model):
     total_price = db.Column(db.Float, nullable=False)
     purchase_date = db.Column(db.DateTime, default=datetime.utcnow)
 
-    def to_dict(self):
+    # Keys of to_dict, in order
+    DICT_FIELDS = ("id", "customer_username", "good_name", "total_price", "purchase_date")
+
+    def to_dict(self, fields=None):
         """
         Converts the PurchaseHistory record to a dictionary.
 
+        Args:
+            fields (iterable, optional): Only these keys of ``DICT_FIELDS``.
+                Only those attributes are read, so records loaded with
+                :meth:`load_fields` are not fetched again.
+
         Returns:
             dict: A dictionary representation of the PurchaseHistory record.
         """
+        values = {}
+        for field in fields or self.DICT_FIELDS:
+            value = getattr(self, field)
+            values[field] = value.isoformat() if field == "purchase_date" else value
+        return values
+
+    @classmethod
+    def load_fields(cls, fields, always=()):
+        """
+        Returns a loader option that selects only the columns behind ``fields``.
+        """
+        return load_only_fields(cls, fields, always=always)
+
+class IdempotencyRecord(db.Model):
+    """
+    Stores the first response to a request sent with an ``Idempotency-Key`` header.
+
+    Retries with the same key from the same customer are answered from this
+    record instead of being processed again.
+
+    Attributes:
+        id (int): The unique ID of the record.
+        customer_id (int): The ID of the customer who sent the request.
+        idempotency_key (str): The client-chosen key, unique per customer.
+        request_hash (str): A SHA-256 digest of the original request body.
+        status_code (int): The HTTP status of the stored response.
+        response_body (str): The stored response, encoded as JSON.
+        created_at (datetime): When the first request was processed.
+    """
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        db.UniqueConstraint('customer_id', 'idempotency_key', name='uq_idempotency_customer_key'),
+        {'extend_existing': True},
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    customer_id = db.Column(db.Integer, nullable=False)
+    idempotency_key = db.Column(db.String(64), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer, nullable=False)
+    response_body = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class StockReservation(db.Model):
+    """
+    A temporary hold on stock while a customer checks out.
+
+    Held units are subtracted from a good's ``count_in_stock`` until the hold
+    is consumed by a purchase, released, or expires. Expired rows are ignored
+    by every query and removed in bulk by the reservation sweeper.
+
+    Attributes:
+        id (int): The unique ID of the reservation.
+        good_id (int): The ID of the reserved good. Links to :class:`inventory.models.Goods`. :no-index:
+        customer_id (int): The ID of the customer holding the stock.
+        quantity (int): The number of units held.
+        created_at (datetime): When the hold was placed.
+        expires_at (datetime): When the hold lapses.
+    """
+    __tablename__ = 'stock_reservations'
+    __table_args__ = (
+        # Covers the live-holds aggregate: SUM(quantity) WHERE good_id = ? AND expires_at > ?
+        db.Index('ix_stock_reservations_good_expires', 'good_id', 'expires_at', 'quantity'),
+        {'extend_existing': True},
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    good_id = db.Column(db.Integer, db.ForeignKey('goods.id'), nullable=False)
+    customer_id = db.Column(db.Integer, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def to_dict(self):
+        """
+        Converts the StockReservation record to a dictionary.
+
+        Returns:
+            dict: A dictionary representation of the StockReservation record.
+        """
         return {
             "id": self.id,
+            "good_id": self.good_id,
+            "customer_id": self.customer_id,
+            "quantity": self.quantity,
+            "created_at": self.created_at.isoformat(),
+            "expires_at": self.expires_at.isoformat(),
+        }
+
+class SalesDailyRollup(db.Model):
+    """
+    Units and revenue per good per day, pre-aggregated from :class:`Sale`.
+
+    Attributes:
+        good_id (int): The ID of the good sold.
+        day (date): The day of the sales (UTC).
+        units (int): Units sold that day.
+        revenue (float): Total price of the sales that day.
+        orders (int): Number of sale records that day.
+    """
+    __tablename__ = 'sales_daily_rollup'
+    __table_args__ = (
+        db.Index('ix_sales_daily_rollup_day', 'day'),
+        {'extend_existing': True},
+    )
+
+    good_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    day = db.Column(db.Date, primary_key=True)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        """
+        Converts the SalesDailyRollup record to a dictionary.
+
+        Returns:
+            dict: A dictionary representation of the SalesDailyRollup record.
+        """
+        return {
+            "good_id": self.good_id,
+            "day": self.day.isoformat(),
+            "units": self.units,
+            "revenue": self.revenue,
+            "orders": self.orders,
+        }
+
+class CustomerDailyRollup(db.Model):
+    """
+    Units and spend per customer per day, pre-aggregated from :class:`Sale`.
+
+    Attributes:
+        customer_username (str): The username of the customer.
+        day (date): The day of the purchases (UTC).
+        units (int): Units bought that day.
+        revenue (float): Total spent that day.
+        orders (int): Number of sale records that day.
+    """
+    __tablename__ = 'customer_daily_rollup'
+    __table_args__ = (
+        db.Index('ix_customer_daily_rollup_day', 'day'),
+        {'extend_existing': True},
+    )
+
+    customer_username = db.Column(db.String(100), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        """
+        Converts the CustomerDailyRollup record to a dictionary.
+
+        Returns:
+            dict: A dictionary representation of the CustomerDailyRollup record.
+        """
+        return {
             "customer_username": self.customer_username,
-            "good_name": self.good_name,
-            "total_price": self.total_price,
-            "purchase_date": self.purchase_date.isoformat(),
+            "day": self.day.isoformat(),
+            "units": self.units,
+            "revenue": self.revenue,
+            "orders": self.orders,
         }
+
+class RollupWatermark(db.Model):
+    """
+    The highest :class:`Sale` ID already folded into the rollup tables.
+
+    Attributes:
+        name (str): The rollup job the watermark belongs to.
+        last_sale_id (int): Sales with a greater ID are not rolled up yet.
+        updated_at (datetime): When the watermark last moved.
+    """
+    __tablename__ = 'rollup_watermarks'
+    __table_args__ = {'extend_existing': True}
+
+    name = db.Column(db.String(50), primary_key=True)
+    last_sale_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
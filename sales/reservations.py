@@ -0,0 +1,87 @@
+"""
+Reservation Sweeper
+===================
+
+Periodic bulk cleanup of expired :class:`sales.models.StockReservation` rows.
+
+Expired holds never count against available stock, so requests do not need to
+delete them; a background thread removes them in one statement every
+``interval`` seconds instead.
+"""
+import atexit
+import threading
+from database.db_config import db
+from sales.services import SalesService
+
+
+class ReservationSweeper:
+    """
+    Background thread that deletes expired reservations.
+
+    Args:
+        app (Flask): The app whose database is swept.
+        interval (float): Seconds between sweeps.
+    """
+
+    def __init__(self, app, interval=60.0):
+        self.app = app
+        self.interval = interval
+        self.swept = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Starts the sweeper thread.
+        """
+        self._thread = threading.Thread(target=self._run, name="reservation-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stops the sweeper thread. Safe to call more than once.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def sweep(self):
+        """
+        Runs one sweep and returns the number of reservations removed.
+        """
+        with self.app.app_context():
+            try:
+                removed = SalesService.sweep_expired_reservations()
+                self.swept += removed
+                return removed
+            except Exception as e:
+                db.session.rollback()
+                print(f"Error sweeping expired reservations: {e}")
+                return 0
+            finally:
+                db.session.remove()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sweep()
+
+
+def init_reservation_sweeper(app, interval=60.0):
+    """
+    Starts a reservation sweeper for an app.
+
+    The sweeper is stored in ``app.extensions['reservation_sweeper']`` and
+    stopped at interpreter exit.
+
+    Args:
+        app (Flask): The app to sweep.
+        interval (float): Seconds between sweeps.
+
+    Returns:
+        ReservationSweeper: The running sweeper.
+    """
+    sweeper = ReservationSweeper(app, interval)
+    sweeper.start()
+    app.extensions["reservation_sweeper"] = sweeper
+    atexit.register(sweeper.stop)
+    return sweeper
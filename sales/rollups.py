@@ -0,0 +1,316 @@
+"""
+Sales Rollups
+=============
+
+Pre-aggregated sales reporting.
+
+:class:`sales.models.SalesDailyRollup` and
+:class:`sales.models.CustomerDailyRollup` are maintained incrementally from a
+high-water mark on ``Sale.id`` (:class:`sales.models.RollupWatermark`). Each
+refresh reads the next chunk of sales above the mark in ID order, folds it
+into the rollups with one upsert per table and advances the mark in the same
+transaction. Report queries read only the rollup tables.
+
+Sales newer than ``settle_seconds`` are left for the next refresh, so a sale
+whose transaction commits after a higher ID was already rolled up is not
+skipped by the watermark.
+"""
+import atexit
+import threading
+from datetime import date, datetime, timedelta
+from sqlalchemy import delete, desc, func, select, update
+from database.db_config import db
+from database.upsert import upsert_statement
+from sales.models import Sale, SalesDailyRollup, CustomerDailyRollup, RollupWatermark
+
+WATERMARK_NAME = "sales_rollups"
+
+
+class SalesReportService:
+    """
+    Service class for maintaining and reading the sales rollups.
+    """
+
+    DEFAULT_CHUNK_SIZE = 5000
+    DEFAULT_SETTLE_SECONDS = 30
+    MAX_REPORT_LIMIT = 100
+
+    @staticmethod
+    def refresh(chunk_size=DEFAULT_CHUNK_SIZE, settle_seconds=DEFAULT_SETTLE_SECONDS, max_chunks=None,
+                progress=None):
+        """
+        Folds every settled sale above the watermark into the rollup tables.
+
+        Args:
+            chunk_size (int): Sales processed per transaction.
+            settle_seconds (int): Sales younger than this are left for later.
+            max_chunks (int, optional): Stop after this many chunks.
+            progress (callable, optional): Called with ``(last_sale_id, processed)``
+                after each chunk commits.
+
+        Returns:
+            int: The number of sales folded in.
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=settle_seconds)
+        processed = 0
+        chunks = 0
+        while max_chunks is None or chunks < max_chunks:
+            folded = SalesReportService._refresh_chunk(chunk_size, cutoff)
+            if not folded:
+                break
+            processed += folded
+            chunks += 1
+            if progress:
+                progress(SalesReportService.watermark(), processed)
+        return processed
+
+    @staticmethod
+    def backfill(chunk_size=DEFAULT_CHUNK_SIZE, rebuild=False, settle_seconds=DEFAULT_SETTLE_SECONDS,
+                 progress=None):
+        """
+        Rolls up the whole sales history in chunks.
+
+        Args:
+            chunk_size (int): Sales processed per transaction.
+            rebuild (bool): Empty the rollups and reset the watermark first.
+            settle_seconds (int): Sales younger than this are left for later.
+            progress (callable, optional): See :meth:`refresh`.
+
+        Returns:
+            int: The number of sales folded in.
+        """
+        if rebuild:
+            db.session.execute(delete(SalesDailyRollup))
+            db.session.execute(delete(CustomerDailyRollup))
+            db.session.execute(delete(RollupWatermark).where(RollupWatermark.name == WATERMARK_NAME))
+            db.session.commit()
+        return SalesReportService.refresh(chunk_size=chunk_size, settle_seconds=settle_seconds, progress=progress)
+
+    @staticmethod
+    def watermark():
+        """
+        Returns the highest sale ID already rolled up.
+        """
+        return db.session.execute(
+            select(RollupWatermark.last_sale_id).where(RollupWatermark.name == WATERMARK_NAME)
+        ).scalar() or 0
+
+    @staticmethod
+    def daily_report(start, end, good_id=None):
+        """
+        Returns units and revenue per good per day between ``start`` and ``end`` (inclusive).
+        """
+        query = select(SalesDailyRollup).where(SalesDailyRollup.day.between(start, end))
+        if good_id is not None:
+            query = query.where(SalesDailyRollup.good_id == good_id)
+        query = query.order_by(SalesDailyRollup.day, SalesDailyRollup.good_id)
+        return [row.to_dict() for row in db.session.execute(query).scalars()]
+
+    @staticmethod
+    def goods_report(start, end, limit=MAX_REPORT_LIMIT):
+        """
+        Returns the goods with the highest revenue between ``start`` and ``end``.
+        """
+        revenue = func.sum(SalesDailyRollup.revenue).label("revenue")
+        query = (
+            select(
+                SalesDailyRollup.good_id,
+                func.sum(SalesDailyRollup.units).label("units"),
+                revenue,
+                func.sum(SalesDailyRollup.orders).label("orders"),
+            )
+            .where(SalesDailyRollup.day.between(start, end))
+            .group_by(SalesDailyRollup.good_id)
+            .order_by(desc(revenue))
+            .limit(limit)
+        )
+        return [dict(row._mapping) for row in db.session.execute(query)]
+
+    @staticmethod
+    def customers_report(start, end, limit=MAX_REPORT_LIMIT, username=None):
+        """
+        Returns the customers with the highest spend between ``start`` and ``end``.
+
+        With ``username``, returns that customer's day-by-day spend instead.
+        """
+        if username is not None:
+            query = (
+                select(CustomerDailyRollup)
+                .where(CustomerDailyRollup.customer_username == username,
+                       CustomerDailyRollup.day.between(start, end))
+                .order_by(CustomerDailyRollup.day)
+            )
+            return [row.to_dict() for row in db.session.execute(query).scalars()]
+
+        revenue = func.sum(CustomerDailyRollup.revenue).label("revenue")
+        query = (
+            select(
+                CustomerDailyRollup.customer_username,
+                func.sum(CustomerDailyRollup.units).label("units"),
+                revenue,
+                func.sum(CustomerDailyRollup.orders).label("orders"),
+            )
+            .where(CustomerDailyRollup.day.between(start, end))
+            .group_by(CustomerDailyRollup.customer_username)
+            .order_by(desc(revenue))
+            .limit(limit)
+        )
+        return [dict(row._mapping) for row in db.session.execute(query)]
+
+    @staticmethod
+    def _refresh_chunk(chunk_size, cutoff):
+        """
+        Folds the next chunk of settled sales into the rollups in one transaction.
+
+        Returns:
+            int: The number of sales folded in (0 when caught up).
+        """
+        last_sale_id = SalesReportService.watermark()
+        rows = db.session.execute(
+            select(Sale.id, Sale.good_id, Sale.customer_username, Sale.quantity, Sale.total_price, Sale.sale_date)
+            .where(Sale.id > last_sale_id)
+            .order_by(Sale.id)
+            .limit(chunk_size)
+        ).all()
+
+        # Stop at the first unsettled sale so later IDs wait for it
+        settled = []
+        for row in rows:
+            if row.sale_date > cutoff:
+                break
+            settled.append(row)
+        if not settled:
+            db.session.rollback()
+            return 0
+
+        by_good = {}
+        by_customer = {}
+        for row in settled:
+            day = row.sale_date.date()
+            for totals in (by_good.setdefault((row.good_id, day), [0, 0.0, 0]),
+                           by_customer.setdefault((row.customer_username, day), [0, 0.0, 0])):
+                totals[0] += row.quantity
+                totals[1] += row.total_price
+                totals[2] += 1
+
+        goods_table = SalesDailyRollup.__table__
+        customers_table = CustomerDailyRollup.__table__
+        new_mark = settled[-1].id
+        try:
+            db.session.execute(
+                upsert_statement(goods_table, ["good_id", "day"], lambda new: {
+                    "units": goods_table.c.units + new.units,
+                    "revenue": goods_table.c.revenue + new.revenue,
+                    "orders": goods_table.c.orders + new.orders,
+                }),
+                [{"good_id": g, "day": d, "units": u, "revenue": r, "orders": o}
+                 for (g, d), (u, r, o) in by_good.items()]
+            )
+            db.session.execute(
+                upsert_statement(customers_table, ["customer_username", "day"], lambda new: {
+                    "units": customers_table.c.units + new.units,
+                    "revenue": customers_table.c.revenue + new.revenue,
+                    "orders": customers_table.c.orders + new.orders,
+                }),
+                [{"customer_username": c, "day": d, "units": u, "revenue": r, "orders": o}
+                 for (c, d), (u, r, o) in by_customer.items()]
+            )
+
+            # Advance the mark only from the value this chunk started at, so
+            # two concurrent refreshers cannot fold the same sales twice.
+            if last_sale_id:
+                moved = db.session.execute(
+                    update(RollupWatermark)
+                    .where(RollupWatermark.name == WATERMARK_NAME, RollupWatermark.last_sale_id == last_sale_id)
+                    .values(last_sale_id=new_mark, updated_at=datetime.utcnow())
+                ).rowcount
+            else:
+                db.session.add(RollupWatermark(name=WATERMARK_NAME, last_sale_id=new_mark))
+                db.session.flush()
+                moved = 1
+            if moved != 1:
+                db.session.rollback()
+                return 0
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return len(settled)
+
+
+def parse_report_range(args, default_days=30):
+    """
+    Reads ``start`` and ``end`` (ISO dates) from request args.
+
+    Returns:
+        tuple: ``(start, end)`` dates, defaulting to the last ``default_days`` days.
+
+    Raises:
+        ValueError: If a date is malformed or the range is reversed.
+    """
+    end = date.fromisoformat(args["end"]) if args.get("end") else datetime.utcnow().date()
+    start = date.fromisoformat(args["start"]) if args.get("start") else end - timedelta(days=default_days)
+    if start > end:
+        raise ValueError("start must not be after end")
+    return start, end
+
+
+class RollupRefresher:
+    """
+    Background thread that refreshes the sales rollups periodically.
+
+    Args:
+        app (Flask): The app whose database is rolled up.
+        interval (float): Seconds between refreshes.
+        chunk_size (int): Sales processed per transaction.
+    """
+
+    def __init__(self, app, interval=60.0, chunk_size=SalesReportService.DEFAULT_CHUNK_SIZE):
+        self.app = app
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Starts the refresher thread.
+        """
+        self._thread = threading.Thread(target=self._run, name="sales-rollup-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stops the refresher thread. Safe to call more than once.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    SalesReportService.refresh(chunk_size=self.chunk_size)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Error refreshing sales rollups: {e}")
+                finally:
+                    db.session.remove()
+
+
+def init_rollup_refresher(app, interval=60.0, **options):
+    """
+    Starts a rollup refresher for an app.
+
+    The refresher is stored in ``app.extensions['rollup_refresher']`` and
+    stopped at interpreter exit.
+
+    Returns:
+        RollupRefresher: The running refresher.
+    """
+    refresher = RollupRefresher(app, interval, **options)
+    refresher.start()
+    app.extensions["rollup_refresher"] = refresher
+    atexit.register(refresher.stop)
+    return refresher
@@ -1,20 +1,27 @@
-from flask import Blueprint, request, jsonify
-from sales.services import SalesService
-from utils import SECRET_KEY, extract_auth_token, decode_token
-import jwt
+import click
+from flask import Blueprint, current_app, g, request, jsonify
+from sales.services import IdempotencyConflict, SalesService
+from sales.rollups import SalesReportService, parse_report_range
+from inventory.services import InventoryService, UnauthorizedAccess
+from customers.auth import current_principal, load_principal
+from sales.models import PurchaseHistory
+from utils import not_modified, parse_fields
 sales_bp = Blueprint('sales', __name__, url_prefix='/sales')
+sales_bp.before_request(load_principal)
 
 @sales_bp.route('/goods', methods=['GET'])
 def display_goods():
     """
     API endpoint to retrieve a list of available goods.
 
+    The encoded listing is cached and only rebuilt after goods change.
+
     Returns:
         Response (JSON): A list of goods with their names and prices.
     """
     try:
-        goods = SalesService.display_goods()
-        return jsonify(goods)
+        goods = SalesService.display_goods_json()
+        return current_app.response_class(goods, mimetype="application/json")
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
@@ -23,6 +30,10 @@ def get_good_details(good_id):
     """
     API endpoint to retrieve detailed information about a specific good.
 
+    Supports conditional requests: the response carries an ``ETag`` built
+    from the good's version and available stock, and a matching
+    ``If-None-Match`` is answered with an empty ``304``.
+
     Args:
         good_id (int): The ID of the good.
 
@@ -30,8 +41,17 @@ def get_good_details(good_id):
         Response (JSON): The details of the good or an error message if not found.
     """
     try:
+        etag = SalesService.get_good_etag(good_id)
+        if etag:
+            cached = not_modified(etag)
+            if cached:
+                return cached
         good_details = SalesService.get_good_details(good_id)
-        return jsonify(good_details)
+        response = jsonify(good_details)
+        response.set_etag(SalesService.good_etag(
+            good_id, good_details["version"], good_details["available_stock"]
+        ))
+        return response
     except ValueError as e:
         return jsonify({"error": str(e)}), 404
 
@@ -46,39 +66,289 @@ def process_sale():
         JSON payload with:
         - good_id (int): The ID of the good being purchased.
         - quantity (int): The quantity of the good being purchased.
+        - reservation_id (int, optional): A live reservation made through
+          ``/sales/reservations`` that covers the quantity.
+
+    Accepts an optional ``Idempotency-Key`` header (at most 64 characters).
+    A retry with the same key replays the first successful response instead
+    of charging again; reusing a key for a different request returns 422.
 
     Returns:
         Response (JSON): The sale details if successful or an error message otherwise.
     """
     # Extract and validate token
-    header = extract_auth_token(request)
-    if header:
-        try:
-            user_id = decode_token(header)
-        except jwt.ExpiredSignatureError:
-            return jsonify({"error": "Token has expired"}), 403
-        except jwt.InvalidTokenError:
-            return jsonify({"error": "Unauthorized"}), 403
-
+    principal = current_principal()
+    if principal:
         # Parse sale details from request
         data = request.json
+
+        # Replay the stored response for a retried request
+        idempotency_key = request.headers.get('Idempotency-Key')
+        request_hash = None
+        if idempotency_key is not None:
+            if not idempotency_key or len(idempotency_key) > 64:
+                return jsonify({"error": "Idempotency-Key must be 1 to 64 characters"}), 400
+            request_hash = SalesService.request_fingerprint(data)
+            replay = SalesService.get_idempotent_response(principal.user_id, idempotency_key)
+            if replay:
+                stored_hash, status_code, body = replay
+                if stored_hash != request_hash:
+                    return jsonify({"error": str(IdempotencyConflict())}), 422
+                response = jsonify(body)
+                response.headers['Idempotent-Replayed'] = 'true'
+                return response, status_code
+
         good_id = data.get('good_id')
         quantity = data.get('quantity')
 
         # Input validation
         if not good_id or not quantity:
             return jsonify({"error": "Good ID and quantity are required"}), 400
+        if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity <= 0:
+            return jsonify({"error": "Quantity must be a positive integer"}), 400
 
         try:
             # Process the sale using the service
             sale = SalesService.process_sale(
-                customer_id=user_id,
+                customer_id=principal.user_id,
                 good_id=good_id,
-                quantity=quantity
+                quantity=quantity,
+                idempotency_key=idempotency_key,
+                request_hash=request_hash,
+                reservation_id=data.get('reservation_id')
             )
             return jsonify(sale), 201
+        except IdempotencyConflict as e:
+            return jsonify({"error": str(e)}), 422
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    # If no header or invalid header
+    return jsonify({"error": g.auth_error}), 403
+
+@sales_bp.route('/checkout', methods=['POST'])
+def checkout():
+    """
+    API endpoint to check out a multi-item cart in one request.
+
+    Requires an Authorization token in the header to identify the user.
+
+    Expects:
+        JSON payload with:
+        - items (list): Objects with ``good_id`` (int) and ``quantity`` (int).
+
+    Returns:
+        Response (JSON): The cart total and purchased items if successful, or
+        an error message otherwise. Either every item is bought or none is.
+    """
+    principal = current_principal()
+    if principal:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or "items" not in data:
+            return jsonify({"error": "Items are required"}), 400
+
+        try:
+            order = SalesService.checkout(customer_id=principal.user_id, lines=data["items"])
+            return jsonify(order), 201
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    # If no header or invalid header
+    return jsonify({"error": g.auth_error}), 403
+
+@sales_bp.route('/reservations', methods=['POST'])
+def reserve_stock():
+    """
+    API endpoint to hold stock for a limited time while the customer checks out.
+
+    Requires an Authorization token in the header to identify the user.
+
+    Expects:
+        JSON payload with:
+        - good_id (int): The ID of the good to hold.
+        - quantity (int): The number of units to hold.
+        - ttl_seconds (int, optional): How long to hold them (default 300, max 900).
+
+    Returns:
+        Response (JSON): The reservation, whose ``id`` can be passed as
+        ``reservation_id`` to ``/sales/purchase``, or an error message.
+    """
+    principal = current_principal()
+    if principal:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not data.get('good_id') or not data.get('quantity'):
+            return jsonify({"error": "Good ID and quantity are required"}), 400
+
+        try:
+            reservation = SalesService.reserve_stock(
+                customer_id=principal.user_id,
+                good_id=data['good_id'],
+                quantity=data['quantity'],
+                ttl_seconds=data.get('ttl_seconds')
+            )
+            return jsonify(reservation), 201
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    # If no header or invalid header
+    return jsonify({"error": g.auth_error}), 403
+
+@sales_bp.route('/reservations/<int:reservation_id>', methods=['DELETE'])
+def release_reservation(reservation_id):
+    """
+    API endpoint to cancel one of the caller's stock reservations.
+
+    Requires an Authorization token in the header to identify the user.
+
+    Args:
+        reservation_id (int): The ID of the reservation.
+
+    Returns:
+        Response (JSON): A success message, or an error message if the caller
+        has no such reservation.
+    """
+    principal = current_principal()
+    if principal:
+        try:
+            SalesService.release_reservation(principal.user_id, reservation_id)
+            return jsonify({"message": "Reservation released"}), 200
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 404
+
+    # If no header or invalid header
+    return jsonify({"error": g.auth_error}), 403
+
+@sales_bp.route('/history/<string:username>', methods=['GET'])
+def get_purchase_history(username):
+    """
+    API endpoint to page through a customer's purchase history, newest first.
+
+    Requires an Authorization token for that customer or for an admin.
+
+    Args:
+        username (str): The customer whose history is read.
+
+    Query Parameters:
+        - limit (int, optional): Page size (default 20, max 100).
+        - cursor (str, optional): The ``next_cursor`` returned with the previous page.
+        - fields (str, optional): Comma-separated fields of each item, e.g. ``good_name,total_price``.
+
+    Returns:
+        Response (JSON): ``items`` for this page and ``next_cursor``, which is
+        null on the last page.
+    """
+    principal = current_principal()
+    if principal:
+        if principal.username != username and not principal.is_admin:
+            return jsonify({"error": "Access forbidden"}), 403
+
+        try:
+            limit = int(request.args.get('limit', SalesService.DEFAULT_HISTORY_PAGE_SIZE))
+            items, next_cursor = SalesService.get_purchase_history(
+                username, limit=limit, cursor=request.args.get('cursor'),
+                fields=parse_fields(request.args.get('fields'), PurchaseHistory.DICT_FIELDS)
+            )
+            return jsonify({"items": items, "next_cursor": next_cursor}), 200
         except ValueError as e:
             return jsonify({"error": str(e)}), 400
 
     # If no header or invalid header
-    return jsonify({"error": "Authorization header missing or malformed"}), 403
+    return jsonify({"error": g.auth_error}), 403
+
+@sales_bp.route('/reports/daily', methods=['GET'])
+def daily_sales_report():
+    """
+    API endpoint to retrieve units and revenue per good per day.
+
+    Requires an admin Authorization token. Reads only the pre-aggregated rollups.
+
+    Query Parameters:
+        - start (str, optional): First day (ISO date), defaults to 30 days before ``end``.
+        - end (str, optional): Last day (ISO date), defaults to today.
+        - good_id (int, optional): Restrict the report to one good.
+
+    Returns:
+        Response (JSON): One row per good and day.
+    """
+    try:
+        InventoryService.require_admin_role(request)
+        start, end = parse_report_range(request.args)
+        rows = SalesReportService.daily_report(start, end, request.args.get('good_id', type=int))
+        return jsonify(rows), 200
+    except UnauthorizedAccess as e:
+        return jsonify({"error": str(e)}), 403
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@sales_bp.route('/reports/goods', methods=['GET'])
+def goods_sales_report():
+    """
+    API endpoint to retrieve the goods with the highest revenue in a date range.
+
+    Requires an admin Authorization token. Reads only the pre-aggregated rollups.
+
+    Query Parameters:
+        - start (str, optional): First day (ISO date).
+        - end (str, optional): Last day (ISO date).
+        - limit (int, optional): Number of goods to return (max 100).
+
+    Returns:
+        Response (JSON): Goods with their units, revenue and order count.
+    """
+    try:
+        InventoryService.require_admin_role(request)
+        start, end = parse_report_range(request.args)
+        limit = min(request.args.get('limit', SalesReportService.MAX_REPORT_LIMIT, type=int),
+                    SalesReportService.MAX_REPORT_LIMIT)
+        return jsonify(SalesReportService.goods_report(start, end, limit)), 200
+    except UnauthorizedAccess as e:
+        return jsonify({"error": str(e)}), 403
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@sales_bp.route('/reports/customers', methods=['GET'])
+@sales_bp.route('/reports/customers/<string:username>', methods=['GET'])
+def customers_sales_report(username=None):
+    """
+    API endpoint to retrieve the top customers by spend, or one customer's daily spend.
+
+    Requires an admin Authorization token. Reads only the pre-aggregated rollups.
+
+    Args:
+        username (str, optional): Return this customer's day-by-day spend.
+
+    Query Parameters:
+        - start (str, optional): First day (ISO date).
+        - end (str, optional): Last day (ISO date).
+        - limit (int, optional): Number of customers to return (max 100).
+
+    Returns:
+        Response (JSON): Customers with their units, spend and order count.
+    """
+    try:
+        InventoryService.require_admin_role(request)
+        start, end = parse_report_range(request.args)
+        limit = min(request.args.get('limit', SalesReportService.MAX_REPORT_LIMIT, type=int),
+                    SalesReportService.MAX_REPORT_LIMIT)
+        return jsonify(SalesReportService.customers_report(start, end, limit, username)), 200
+    except UnauthorizedAccess as e:
+        return jsonify({"error": str(e)}), 403
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@sales_bp.cli.command('backfill-rollups')
+@click.option('--chunk-size', default=SalesReportService.DEFAULT_CHUNK_SIZE, show_default=True,
+              help='Sales folded in per transaction.')
+@click.option('--rebuild', is_flag=True, help='Empty the rollups and start again from the first sale.')
+@click.option('--settle-seconds', default=SalesReportService.DEFAULT_SETTLE_SECONDS, show_default=True,
+              help='Leave sales younger than this for the next refresh.')
+def backfill_rollups(chunk_size, rebuild, settle_seconds):
+    """
+    Roll up the sales history in chunks (``flask sales backfill-rollups``).
+    """
+    def progress(last_sale_id, processed):
+        click.echo(f"Rolled up {processed} sales (up to sale #{last_sale_id})")
+
+    total = SalesReportService.backfill(chunk_size=chunk_size, rebuild=rebuild,
+                                        settle_seconds=settle_seconds, progress=progress)
+    click.echo(f"Done: {total} sales rolled up.")
@@ -1,7 +1,21 @@
+import hashlib
+import json
+import random
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import and_, case, delete, func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
 from database.db_config import db
-from inventory.models import Goods
+from inventory.models import Goods, GoodsStockShard
+from inventory.catalog import bump_catalog_version, get_goods_listing_cache
+from inventory.alerts import sync_low_stock
+from customers.ledger import adjust_balance
 from customers.models import Customer
-from sales.models import Sale, PurchaseHistory
+from sales.models import Sale, PurchaseHistory, IdempotencyRecord, StockReservation
+from utils import LRUCache, decode_cursor, encode_cursor
+
+# Recently seen idempotent responses, kept in front of the idempotency_keys table
+IDEMPOTENCY_CACHE = LRUCache(maxsize=4096)
 
 class SalesService:
     """
@@ -11,21 +25,57 @@ class SalesService:
     - Displaying available goods.
     - Retrieving details of a specific good.
     - Processing a sale by validating customer and stock availability.
+    - Checking out a multi-item cart in a single transaction.
+    - Replaying stored responses for retried idempotent requests.
+    - Holding stock with short-lived reservations.
+    - Paging through a customer's purchase history.
     """
 
+    MAX_CHECKOUT_LINES = 100
+    DEFAULT_RESERVATION_TTL = 300
+    MAX_RESERVATION_TTL = 900
+    DEFAULT_HISTORY_PAGE_SIZE = 20
+    MAX_HISTORY_PAGE_SIZE = 100
+
     @staticmethod
     def display_goods():
         """
         Fetches all available goods with stock greater than zero.
 
+        Goods in a flash sale count as available while any of their shards
+        has stock left.
+
         Returns:
             list: A list of dictionaries containing:
                 - `name` (str): The name of the good.
                 - `price` (float): The price per item of the good.
         """
-        goods = Goods.query.filter(Goods.count_in_stock > 0).all()
+        shard_in_stock = (
+            select(GoodsStockShard.good_id)
+            .where(GoodsStockShard.good_id == Goods.id, GoodsStockShard.count_in_stock > 0)
+            .exists()
+        )
+        goods = db.session.execute(
+            select(Goods.name, Goods.price_per_item)
+            .where(or_(Goods.count_in_stock > 0, shard_in_stock))
+        )
         return [{"name": g.name, "price": g.price_per_item} for g in goods]
 
+    @staticmethod
+    def display_goods_json():
+        """
+        Returns the available goods listing as pre-encoded JSON bytes.
+
+        Served from the app's listing cache
+        (:func:`inventory.catalog.get_goods_listing_cache`), which is
+        invalidated whenever goods change in this process and expires after
+        a short TTL to pick up writes from other processes.
+
+        Returns:
+            bytes: The JSON-encoded result of :meth:`display_goods`.
+        """
+        return get_goods_listing_cache().get_or_build("available", SalesService.display_goods)
+
     @staticmethod
     def get_good_details(good_id):
         """
@@ -35,7 +85,8 @@ class SalesService:
             good_id (int): The ID of the good to retrieve.
 
         Returns:
-            dict: A dictionary containing the details of the good.
+            dict: A dictionary containing the details of the good, including
+            ``available_stock`` (stock not held by live reservations).
 
         Raises:
             ValueError: If the good with the specified ID does not exist.
@@ -43,76 +94,708 @@ class SalesService:
         good = Goods.query.get(good_id)
         if not good:
             raise ValueError("Good not found")
-        return good.to_dict()
+        details = good.to_dict()
+        details["available_stock"] = SalesService.get_available_stock(good_id)
+        return details
 
     @staticmethod
-    def process_sale(customer_id, good_id, quantity):
+    def get_available_stock(good_id):
+        """
+        Returns a good's stock minus the units held by live reservations.
+
+        The held units come from an aggregate over the
+        ``(good_id, expires_at, quantity)`` index, not a table scan. For goods
+        in a flash sale the stock shards are summed instead.
+
+        Args:
+            good_id (int): The ID of the good.
+
+        Returns:
+            int or None: The available units, or None if the good does not exist.
+        """
+        row = db.session.execute(
+            select(Goods.count_in_stock, Goods.stock_shards).where(Goods.id == good_id)
+        ).first()
+        if not row:
+            return None
+        return SalesService._available_stock(good_id, row)
+
+    @staticmethod
+    def get_good_etag(good_id):
+        """
+        Returns the entity tag of a good's sales details without loading the good.
+
+        The details include the available stock, which also moves when
+        reservations are made or lapse and when flash-sale shards are debited,
+        none of which change ``Goods.version``; so the tag combines the
+        version with the available stock.
+
+        Returns:
+            str or None: The ETag, or None if the good does not exist.
+        """
+        row = db.session.execute(
+            select(Goods.version, Goods.count_in_stock, Goods.stock_shards).where(Goods.id == good_id)
+        ).first()
+        if not row:
+            return None
+        return SalesService.good_etag(good_id, row.version, SalesService._available_stock(good_id, row))
+
+    @staticmethod
+    def good_etag(good_id, version, available_stock):
+        """
+        Builds the strong ETag of a good's sales details.
+        """
+        return f"good-{good_id}-v{version}-a{available_stock}"
+
+    @staticmethod
+    def _available_stock(good_id, row):
+        """
+        Computes the available stock from a row with ``count_in_stock`` and ``stock_shards``.
+        """
+        if row.stock_shards:
+            return db.session.execute(
+                select(func.coalesce(func.sum(GoodsStockShard.count_in_stock), 0))
+                .where(GoodsStockShard.good_id == good_id)
+            ).scalar()
+        return row.count_in_stock - db.session.execute(
+            select(SalesService._held_quantity(good_id, datetime.utcnow()))
+        ).scalar()
+
+    @staticmethod
+    def process_sale(customer_id, good_id, quantity, idempotency_key=None, request_hash=None,
+                     reservation_id=None):
         """
         Processes a sale transaction.
 
-        This method validates the customer, checks stock availability, and
-        deducts the customer's wallet balance and the stock quantity if all
-        conditions are met. It also records the sale and updates the purchase
-        history.
+        Stock and wallet balance are debited with guarded conditional
+        UPDATEs (``WHERE count_in_stock >= :q`` and
+        ``WHERE wallet_balance >= :total``) inside a single transaction, so
+        concurrent purchases of the same good can never oversell and no row
+        lock is held while Python code runs. The stock guard also leaves
+        units held by other customers' live reservations untouched. A
+        rowcount of zero means the guard failed and the whole transaction is
+        rolled back. Goods in a flash sale are debited from their stock
+        shards instead. The sale is then recorded and the purchase history
+        updated.
 
         Args:
             customer_id (int): The ID of the customer making the purchase.
             good_id (int): The ID of the good being purchased.
             quantity (int): The quantity of the good to purchase.
+            idempotency_key (str, optional): Client key for this purchase. When
+                given, the response is stored in the same transaction as the
+                sale, so a concurrent retry with the same key replays it
+                instead of charging twice.
+            request_hash (str, optional): Fingerprint of the request body,
+                stored with the key (see :meth:`request_fingerprint`).
+            reservation_id (int, optional): A live reservation of this
+                customer for this good, covering ``quantity``. It is consumed
+                by the sale so the held units can be bought.
 
         Returns:
             dict: A dictionary containing the details of the processed sale.
 
         Raises:
             ValueError: If:
+                - The quantity is not a positive integer.
+                - The reservation is missing, expired or too small.
                 - The customer does not exist.
                 - The good does not exist or has insufficient stock.
                 - The customer's wallet balance is insufficient.
+            IdempotencyConflict: If a concurrent request with the same
+                ``idempotency_key`` but a different ``request_hash`` committed first.
         """
-        # Fetch the customer and good
-        customer = Customer.query.filter_by(id=customer_id).first()
-        good = Goods.query.get(good_id)
+        if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity <= 0:
+            raise ValueError("Quantity must be a positive integer")
+
+        # Only the columns needed to price and label the sale are read;
+        # stock and balance are checked by the guarded UPDATEs below.
+        customer = db.session.execute(
+            select(Customer.username).where(Customer.id == customer_id)
+        ).first()
+        good = db.session.execute(
+            select(Goods.name, Goods.price_per_item, Goods.stock_shards, Goods.reorder_threshold)
+            .where(Goods.id == good_id)
+        ).first()
 
         # Validate customer and good
         if not customer:
             raise ValueError("Customer not found")
-        if not good or good.count_in_stock < quantity:
+        if not good:
             raise ValueError("Good not available or insufficient stock")
 
         # Calculate total price
         total_price = good.price_per_item * quantity
 
-        print(f"Customer Wallet in API: {customer.wallet_balance}, Required: {total_price}")
+        try:
+            # Release the customer's own hold so its units can be bought
+            if reservation_id is not None:
+                SalesService._consume_reservation(customer_id, good_id, quantity, reservation_id)
 
-        # Check wallet balance
-        if customer.wallet_balance < total_price:
-            print(f"Customer Wallet: {customer.wallet_balance}, Required: {total_price}")
-            raise ValueError("Insufficient wallet balance")
+            # Deduct stock only if enough is left at the moment of the UPDATE
+            SalesService._debit_stock(good_id, quantity, good.stock_shards)
+            if good.reorder_threshold is not None:
+                sync_low_stock([good_id])
+
+            # Deduct wallet balance only if it covers the total
+            SalesService._debit_wallet(customer_id, total_price)
+
+            # Record the sale
+            sale_date = datetime.utcnow()
+            sale = Sale(
+                good_id=good_id,
+                customer_username=customer.username,  # Map customer_id to customer.username
+                quantity=quantity,
+                total_price=total_price,
+                sale_date=sale_date
+            )
+            db.session.add(sale)
+
+            # Record the purchase in history, now or after the commit
+            history_rows = [{
+                "customer_username": customer.username,  # Map customer_id to customer.username
+                "good_name": good.name,
+                "total_price": total_price,
+                "purchase_date": sale_date,
+            }]
+            SalesService._record_history(history_rows)
+
+            if idempotency_key:
+                db.session.flush()
+                response = sale.to_dict()
+                db.session.add(IdempotencyRecord(
+                    customer_id=int(customer_id),
+                    idempotency_key=idempotency_key,
+                    request_hash=request_hash or "",
+                    status_code=201,
+                    response_body=json.dumps(response)
+                ))
+
+            # Commit changes to the database
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            # A concurrent request with the same key committed first
+            replay = SalesService.get_idempotent_response(customer_id, idempotency_key) if idempotency_key else None
+            if replay is None:
+                raise
+            if replay[0] != (request_hash or ""):
+                raise IdempotencyConflict()
+            return replay[2]
+        except Exception:
+            db.session.rollback()
+            raise
+
+        bump_catalog_version()
+        SalesService._record_history_after_commit(history_rows)
+
+        if idempotency_key:
+            IDEMPOTENCY_CACHE.set((str(customer_id), idempotency_key), (request_hash or "", 201, response))
+            return response
+
+        # Return sale details
+        return sale.to_dict()
+
+    @staticmethod
+    def request_fingerprint(payload):
+        """
+        Returns a stable SHA-256 digest of a JSON request body.
+
+        Used to detect an ``Idempotency-Key`` being reused for a different request.
+        """
+        canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def get_idempotent_response(customer_id, idempotency_key):
+        """
+        Looks up the stored response for an idempotency key.
+
+        The in-memory LRU is checked first; on a miss the ``idempotency_keys``
+        table is queried and the result cached. ``Goods`` and ``Customer`` are
+        never touched.
+
+        Args:
+            customer_id (int): The ID of the customer who sent the request.
+            idempotency_key (str): The client-chosen key.
+
+        Returns:
+            tuple or None: ``(request_hash, status_code, body)`` if the key was
+            seen before, otherwise None.
+        """
+        cache_key = (str(customer_id), idempotency_key)
+        stored = IDEMPOTENCY_CACHE.get(cache_key)
+        if stored is not None:
+            return stored
+
+        record = IdempotencyRecord.query.filter_by(
+            customer_id=int(customer_id), idempotency_key=idempotency_key
+        ).first()
+        if not record:
+            return None
+
+        stored = (record.request_hash, record.status_code, json.loads(record.response_body))
+        IDEMPOTENCY_CACHE.set(cache_key, stored)
+        return stored
+
+    @staticmethod
+    def purge_idempotency_records(max_age=timedelta(hours=24)):
+        """
+        Deletes stored idempotent responses older than ``max_age``.
+
+        Returns:
+            int: The number of records deleted.
+        """
+        cutoff = datetime.utcnow() - max_age
+        result = db.session.execute(
+            delete(IdempotencyRecord).where(IdempotencyRecord.created_at < cutoff)
+        )
+        db.session.commit()
+        IDEMPOTENCY_CACHE.clear()
+        return result.rowcount
+
+    @staticmethod
+    def checkout(customer_id, lines):
+        """
+        Processes a multi-item cart as a single all-or-nothing transaction.
+
+        Every good is fetched with one ``IN`` query, stock for all goods is
+        debited with one guarded ``UPDATE`` (``CASE`` on the good ID), the
+        wallet is debited once for the cart total, and the ``Sale`` and
+        ``PurchaseHistory`` rows are written with one bulk insert per table.
+        Lines for the same good are merged before debiting.
+
+        Args:
+            customer_id (int): The ID of the customer making the purchase.
+            lines (list): Dictionaries with ``good_id`` (int) and ``quantity`` (int).
+
+        Returns:
+            dict: The customer username, cart total, sale date and one entry
+            per purchased good.
+
+        Raises:
+            ValueError: If:
+                - The cart is empty, too large or has an invalid line.
+                - The customer does not exist.
+                - Any good does not exist or has insufficient stock.
+                - The customer's wallet balance is insufficient.
+        """
+        if not isinstance(lines, list) or not lines:
+            raise ValueError("Cart must contain at least one item")
+        if len(lines) > SalesService.MAX_CHECKOUT_LINES:
+            raise ValueError(f"Cart cannot contain more than {SalesService.MAX_CHECKOUT_LINES} items")
+
+        # Merge repeated goods so each goods row is debited once
+        quantities = {}
+        for line in lines:
+            good_id = line.get("good_id") if isinstance(line, dict) else None
+            quantity = line.get("quantity") if isinstance(line, dict) else None
+            if not isinstance(good_id, int) or not isinstance(quantity, int) or quantity <= 0:
+                raise ValueError("Each item needs an integer good_id and a positive integer quantity")
+            quantities[good_id] = quantities.get(good_id, 0) + quantity
+
+        customer = db.session.execute(
+            select(Customer.username).where(Customer.id == customer_id)
+        ).first()
+        if not customer:
+            raise ValueError("Customer not found")
+
+        goods = {
+            row.id: row
+            for row in db.session.execute(
+                select(Goods.id, Goods.name, Goods.price_per_item, Goods.stock_shards, Goods.reorder_threshold)
+                .where(Goods.id.in_(quantities))
+            )
+        }
+        missing = sorted(set(quantities) - set(goods))
+        if missing:
+            raise ValueError(f"Good not available or insufficient stock: {missing}")
+
+        sale_date = datetime.utcnow()
+        items = [
+            {
+                "good_id": good_id,
+                "name": goods[good_id].name,
+                "quantity": quantity,
+                "total_price": goods[good_id].price_per_item * quantity,
+            }
+            for good_id, quantity in quantities.items()
+        ]
+        total_price = sum(item["total_price"] for item in items)
+
+        try:
+            # One statement debits every regular good; each row is only
+            # touched if its own stock covers its own quantity.
+            regular = {gid: q for gid, q in quantities.items() if not goods[gid].stock_shards}
+            if regular:
+                debit = case(regular, value=Goods.id)
+                held = SalesService._held_quantity(Goods.id, sale_date)
+                stock_result = db.session.execute(
+                    update(Goods)
+                    .where(Goods.id.in_(regular), Goods.count_in_stock - held >= debit)
+                    .values(count_in_stock=Goods.count_in_stock - debit, version=Goods.version + 1)
+                    .execution_options(synchronize_session=False)
+                )
+                if stock_result.rowcount != len(regular):
+                    raise ValueError("Good not available or insufficient stock")
+                sync_low_stock([gid for gid in regular if goods[gid].reorder_threshold is not None])
+
+            # Goods in a flash sale are debited from their stock shards
+            for good_id, quantity in quantities.items():
+                if goods[good_id].stock_shards:
+                    SalesService._debit_stock(good_id, quantity, goods[good_id].stock_shards)
+
+            SalesService._debit_wallet(customer_id, total_price)
 
+            db.session.execute(insert(Sale), [
+                {
+                    "good_id": item["good_id"],
+                    "customer_username": customer.username,
+                    "quantity": item["quantity"],
+                    "total_price": item["total_price"],
+                    "sale_date": sale_date,
+                }
+                for item in items
+            ])
+            history_rows = [
+                {
+                    "customer_username": customer.username,
+                    "good_name": item["name"],
+                    "total_price": item["total_price"],
+                    "purchase_date": sale_date,
+                }
+                for item in items
+            ]
+            SalesService._record_history(history_rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
 
-        # Deduct stock and wallet balance
-        good.count_in_stock -= quantity
-        customer.wallet_balance -= total_price
+        bump_catalog_version()
+        SalesService._record_history_after_commit(history_rows)
 
-        # Record the sale
-        sale = Sale(
-            good_id=good_id,
-            customer_username=customer.username,  # Map customer_id to customer.username
-            quantity=quantity,
-            total_price=total_price
+        return {
+            "customer_username": customer.username,
+            "total_price": total_price,
+            "sale_date": sale_date.isoformat(),
+            "items": items,
+        }
+
+    @staticmethod
+    def get_purchase_history(username, limit=DEFAULT_HISTORY_PAGE_SIZE, cursor=None, fields=None):
+        """
+        Returns one page of a customer's purchase history, newest first.
+
+        Pages are keyed on ``(purchase_date, id)`` rather than an OFFSET, so
+        every page is a range scan of the composite index that starts where
+        the previous page ended and reads at most ``limit + 1`` rows.
+
+        Args:
+            username (str): The customer whose history is read.
+            limit (int): The page size, capped at ``MAX_HISTORY_PAGE_SIZE``.
+            cursor (str, optional): The ``next_cursor`` of the previous page.
+            fields (list, optional): Only these keys of ``PurchaseHistory.DICT_FIELDS``;
+                only their columns (and the cursor's) are selected.
+
+        Returns:
+            tuple: ``(items, next_cursor)``; ``next_cursor`` is None on the last page.
+
+        Raises:
+            ValueError: If the limit or cursor is invalid.
+        """
+        if not isinstance(limit, int) or limit <= 0:
+            raise ValueError("Limit must be a positive integer")
+        limit = min(limit, SalesService.MAX_HISTORY_PAGE_SIZE)
+
+        query = select(PurchaseHistory).where(PurchaseHistory.customer_username == username)
+        if fields:
+            query = query.options(PurchaseHistory.load_fields(fields, always=["purchase_date"]))
+        if cursor:
+            last_date, last_id = SalesService._decode_history_cursor(cursor)
+            query = query.where(or_(
+                PurchaseHistory.purchase_date < last_date,
+                and_(PurchaseHistory.purchase_date == last_date, PurchaseHistory.id < last_id),
+            ))
+        query = query.order_by(PurchaseHistory.purchase_date.desc(), PurchaseHistory.id.desc()).limit(limit + 1)
+
+        rows = db.session.execute(query).scalars().all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = SalesService._encode_history_cursor(rows[-1])
+        return [row.to_dict(fields) for row in rows], next_cursor
+
+    @staticmethod
+    def _encode_history_cursor(row):
+        """
+        Encodes the position after ``row`` as an opaque cursor string.
+        """
+        return encode_cursor([row.purchase_date.isoformat(), row.id])
+
+    @staticmethod
+    def _decode_history_cursor(cursor):
+        """
+        Decodes a cursor made by :meth:`_encode_history_cursor`.
+
+        Raises:
+            ValueError: If the cursor is malformed.
+        """
+        try:
+            last_date, last_id = decode_cursor(cursor)
+            return datetime.fromisoformat(last_date), int(last_id)
+        except (TypeError, ValueError):
+            raise ValueError("Invalid cursor")
+
+    @staticmethod
+    def _debit_stock(good_id, quantity, stock_shards=0):
+        """
+        Deducts ``quantity`` units of a good in the current transaction.
+
+        Regular goods are debited with a guarded UPDATE on
+        ``goods.count_in_stock`` that also keeps units held by live
+        reservations. Goods in a flash sale are debited from a random stock
+        shard; if that shard cannot cover the quantity, what each shard holds
+        is taken in turn until the quantity is met (spill-over). Each take is a
+        guarded UPDATE, so a shard emptied concurrently is simply skipped.
+
+        Raises:
+            ValueError: If the stock cannot cover the quantity. Shards already
+            debited are restored when the caller rolls back.
+        """
+        if not stock_shards:
+            held = SalesService._held_quantity(good_id, datetime.utcnow())
+            result = db.session.execute(
+                update(Goods)
+                .where(Goods.id == good_id, Goods.count_in_stock - held >= quantity)
+                .values(count_in_stock=Goods.count_in_stock - quantity, version=Goods.version + 1)
+            )
+            if result.rowcount != 1:
+                raise ValueError("Good not available or insufficient stock")
+            return
+
+        first = random.randrange(stock_shards)
+        # Most purchases fit in the first shard tried
+        if SalesService._debit_shard(good_id, first, quantity):
+            return
+        remaining = quantity
+        for offset in range(stock_shards):
+            shard_no = (first + offset) % stock_shards
+            available = db.session.execute(
+                select(GoodsStockShard.count_in_stock)
+                .where(GoodsStockShard.good_id == good_id, GoodsStockShard.shard_no == shard_no)
+            ).scalar() or 0
+            take = min(available, remaining)
+            if take > 0 and SalesService._debit_shard(good_id, shard_no, take):
+                remaining -= take
+                if not remaining:
+                    return
+        raise ValueError("Good not available or insufficient stock")
+
+    @staticmethod
+    def _debit_shard(good_id, shard_no, quantity):
+        result = db.session.execute(
+            update(GoodsStockShard)
+            .where(
+                GoodsStockShard.good_id == good_id,
+                GoodsStockShard.shard_no == shard_no,
+                GoodsStockShard.count_in_stock >= quantity,
+            )
+            .values(count_in_stock=GoodsStockShard.count_in_stock - quantity)
+            .execution_options(synchronize_session=False)
         )
-        db.session.add(sale)
+        return result.rowcount == 1
+
+    @staticmethod
+    def reserve_stock(customer_id, good_id, quantity, ttl_seconds=None):
+        """
+        Holds ``quantity`` units of a good for the customer for a limited time.
+
+        The goods row is locked with ``SELECT ... FOR UPDATE`` before the live
+        holds are summed and the hold inserted, so two concurrent reservations
+        (or a reservation and a purchase, whose UPDATE takes the same lock)
+        cannot over-commit the stock.
+
+        Args:
+            customer_id (int): The ID of the customer placing the hold.
+            good_id (int): The ID of the good to hold.
+            quantity (int): The number of units to hold.
+            ttl_seconds (int, optional): Lifetime of the hold, up to
+                :attr:`MAX_RESERVATION_TTL` (default :attr:`DEFAULT_RESERVATION_TTL`).
+
+        Returns:
+            dict: The reservation details.
+
+        Raises:
+            ValueError: If the input is invalid, the good is in a flash sale,
+            or not enough unheld stock is left.
+        """
+        ttl_seconds = SalesService.DEFAULT_RESERVATION_TTL if ttl_seconds is None else ttl_seconds
+        if not isinstance(quantity, int) or quantity <= 0:
+            raise ValueError("Quantity must be a positive integer")
+        if not isinstance(ttl_seconds, int) or not 0 < ttl_seconds <= SalesService.MAX_RESERVATION_TTL:
+            raise ValueError(f"ttl_seconds must be between 1 and {SalesService.MAX_RESERVATION_TTL}")
+
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=ttl_seconds)
+        try:
+            # Serialises concurrent holds on the same good (no-op on SQLite)
+            good = db.session.execute(
+                select(Goods.count_in_stock, Goods.stock_shards).where(Goods.id == good_id).with_for_update()
+            ).first()
+            if good is None or good.stock_shards:
+                raise ValueError("Good not available or insufficient stock")
+            # Summed in its own statement: MySQL refuses an INSERT ... SELECT
+            # that reads the table it inserts into
+            held = db.session.execute(select(SalesService._held_quantity(good_id, now))).scalar()
+            if good.count_in_stock - held < quantity:
+                raise ValueError("Good not available or insufficient stock")
+            result = db.session.execute(
+                insert(StockReservation).values(
+                    good_id=good_id, customer_id=int(customer_id), quantity=quantity,
+                    created_at=now, expires_at=expires_at
+                )
+            )
+            reservation_id = result.inserted_primary_key[0]
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        return {
+            "id": reservation_id,
+            "good_id": good_id,
+            "customer_id": int(customer_id),
+            "quantity": quantity,
+            "created_at": now.isoformat(),
+            "expires_at": expires_at.isoformat(),
+        }
+
+    @staticmethod
+    def release_reservation(customer_id, reservation_id):
+        """
+        Cancels one of the customer's reservations, returning its units to stock.
 
-        # Record the purchase in history
-        history = PurchaseHistory(
-            customer_username=customer.username,  # Map customer_id to customer.username
-            good_name=good.name,
-            total_price=total_price
+        Raises:
+            ValueError: If the customer has no such reservation.
+        """
+        result = db.session.execute(
+            delete(StockReservation).where(
+                StockReservation.id == reservation_id,
+                StockReservation.customer_id == int(customer_id),
+            )
         )
-        db.session.add(history)
+        db.session.commit()
+        if result.rowcount != 1:
+            raise ValueError("Reservation not found")
+
+    @staticmethod
+    def sweep_expired_reservations(now=None):
+        """
+        Deletes every expired reservation with one bulk statement.
+
+        Expired holds are already ignored when computing available stock, so
+        this only reclaims space; it is run periodically by
+        :class:`sales.reservations.ReservationSweeper`.
 
-        # Commit changes to the database
+        Returns:
+            int: The number of reservations removed.
+        """
+        result = db.session.execute(
+            delete(StockReservation).where(StockReservation.expires_at <= (now or datetime.utcnow()))
+        )
         db.session.commit()
+        return result.rowcount
 
-        # Return sale details
-        return sale.to_dict()
+    @staticmethod
+    def _held_quantity(good_id, now):
+        """
+        Returns a scalar subquery summing the live holds on a good.
+
+        ``good_id`` may be a value or the ``Goods.id`` column, in which case
+        the subquery is correlated to the goods row being updated.
+        """
+        return (
+            select(func.coalesce(func.sum(StockReservation.quantity), 0))
+            .where(StockReservation.good_id == good_id, StockReservation.expires_at > now)
+            .scalar_subquery()
+        )
+
+    @staticmethod
+    def _consume_reservation(customer_id, good_id, quantity, reservation_id):
+        """
+        Deletes the customer's live hold for a purchase in the current transaction.
+
+        Raises:
+            ValueError: If the reservation does not exist, has expired, belongs
+            to another customer or good, or holds fewer units than ``quantity``.
+        """
+        result = db.session.execute(
+            delete(StockReservation).where(
+                StockReservation.id == reservation_id,
+                StockReservation.customer_id == int(customer_id),
+                StockReservation.good_id == good_id,
+                StockReservation.quantity >= quantity,
+                StockReservation.expires_at > datetime.utcnow(),
+            )
+        )
+        if result.rowcount != 1:
+            raise ValueError("Reservation not found or expired")
+
+    @staticmethod
+    def _debit_wallet(customer_id, amount):
+        """
+        Deducts ``amount`` from the customer's wallet in the current transaction.
+
+        The balance check and the write cannot race: it is one guarded UPDATE,
+        or a ledger entry written under the wallet snapshot's row lock (see
+        :mod:`customers.ledger`).
+
+        Raises:
+            ValueError: If the wallet balance is insufficient.
+        """
+        if adjust_balance(Customer.id == customer_id, -amount, "sale") is None:
+            raise ValueError("Insufficient wallet balance")
+
+    @staticmethod
+    def _history_writer():
+        """
+        Returns the app's write-behind history writer, or None if it is disabled.
+        """
+        return current_app.extensions.get("purchase_history_writer")
+
+    @staticmethod
+    def _record_history(rows):
+        """
+        Inserts purchase history rows in the current transaction.
+
+        Does nothing when write-behind is enabled; the rows are queued by
+        :meth:`_record_history_after_commit` instead.
+        """
+        if SalesService._history_writer() is None:
+            db.session.execute(insert(PurchaseHistory), rows)
+
+    @staticmethod
+    def _record_history_after_commit(rows):
+        """
+        Hands committed purchase history rows to the write-behind writer.
+
+        If the writer's queue is full the rows are written synchronously in a
+        short follow-up transaction so no history is lost.
+        """
+        writer = SalesService._history_writer()
+        if writer is None or writer.enqueue(rows):
+            return
+        try:
+            db.session.execute(insert(PurchaseHistory), rows)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error writing purchase history: {e}")
+
+
+class IdempotencyConflict(Exception):
+    """Raised when an Idempotency-Key was already used for a different request."""
+
+    def __init__(self):
+        super().__init__("Idempotency-Key was already used for a different request")
@@ -5,7 +5,7 @@ from database.db_config import db
 from customers.models import Customer
 from memory_tests import log_memory
 from profile_tests import profile_test
-from inventory.models import Goods
+from inventory.models import Goods, GoodsStockShard
 
 def generate_unique_customer_username():
     """Generate a random unique username for a customer."""
@@ -156,3 +156,460 @@ def test_process_sale_insufficient_wallet(client):
     assert sale_response.status_code == 400, f"Expected failure but got: {sale_response.json}"
     assert "Insufficient wallet balance" in sale_response.json["error"]
 
+
+def test_process_sale_debits_stock_and_wallet(client):
+    """Test a sale debits stock and wallet and rejects the purchase that would oversell."""
+    from utils import create_token
+
+    customer = Customer(
+        full_name="Test Customer",
+        username=generate_unique_customer_username(),
+        password="password",
+        age=30,
+        wallet_balance=100.0,
+        role="customer"
+    )
+    good = Goods(
+        name=generate_unique_good_name(),
+        category="electronics",
+        price_per_item=10.0,
+        description="Last units.",
+        count_in_stock=3
+    )
+    db.session.add_all([customer, good])
+    db.session.commit()
+    headers = {"Authorization": f"Bearer {create_token(customer.id)}"}
+
+    response = client.post('/sales/purchase', json={"good_id": good.id, "quantity": 3}, headers=headers)
+    assert response.status_code == 201
+
+    # Stock is now exhausted, so the next purchase must be rejected
+    response = client.post('/sales/purchase', json={"good_id": good.id, "quantity": 1}, headers=headers)
+    assert response.status_code == 400
+    assert "Good not available or insufficient stock" in response.json["error"]
+
+    db.session.expire_all()
+    assert db.session.get(Goods, good.id).count_in_stock == 0
+    assert db.session.get(Customer, customer.id).wallet_balance == 70.0
+
+
+def test_process_sale_invalid_quantity(client):
+    """Test a non-positive or non-integer quantity is rejected before touching stock."""
+    response = client.post('/sales/purchase', json={"good_id": 1, "quantity": -2})
+    assert response.status_code == 400
+    assert response.json["error"] == "Quantity must be a positive integer"
+
+    # JSON true is a bool, which Python would otherwise accept as the integer 1
+    response = client.post('/sales/purchase', json={"good_id": 1, "quantity": True})
+    assert response.status_code == 400
+    assert response.json["error"] == "Quantity must be a positive integer"
+
+
+def test_checkout_multi_item_cart(client):
+    """Test a cart with several goods is bought in one request."""
+    from utils import create_token
+    from sales.models import Sale, PurchaseHistory
+
+    customer = Customer(
+        full_name="Test Customer",
+        username=generate_unique_customer_username(),
+        password="password",
+        age=30,
+        wallet_balance=100.0,
+        role="customer"
+    )
+    first = Goods(name=generate_unique_good_name(), category="food", price_per_item=5.0, count_in_stock=10)
+    second = Goods(name=generate_unique_good_name(), category="food", price_per_item=20.0, count_in_stock=2)
+    db.session.add_all([customer, first, second])
+    db.session.commit()
+    headers = {"Authorization": f"Bearer {create_token(customer.id)}"}
+
+    response = client.post('/sales/checkout', json={"items": [
+        {"good_id": first.id, "quantity": 2},
+        {"good_id": second.id, "quantity": 2},
+        {"good_id": first.id, "quantity": 1},
+    ]}, headers=headers)
+    assert response.status_code == 201, response.json
+    assert response.json["total_price"] == 55.0
+    assert {item["good_id"]: item["quantity"] for item in response.json["items"]} == {first.id: 3, second.id: 2}
+
+    db.session.expire_all()
+    assert db.session.get(Goods, first.id).count_in_stock == 7
+    assert db.session.get(Goods, second.id).count_in_stock == 0
+    assert db.session.get(Customer, customer.id).wallet_balance == 45.0
+    assert Sale.query.filter_by(customer_username=customer.username).count() == 2
+    assert PurchaseHistory.query.filter_by(customer_username=customer.username).count() == 2
+
+def test_checkout_is_all_or_nothing(client):
+    """Test one unavailable item rolls back the whole cart."""
+    from utils import create_token
+
+    customer = Customer(
+        full_name="Test Customer",
+        username=generate_unique_customer_username(),
+        password="password",
+        age=30,
+        wallet_balance=100.0,
+        role="customer"
+    )
+    plenty = Goods(name=generate_unique_good_name(), category="food", price_per_item=1.0, count_in_stock=10)
+    scarce = Goods(name=generate_unique_good_name(), category="food", price_per_item=1.0, count_in_stock=1)
+    db.session.add_all([customer, plenty, scarce])
+    db.session.commit()
+
+    response = client.post('/sales/checkout', json={"items": [
+        {"good_id": plenty.id, "quantity": 4},
+        {"good_id": scarce.id, "quantity": 2},
+    ]}, headers={"Authorization": f"Bearer {create_token(customer.id)}"})
+    assert response.status_code == 400
+    assert "insufficient stock" in response.json["error"]
+
+    db.session.expire_all()
+    assert db.session.get(Goods, plenty.id).count_in_stock == 10
+    assert db.session.get(Goods, scarce.id).count_in_stock == 1
+    assert db.session.get(Customer, customer.id).wallet_balance == 100.0
+
+def test_process_sale_idempotency_key_replays_response(client):
+    """Test a retried purchase with the same Idempotency-Key is not charged twice."""
+    from utils import create_token
+    from sales.services import IDEMPOTENCY_CACHE
+
+    customer = Customer(
+        full_name="Test Customer",
+        username=generate_unique_customer_username(),
+        password="password",
+        age=30,
+        wallet_balance=100.0,
+        role="customer"
+    )
+    good = Goods(name=generate_unique_good_name(), category="food", price_per_item=10.0, count_in_stock=5)
+    db.session.add_all([customer, good])
+    db.session.commit()
+    headers = {"Authorization": f"Bearer {create_token(customer.id)}", "Idempotency-Key": "retry-me"}
+    payload = {"good_id": good.id, "quantity": 2}
+
+    first = client.post('/sales/purchase', json=payload, headers=dict(headers))
+    assert first.status_code == 201
+
+    # Replayed from the database once the in-memory cache is cold
+    IDEMPOTENCY_CACHE.clear()
+    retry = client.post('/sales/purchase', json=payload, headers=dict(headers))
+    assert retry.status_code == 201
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json == first.json
+
+    db.session.expire_all()
+    assert db.session.get(Goods, good.id).count_in_stock == 3
+    assert db.session.get(Customer, customer.id).wallet_balance == 80.0
+
+    # The same key cannot be reused for a different purchase
+    reused = client.post('/sales/purchase', json={"good_id": good.id, "quantity": 1}, headers=dict(headers))
+    assert reused.status_code == 422
+
+    # A request that raced past the lookup is checked against the winner's fingerprint too
+    from sales.services import IdempotencyConflict, SalesService
+    IDEMPOTENCY_CACHE.clear()
+    with pytest.raises(IdempotencyConflict):
+        SalesService.process_sale(customer.id, good.id, 1, idempotency_key="retry-me", request_hash="other")
+    stored_hash = SalesService.get_idempotent_response(customer.id, "retry-me")[0]
+    assert SalesService.process_sale(customer.id, good.id, 2, idempotency_key="retry-me",
+                                     request_hash=stored_hash) == first.json
+    db.session.expire_all()
+    assert db.session.get(Goods, good.id).count_in_stock == 3
+
+def test_process_sale_write_behind_history(client):
+    """Test purchase history is written by the background writer when enabled."""
+    from utils import create_token
+    from sales.models import PurchaseHistory
+    from sales.history_writer import init_history_writer
+
+    customer = Customer(
+        full_name="Test Customer",
+        username=generate_unique_customer_username(),
+        password="password",
+        age=30,
+        wallet_balance=100.0,
+        role="customer"
+    )
+    good = Goods(name=generate_unique_good_name(), category="food", price_per_item=10.0, count_in_stock=5)
+    db.session.add_all([customer, good])
+    db.session.commit()
+
+    app = client.application
+    writer = init_history_writer(app, batch_size=100, flush_interval=60)
+    try:
+        response = client.post(
+            '/sales/purchase',
+            json={"good_id": good.id, "quantity": 1},
+            headers={"Authorization": f"Bearer {create_token(customer.id)}"}
+        )
+        assert response.status_code == 201
+        assert writer.stats()["pending"] == 1
+
+        # Stopping drains the queue even though no batch trigger fired
+        writer.stop()
+    finally:
+        app.extensions.pop("purchase_history_writer", None)
+
+    assert writer.stats()["written"] == 1
+    assert PurchaseHistory.query.filter_by(customer_username=customer.username).count() == 1
+
+def test_display_goods_cache_invalidated_by_sale(client):
+    """Test the cached goods listing is rebuilt after a sale sells out a good."""
+    from utils import create_token
+    from inventory.catalog import get_goods_listing_cache
+
+    get_goods_listing_cache().clear()
+    customer = Customer(
+        full_name="Test Customer",
+        username=generate_unique_customer_username(),
+        password="password",
+        age=30,
+        wallet_balance=100.0,
+        role="customer"
+    )
+    good = Goods(name=generate_unique_good_name(), category="food", price_per_item=10.0, count_in_stock=1)
+    db.session.add_all([customer, good])
+    db.session.commit()
+
+    response = client.get('/sales/goods')
+    assert response.status_code == 200
+    assert {"name": good.name, "price": 10.0} in response.json
+    assert client.get('/sales/goods').json == response.json
+    assert get_goods_listing_cache().info()["hits"] == 1
+    # Another app in the same process, e.g. on another database, has its own listing
+    from flask import Flask
+    with Flask(__name__).app_context():
+        assert get_goods_listing_cache().info()["size"] == 0
+
+    client.post(
+        '/sales/purchase',
+        json={"good_id": good.id, "quantity": 1},
+        headers={"Authorization": f"Bearer {create_token(customer.id)}"}
+    )
+    response = client.get('/sales/goods')
+    assert all(item["name"] != good.name for item in response.json)
+
+def test_process_sale_flash_sale_shards(client):
+    """Test purchases during a flash sale debit the stock shards and a sold-out sale is not listed."""
+    from utils import create_token
+    from inventory.services import InventoryService
+    from sales.services import SalesService
+
+    customer = Customer(
+        full_name="Test Customer",
+        username=generate_unique_customer_username(),
+        password="password",
+        age=30,
+        wallet_balance=100.0,
+        role="customer"
+    )
+    good = Goods(name=generate_unique_good_name(), category="food", price_per_item=1.0, count_in_stock=6)
+    db.session.add_all([customer, good])
+    db.session.commit()
+    InventoryService.start_flash_sale(good.id, 3)
+    headers = {"Authorization": f"Bearer {create_token(customer.id)}"}
+    assert {"name": good.name, "price": 1.0} in SalesService.display_goods()
+
+    for _ in range(6):
+        response = client.post('/sales/purchase', json={"good_id": good.id, "quantity": 1}, headers=headers)
+        assert response.status_code == 201
+
+    # Every shard is empty, so spill-over finds nothing left
+    response = client.post('/sales/purchase', json={"good_id": good.id, "quantity": 1}, headers=headers)
+    assert response.status_code == 400
+    assert all(item["name"] != good.name for item in SalesService.display_goods())
+
+    assert InventoryService.end_flash_sale(good.id)["count_in_stock"] == 0
+
+def test_process_sale_flash_sale_spans_shards(client):
+    """Test a purchase larger than any single shard is split across shards."""
+    from utils import create_token
+    from inventory.services import InventoryService
+
+    customer = Customer(
+        full_name="Test Customer",
+        username=generate_unique_customer_username(),
+        password="password",
+        age=30,
+        wallet_balance=100.0,
+        role="customer"
+    )
+    good = Goods(name=generate_unique_good_name(), category="food", price_per_item=1.0, count_in_stock=10)
+    db.session.add_all([customer, good])
+    db.session.commit()
+    InventoryService.start_flash_sale(good.id, 8)
+    assert max(shard.count_in_stock for shard in GoodsStockShard.query.filter_by(good_id=good.id)) < 3
+    headers = {"Authorization": f"Bearer {create_token(customer.id)}"}
+
+    response = client.post('/sales/purchase', json={"good_id": good.id, "quantity": 3}, headers=headers)
+    assert response.status_code == 201
+    response = client.post('/sales/purchase', json={"good_id": good.id, "quantity": 8}, headers=headers)
+    assert response.status_code == 400
+    response = client.post('/sales/purchase', json={"good_id": good.id, "quantity": 7}, headers=headers)
+    assert response.status_code == 201
+
+    assert InventoryService.end_flash_sale(good.id)["count_in_stock"] == 0
+
+def test_reservation_holds_stock_until_purchase(client):
+    """Test reserved units cannot be bought by others but can be by the holder."""
+    from utils import create_token
+    from sales.services import SalesService
+
+    holder = Customer(full_name="Holder", username=generate_unique_customer_username(),
+                      password="password", age=30, wallet_balance=100.0)
+    other = Customer(full_name="Other", username=generate_unique_customer_username(),
+                     password="password", age=30, wallet_balance=100.0)
+    good = Goods(name=generate_unique_good_name(), category="food", price_per_item=1.0, count_in_stock=3)
+    db.session.add_all([holder, other, good])
+    db.session.commit()
+    holder_headers = {"Authorization": f"Bearer {create_token(holder.id)}"}
+    other_headers = {"Authorization": f"Bearer {create_token(other.id)}"}
+
+    response = client.post('/sales/reservations', json={"good_id": good.id, "quantity": 2}, headers=holder_headers)
+    assert response.status_code == 201
+    reservation_id = response.json["id"]
+    assert client.get(f'/sales/goods/{good.id}').json["available_stock"] == 1
+
+    # Only one unit is free for everybody else
+    response = client.post('/sales/purchase', json={"good_id": good.id, "quantity": 2}, headers=other_headers)
+    assert response.status_code == 400
+    response = client.post('/sales/reservations', json={"good_id": good.id, "quantity": 2}, headers=other_headers)
+    assert response.status_code == 400
+
+    response = client.post('/sales/purchase', json={
+        "good_id": good.id, "quantity": 2, "reservation_id": reservation_id
+    }, headers=holder_headers)
+    assert response.status_code == 201
+    assert SalesService.get_available_stock(good.id) == 1
+
+    # The reservation was consumed by the purchase
+    response = client.delete(f'/sales/reservations/{reservation_id}', headers=holder_headers)
+    assert response.status_code == 404
+
+def test_sweep_expired_reservations(client):
+    """Test expired holds stop counting immediately and are removed in bulk."""
+    from datetime import datetime, timedelta
+    from utils import create_token
+    from sales.models import StockReservation
+    from sales.services import SalesService
+
+    customer = Customer(full_name="Holder", username=generate_unique_customer_username(),
+                        password="password", age=30, wallet_balance=100.0)
+    good = Goods(name=generate_unique_good_name(), category="food", price_per_item=1.0, count_in_stock=5)
+    db.session.add_all([customer, good])
+    db.session.commit()
+
+    SalesService.reserve_stock(customer.id, good.id, 4, ttl_seconds=60)
+    assert SalesService.get_available_stock(good.id) == 1
+
+    later = datetime.utcnow() + timedelta(seconds=61)
+    assert SalesService.sweep_expired_reservations(now=later) == 1
+    assert StockReservation.query.count() == 0
+    assert SalesService.get_available_stock(good.id) == 5
+
+def test_sales_rollups_and_reports(client):
+    """Test sales are folded into the rollups incrementally and reported from them."""
+    from datetime import date
+    from utils import create_token
+    from sales.rollups import SalesReportService
+
+    customer = Customer(full_name="Buyer", username=generate_unique_customer_username(),
+                        password="password", age=30, wallet_balance=100.0)
+    good = Goods(name=generate_unique_good_name(), category="food", price_per_item=2.0, count_in_stock=10)
+    db.session.add_all([customer, good])
+    db.session.commit()
+    headers = {"Authorization": f"Bearer {create_token(customer.id)}"}
+
+    client.post('/sales/purchase', json={"good_id": good.id, "quantity": 1}, headers=headers)
+    client.post('/sales/purchase', json={"good_id": good.id, "quantity": 2}, headers=headers)
+    assert SalesReportService.refresh(settle_seconds=0) == 2
+
+    # Only the new sale is folded in on the next refresh
+    client.post('/sales/purchase', json={"good_id": good.id, "quantity": 3}, headers=headers)
+    assert SalesReportService.refresh(settle_seconds=0) == 1
+    assert SalesReportService.refresh(settle_seconds=0) == 0
+
+    today = date.today().isoformat()
+    response = client.get(f'/sales/reports/daily?good_id={good.id}&start={today}', is_admin=True)
+    assert response.status_code == 200
+    assert response.json == [{"good_id": good.id, "day": today, "units": 6, "revenue": 12.0, "orders": 3}]
+
+    response = client.get('/sales/reports/customers', is_admin=True)
+    assert response.json[0]["customer_username"] == customer.username
+    assert response.json[0]["revenue"] == 12.0
+
+    assert client.get('/sales/reports/goods', headers=headers).status_code == 403
+
+    # A rebuild from scratch produces the same totals
+    runner = client.application.test_cli_runner()
+    result = runner.invoke(args=["sales", "backfill-rollups", "--rebuild", "--chunk-size", "2", "--settle-seconds", "0"])
+    assert "Done: 3 sales rolled up." in result.output
+    response = client.get(f'/sales/reports/goods?start={today}', is_admin=True)
+    assert response.json == [{"good_id": good.id, "units": 6, "revenue": 12.0, "orders": 3}]
+
+def test_purchase_history_keyset_pages(client):
+    """Test the purchase history is paged newest first with an opaque cursor."""
+    from datetime import datetime, timedelta
+    from sales.models import PurchaseHistory
+
+    base = datetime(2024, 1, 1)
+    # Two rows share a timestamp so the id tie-breaker is exercised
+    dates = [base + timedelta(minutes=i // 2) for i in range(5)]
+    db.session.add_all([
+        PurchaseHistory(customer_username="customer", good_name=f"good_{i}", total_price=float(i), purchase_date=d)
+        for i, d in enumerate(dates)
+    ])
+    db.session.add(PurchaseHistory(customer_username="admin", good_name="other", total_price=1.0, purchase_date=base))
+    db.session.commit()
+
+    seen = []
+    cursor = None
+    while True:
+        url = '/sales/history/customer?limit=2' + (f'&cursor={cursor}' if cursor else '')
+        response = client.get(url)
+        assert response.status_code == 200
+        assert len(response.json["items"]) <= 2
+        seen.extend(item["good_name"] for item in response.json["items"])
+        cursor = response.json["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == ["good_4", "good_3", "good_2", "good_1", "good_0"]
+
+    assert client.get('/sales/history/customer?cursor=bogus').status_code == 400
+    assert client.get('/sales/history/admin').status_code == 403
+    response = client.get('/sales/history/customer?limit=500', is_admin=True)
+    assert response.status_code == 200
+    assert len(response.json["items"]) == 5
+
+    # Sparse pages still carry a working cursor
+    response = client.get('/sales/history/customer?limit=2&fields=good_name')
+    assert response.json["items"] == [{"good_name": "good_4"}, {"good_name": "good_3"}]
+    response = client.get(f'/sales/history/customer?limit=2&fields=good_name&cursor={response.json["next_cursor"]}')
+    assert [item["good_name"] for item in response.json["items"]] == ["good_2", "good_1"]
+
+def test_good_details_conditional_etag(client):
+    """Test the sales details ETag changes with purchases and reservations."""
+    from utils import create_token
+
+    customer = Customer(full_name="Buyer", username=generate_unique_customer_username(),
+                        password="password", age=30, wallet_balance=100.0)
+    good = Goods(name=generate_unique_good_name(), category="food", price_per_item=1.0, count_in_stock=10)
+    db.session.add_all([customer, good])
+    db.session.commit()
+    headers = {"Authorization": f"Bearer {create_token(customer.id)}"}
+
+    etag = client.get(f'/sales/goods/{good.id}').headers["ETag"]
+    assert client.get(f'/sales/goods/{good.id}', headers={"If-None-Match": etag}).status_code == 304
+
+    # A reservation changes the available stock without touching the good's row
+    client.post('/sales/reservations', json={"good_id": good.id, "quantity": 2}, headers=headers)
+    response = client.get(f'/sales/goods/{good.id}', headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json["available_stock"] == 8
+    etag = response.headers["ETag"]
+
+    client.post('/sales/purchase', json={"good_id": good.id, "quantity": 1}, headers=headers)
+    response = client.get(f'/sales/goods/{good.id}', headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json["version"] == 2
@@ -1,10 +1,20 @@
 import jwt
+import base64
+import binascii
 import datetime  # Use Python's datetime module
-from flask import request, jsonify
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, request, jsonify
+from sqlalchemy.orm import load_only
 
 # Replace this with your actual secret key
 SECRET_KEY = "your_secret_key"
 
+TOKEN_LIFETIME = datetime.timedelta(hours=2)
+
 def extract_auth_token(req):
     """
     Extracts the Authorization token from the request headers.
@@ -19,22 +29,38 @@ def extract_auth_token(req):
     return None
 
 def decode_token(token):
-    try:
-        # print(f"Raw Token: {token}")
-        if token.startswith("Bearer "):
-            token = token.split(" ", 1)[1]
-        print(f"Token after removing Bearer prefix: {token}")
+    payload = decode_token_claims(token)
+    return str(payload["sub"])  # Always return user_id as a string
+
+def decode_token_claims(token):
+    """
+    Verifies a JWT and returns its payload.
+
+    Verified payloads are kept in :data:`TOKEN_CACHE`, keyed by the token's
+    SHA-256 digest, until the token's ``exp``; a client reusing its token
+    skips the signature check on later requests. Tokens without ``exp`` are
+    not cached.
+
+    Raises:
+        jwt.InvalidTokenError: If the token is invalid, expired or has no subject.
+    """
+    if token.startswith("Bearer "):
+        token = token.split(" ", 1)[1]
+    key = hashlib.sha256(token.encode("utf-8")).digest()
+    cached = TOKEN_CACHE.get(key)
+    if cached is not None:
+        payload, expires_at = cached
+        if time.time() < expires_at:
+            return dict(payload)
+        # Expired since it was cached; let jwt report it
+        TOKEN_CACHE.pop(key)
 
-        # Decode the token
+    try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-        print(f"Decoded Token Payload: {payload}")
 
         # Ensure the 'sub' field exists
-        user_id = payload.get("sub")
-        if not user_id:
-            raise ValueError("Invalid token: Subject (sub) not found in token payload")
-
-        return str(user_id)  # Always return user_id as a string
+        if not payload.get("sub"):
+            raise jwt.InvalidTokenError("Subject (sub) not found in token payload")
     except jwt.ExpiredSignatureError:
         print("Token has expired")
         raise
@@ -42,17 +68,36 @@ def decode_token(token):
         print(f"Invalid token: {e}")
         raise
 
-def create_token(user_id):
+    if "exp" in payload:
+        TOKEN_CACHE.set(key, (dict(payload), payload["exp"]))
+    return payload
+
+def token_cache_info():
+    """
+    Returns the hit/miss counters and size of the verified-token cache.
+    """
+    return TOKEN_CACHE.info()
+
+def create_token(user_id, username=None, role=None):
     """
     Creates a JWT token for a given user ID.
+
+    When ``username`` and ``role`` are given they are signed into the token
+    as claims, so requests can be authorized without looking the user up.
+    ``iat`` keeps fractions of a second so a token issued right after a
+    revocation (see :mod:`customers.auth`) is told apart from one before it.
     """
     try:
         # print(f"Creating token for user ID: {user_id}")
+        issued_at = time.time()
         payload = {
             "sub": str(user_id),  # Explicitly cast user_id to a string
-            "iat": datetime.datetime.utcnow(),
-            "exp": datetime.datetime.utcnow() + datetime.timedelta(hours=2)
+            "iat": issued_at,
+            "exp": int(issued_at + TOKEN_LIFETIME.total_seconds())
         }
+        if username is not None and role is not None:
+            payload["username"] = username
+            payload["role"] = role
         # print(f"Payload before encoding: {payload}")
         token = jwt.encode(payload, SECRET_KEY, algorithm="HS256")
         # print(f"Generated Token: {token}")
@@ -89,3 +134,157 @@ def validate_json_payload(req, required_fields):
     except Exception as e:
         print(f"Error validating JSON payload: {e}")  # Debugging statement
         raise
+
+def encode_cursor(values):
+    """
+    Encodes the sort key of the last row of a page as an opaque cursor string.
+
+    Args:
+        values (list): JSON-serializable values, e.g. ``[last_price, last_id]``.
+    """
+    raw = json.dumps(values, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor):
+    """
+    Decodes a cursor made by :func:`encode_cursor`.
+
+    Returns:
+        list: The encoded values.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
+def parse_fields(value, allowed):
+    """
+    Parses a comma-separated ``fields`` query parameter.
+
+    Args:
+        value (str or None): The raw parameter, e.g. ``"id,name,price_per_item"``.
+        allowed (iterable): The field names a response may contain.
+
+    Returns:
+        list or None: The requested fields in order without duplicates, or
+        None if the parameter was not given (every field).
+
+    Raises:
+        ValueError: If no field or an unknown field is named.
+    """
+    if value is None:
+        return None
+    fields = list(dict.fromkeys(field.strip() for field in value.split(",") if field.strip()))
+    if not fields:
+        raise ValueError("fields must name at least one field")
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+def load_only_fields(model, fields, sources=None, always=()):
+    """
+    Builds a loader option that selects only the columns behind some ``to_dict`` keys.
+
+    Args:
+        model: The mapped class.
+        fields (iterable): ``to_dict`` keys to serialize.
+        sources (dict, optional): Keys computed from another column, e.g.
+            ``{"flash_sale": "stock_shards"}``.
+        always (iterable): Extra columns the caller needs, e.g. a cursor's sort key.
+    """
+    sources = sources or {}
+    names = dict.fromkeys([sources.get(field, field) for field in fields] + list(always))
+    return load_only(*(getattr(model, name) for name in names))
+
+def not_modified(etag):
+    """
+    Answers a conditional GET whose ``If-None-Match`` already names ``etag``.
+
+    Args:
+        etag (str): The current entity tag of the resource, unquoted.
+
+    Returns:
+        Response or None: An empty ``304 Not Modified`` response carrying the
+        ETag, or None if the client's copy is missing or out of date.
+    """
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    return response
+
+class LRUCache:
+    """
+    A small thread-safe least-recently-used cache.
+
+    Once ``maxsize`` entries are stored, adding a new key evicts the entry that
+    was used longest ago. Hit and miss counts are kept for monitoring.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Returns the cached value for ``key`` and marks it as recently used.
+        """
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """
+        Stores ``value`` under ``key``, evicting the least recently used entry if full.
+        """
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """
+        Removes ``key`` from the cache and returns its value.
+        """
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        """
+        Removes every entry and resets the counters.
+        """
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        """
+        Returns the hit/miss counters and current size.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._data), "maxsize": self.maxsize}
+
+    def __len__(self):
+        return len(self._data)
+
+
+# Verified token payloads; see decode_token_claims
+TOKEN_CACHE = LRUCache(maxsize=4096)